@@ -3,15 +3,45 @@ PDF 工具箱 - 網頁版
 支援 PDF 壓縮、拆分、合併功能
 """
 
-import streamlit as st
-from PyPDF2 import PdfReader, PdfWriter, PdfMerger
-from PIL import Image
-import io
-import zipfile
 import time
-import base64
-from pathlib import Path
-from typing import List, Tuple
+
+# 本次腳本執行的起點，用來量測首次可互動時間。Streamlit 每次互動都會重新執行整個腳本，
+# 起點必須在腳本內、所有匯入之前記錄（移到獨立模組只會在第一次匯入時記錄一次），
+# 因此以下的匯入刻意放在這行之後，並以 noqa: E402 標示
+RUN_STARTED = time.perf_counter()
+
+import streamlit as st  # noqa: E402
+import base64  # noqa: E402
+import hmac  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import shutil  # noqa: E402
+import threading  # noqa: E402
+from collections import deque  # noqa: E402
+from pathlib import Path  # noqa: E402
+from typing import BinaryIO, List, Optional, Tuple  # noqa: E402
+
+# PDF 引擎（PyPDF2、Pillow）在第一次用到時才載入：這裡只匯入輕量的類別，
+# 其餘以 pdftools.名稱 呼叫，首次開啟頁面不必等待 PDF 函式庫載入
+import pdftools  # noqa: E402
+from pdftools import (  # noqa: E402
+    CachedDocument, CompressCache, CompressCancelled, CompressHistory, DocumentCache, Job, JobScheduler, SessionFile,
+    create_gs_backend, format_size, metrics, spooled_zip, spooled_zip_files,
+)
+from pdftools.config import (  # noqa: E402
+    BATCH_FILE_TIMEOUT, BATCH_MAX_FILES, BATCH_WORKERS, CACHE_DIR, CACHE_DISK_MB, CACHE_MEMORY_MB, DOC_CACHE_MB,
+    GS_TIMEOUT, HISTORY_DB, HISTORY_MAX_SAMPLES, HISTORY_MIN_SAMPLES, MAX_CONCURRENT_JOBS, MEMORY_BUFFER_MB,
+    METRICS_HOST, METRICS_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+# 啟動畫面顯示秒數（不阻擋操作）與首次可互動時間的預算，超過時寫入警告紀錄
+SPLASH_SECONDS = float(os.environ.get("PDF_SPLASH_SECONDS", "1.5"))
+TTI_BUDGET_MS = float(os.environ.get("PDF_TTI_BUDGET_MS", "1500"))
+
+# 管理頁（效能統計）的存取權杖：以 ?admin=權杖 開啟，空白時不提供管理頁
+ADMIN_TOKEN = os.environ.get("PDF_ADMIN_TOKEN", "")
 
 
 # 頁面設定
@@ -23,373 +53,509 @@ st.set_page_config(
 )
 
 
-def get_image_base64(image_path: str) -> str:
-    """將圖片轉換為 base64 編碼"""
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode()
+@st.cache_resource
+def get_splash_background() -> str:
+    """啟動畫面背景的 CSS 值，整個程序只讀取並編碼一次
 
+    啟用 server.enableStaticServing 並把圖片放在 static/splash.png 時，改由靜態檔案服務提供，
+    不必在每個工作階段的頁面中內嵌整張圖片。
+    """
+    if st.get_option("server.enableStaticServing") and Path("static/splash.png").exists():
+        return "url('app/static/splash.png')"
+    for path in (Path("assets/splash.png"), Path("assets/splash.jpg")):
+        if path.exists():
+            mime = "image/png" if path.suffix == ".png" else "image/jpeg"
+            return f"url('data:{mime};base64,{base64.b64encode(path.read_bytes()).decode()}')"
+    return "linear-gradient(135deg, #667eea 0%, #764ba2 100%)"
 
-def show_splash_screen():
-    """顯示啟動畫面"""
-
-    # 檢查圖片是否存在
-    splash_image_path = Path("assets/splash.png")
-    if not splash_image_path.exists():
-        splash_image_path = Path("assets/splash.jpg")
-
-    # 如果圖片存在，使用圖片；否則使用純色背景
-    if splash_image_path.exists():
-        img_base64 = get_image_base64(str(splash_image_path))
-        bg_style = f"background-image: url('data:image/png;base64,{img_base64}'); background-size: cover; background-position: center;"
-    else:
-        # 使用漸層背景作為備用
-        bg_style = "background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);"
 
-    splash_html = f"""
+def show_splash_screen():
+    """顯示啟動畫面：只以 CSS 動畫覆蓋在頁面上並自動淡出，不阻擋下方主畫面的繪製與操作"""
+    st.markdown(f"""
     <style>
-        /* 隱藏 Streamlit 預設元素 */
-        #MainMenu {{visibility: hidden;}}
-        footer {{visibility: hidden;}}
-        header {{visibility: hidden;}}
-        .stApp > header {{display: none;}}
-
         .splash-container {{
             position: fixed;
             top: 0;
             left: 0;
             width: 100vw;
             height: 100vh;
-            {bg_style}
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
+            background: {get_splash_background()};
+            background-size: cover;
+            background-position: center;
+            background-repeat: no-repeat;
             z-index: 9999;
-            animation: fadeOut 0.5s ease-in-out 3.5s forwards;
-        }}
-
-        .splash-content {{
-            text-align: center;
-            color: white;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.5);
-        }}
-
-        .splash-title {{
-            font-size: 3rem;
-            font-weight: bold;
-            margin-bottom: 1rem;
-            font-family: "Microsoft JhengHei", "PingFang TC", sans-serif;
-        }}
-
-        .splash-subtitle {{
-            font-size: 1.2rem;
-            margin-bottom: 2rem;
-            font-family: "Microsoft JhengHei", "PingFang TC", sans-serif;
+            pointer-events: none;
+            animation: fadeOut 0.5s ease-in-out {SPLASH_SECONDS}s forwards;
         }}
-
-        /* 進度條容器 */
-        .progress-container {{
+        .splash-progress-bg {{
             position: absolute;
             bottom: 80px;
+            left: 50%;
+            transform: translateX(-50%);
             width: 60%;
             max-width: 400px;
-            background: rgba(255,255,255,0.3);
+            background: rgba(255,255,255,0.5);
             border-radius: 10px;
+            height: 10px;
             overflow: hidden;
-            height: 8px;
         }}
-
-        /* 進度條動畫 */
-        .progress-bar {{
-            height: 100%;
+        .splash-progress-bar {{
             background: linear-gradient(90deg, #4CAF50, #8BC34A);
+            height: 100%;
             border-radius: 10px;
-            animation: loading 3.5s ease-in-out forwards;
-        }}
-
-        .loading-text {{
-            position: absolute;
-            bottom: 50px;
-            color: #333;
-            font-size: 0.9rem;
-            font-family: "Microsoft JhengHei", "PingFang TC", sans-serif;
+            animation: loading {SPLASH_SECONDS}s ease-out forwards;
         }}
-
         @keyframes loading {{
             0% {{ width: 0%; }}
             100% {{ width: 100%; }}
         }}
-
         @keyframes fadeOut {{
             0% {{ opacity: 1; }}
             100% {{ opacity: 0; visibility: hidden; }}
         }}
     </style>
-
-    <div class="splash-container" id="splash">
-        <div class="progress-container">
-            <div class="progress-bar"></div>
+    <div class="splash-container">
+        <div class="splash-progress-bg">
+            <div class="splash-progress-bar"></div>
         </div>
-        <div class="loading-text">載入中...</div>
     </div>
+    """, unsafe_allow_html=True)
 
-    <script>
-        setTimeout(function() {{
-            document.getElementById('splash').style.display = 'none';
-        }}, 4000);
-    </script>
-    """
 
-    st.markdown(splash_html, unsafe_allow_html=True)
+class StartupMetrics:
+    """記錄每個工作階段首次執行腳本到主畫面繪製完成的時間（首次可互動時間）"""
+
+    def __init__(self, max_samples: int = 500):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=max_samples)
+        self.cold_start_ms = None
+
+    def record(self, milliseconds: float):
+        with self._lock:
+            # 程序啟動後的第一次包含載入模組的時間
+            if self.cold_start_ms is None:
+                self.cold_start_ms = milliseconds
+            self._samples.append(milliseconds)
+        if TTI_BUDGET_MS > 0 and milliseconds > TTI_BUDGET_MS:
+            logger.warning("首次可互動時間 %.0f ms 超過預算 %.0f ms", milliseconds, TTI_BUDGET_MS)
+
+    def stats(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"sessions": 0, "cold_start_ms": self.cold_start_ms, "p50_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        return {
+            "sessions": len(samples),
+            "cold_start_ms": self.cold_start_ms,
+            "p50_ms": samples[len(samples) // 2],
+            "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            "max_ms": samples[-1],
+        }
+
+
+@st.cache_resource
+def get_startup_metrics() -> StartupMetrics:
+    """取得跨工作階段共用的啟動時間統計"""
+    return StartupMetrics()
+
+
+@st.cache_resource
+def get_compress_cache() -> CompressCache:
+    """取得跨工作階段共用的壓縮快取"""
+    return CompressCache(
+        max_memory_bytes=int(CACHE_MEMORY_MB * 1024 * 1024),
+        max_disk_bytes=int(CACHE_DISK_MB * 1024 * 1024),
+        disk_dir=CACHE_DIR,
+        max_memory_entry_bytes=int(MEMORY_BUFFER_MB * 1024 * 1024),
+    )
+
 
+@st.cache_resource
+def get_compress_history() -> Optional[CompressHistory]:
+    """取得跨工作階段共用的壓縮紀錄；未設定 PDF_HISTORY_DB 時不記錄，回傳 None"""
+    return CompressHistory(HISTORY_DB) if HISTORY_DB else None
 
-def format_size(size: int) -> str:
-    """格式化檔案大小"""
-    if size < 1024:
-        return f"{size} B"
-    elif size < 1024 * 1024:
-        return f"{size/1024:.1f} KB"
+
+@st.cache_resource(on_release=lambda backend: backend.close())
+def get_gs_backend():
+    """取得跨工作階段共用的 Ghostscript 執行引擎，gsapi 不可用時退回子程序；清除快取時結束常駐的工作程序"""
+    return create_gs_backend()
+
+
+def spool_upload(uploaded_file) -> SessionFile:
+    """將上傳檔案分段寫入磁碟，避免 getvalue() 再複製一份到記憶體"""
+    with metrics.stage("upload", uploaded_file.size) as record:
+        spooled = SessionFile(suffix=Path(uploaded_file.name).suffix or ".pdf")
+        uploaded_file.seek(0)
+        with open(spooled.path, "wb") as f:
+            shutil.copyfileobj(uploaded_file, f, 1024 * 1024)
+        uploaded_file.seek(0)
+        record["bytes_out"] = uploaded_file.size
+    return spooled
+
+
+def download_data(file: BinaryIO) -> bytes:
+    """將暫存檔讀出為 bytes：st.download_button 不接受 SpooledTemporaryFile，直接傳入會無法下載"""
+    file.seek(0)
+    return file.read()
+
+
+def measured_download(build, kind: str):
+    """包裝點擊下載時才執行的產生函式，將準備下載資料的耗時與大小寫入效能紀錄"""
+    def run():
+        with metrics.stage("download", kind=kind) as record:
+            data = build()
+            record["bytes_out"] = len(data)
+        return data
+    return run
+
+
+def show_linearize_result(stats: dict):
+    """顯示線性化結果：瀏覽器顯示第一頁前需要下載的大小"""
+    if stats["linearized"]:
+        st.caption(f"🌐 已線性化：瀏覽器下載前 {format_size(stats['first_page_bytes'])} 就能顯示第一頁")
     else:
-        return f"{size/(1024*1024):.2f} MB"
+        st.caption("⚠️ 未能線性化（需要 qpdf 或 Ghostscript），已輸出一般檔案")
 
 
-def compress_image(image_data: bytes, quality: int) -> bytes:
-    """壓縮單張圖片"""
+def get_preflight_profile(uploaded_file) -> Optional[dict]:
+    """預檢上傳檔的結構，同一份上傳檔在工作階段中只分析一次；無法解析時回傳 None"""
+    cached = st.session_state.get("preflight")
+    if cached is not None and cached[0] == uploaded_file.file_id:
+        return cached[1]
     try:
-        img = Image.open(io.BytesIO(image_data))
-
-        # 轉換為 RGB（如果是 RGBA 或其他模式）
-        if img.mode in ('RGBA', 'P', 'LA'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' or img.mode == 'LA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-
-        # 根據品質等級縮小圖片尺寸
-        if quality <= 15:
-            # 高壓縮：縮小到 35%
-            new_size = (int(img.width * 0.35), int(img.height * 0.35))
-            if new_size[0] > 50 and new_size[1] > 50:
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-        elif quality <= 50:
-            # 中壓縮：縮小到 60%
-            new_size = (int(img.width * 0.6), int(img.height * 0.6))
-            if new_size[0] > 80 and new_size[1] > 80:
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-
-        # 儲存為 JPEG 並壓縮
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=quality, optimize=True)
-        return output.getvalue()
+        profile = pdftools.build_cost_profile(uploaded_file)
     except Exception:
-        return image_data
-
-
-def compress_pdf(input_bytes: bytes, quality: str, target_size_mb: float = 0) -> Tuple[bytes, dict]:
-    """使用 Ghostscript 壓縮 PDF 檔案"""
-    import subprocess
-    import tempfile
-    import os
-
-    original_size = len(input_bytes)
-
-    # Ghostscript 壓縮設定（更激進的參數）
-    quality_settings = {
-        "low": {
-            "pdfsettings": "/prepress",
-            "dpi": 300,
-            "image_quality": 95
-        },
-        "medium": {
-            "pdfsettings": "/ebook",
-            "dpi": 150,
-            "image_quality": 75
-        },
-        "high": {
-            "pdfsettings": "/screen",
-            "dpi": 72,
-            "image_quality": 40
-        },
-        "extreme": {
-            "pdfsettings": "/screen",
-            "dpi": 50,
-            "image_quality": 20
-        }
-    }
-    settings = quality_settings.get(quality, quality_settings["medium"])
-
-    def run_gs_compress(dpi: int, img_quality: int) -> bytes:
-        """執行 Ghostscript 壓縮"""
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as input_file:
-            input_file.write(input_bytes)
-            input_path = input_file.name
-
-        output_path = input_path.replace('.pdf', '_compressed.pdf')
-
-        gs_command = [
-            'gs',
-            '-sDEVICE=pdfwrite',
-            '-dCompatibilityLevel=1.4',
-            f'-dPDFSETTINGS={settings["pdfsettings"]}',
-            '-dNOPAUSE',
-            '-dQUIET',
-            '-dBATCH',
-            '-dDetectDuplicateImages=true',
-            '-dCompressFonts=true',
-            '-dSubsetFonts=true',
-            f'-dColorImageResolution={dpi}',
-            f'-dGrayImageResolution={dpi}',
-            f'-dMonoImageResolution={dpi}',
-            '-dColorImageDownsampleType=/Bicubic',
-            '-dGrayImageDownsampleType=/Bicubic',
-            '-dMonoImageDownsampleType=/Bicubic',
-            '-dDownsampleColorImages=true',
-            '-dDownsampleGrayImages=true',
-            '-dDownsampleMonoImages=true',
-            f'-dJPEGQ={img_quality}',
-            f'-sOutputFile={output_path}',
-            input_path
-        ]
+        profile = None
+    finally:
+        uploaded_file.seek(0)
+    st.session_state.preflight = (uploaded_file.file_id, profile)
+    return profile
 
-        try:
-            result = subprocess.run(gs_command, capture_output=True, timeout=180)
-            if result.returncode == 0 and os.path.exists(output_path):
-                with open(output_path, 'rb') as f:
-                    compressed = f.read()
-            else:
-                compressed = input_bytes
-        except Exception:
-            compressed = input_bytes
-        finally:
-            if os.path.exists(input_path):
-                os.remove(input_path)
-            if os.path.exists(output_path):
-                os.remove(output_path)
 
-        return compressed
+@st.cache_resource
+def get_job_scheduler() -> JobScheduler:
+    """取得跨工作階段共用的工作排程器"""
+    return JobScheduler(MAX_CONCURRENT_JOBS)
 
-    try:
-        # 如果設定了目標大小，嘗試不同的 DPI 找到最佳壓縮
-        if target_size_mb > 0:
-            target_bytes = int(target_size_mb * 1024 * 1024)
-
-            # 快速嘗試幾個關鍵的 DPI 值
-            test_params = [
-                (72, 50),   # 先試標準壓縮
-                (50, 30),   # 再試更高壓縮
-                (36, 20),   # 最後試極限壓縮
-            ]
-
-            best_result = input_bytes
-            for dpi, img_q in test_params:
-                compressed = run_gs_compress(dpi, img_q)
-                if len(compressed) < len(best_result):
-                    best_result = compressed
-                if len(best_result) <= target_bytes:
-                    break
-
-            compressed_bytes = best_result
-        else:
-            # 使用預設設定壓縮
-            compressed_bytes = run_gs_compress(settings["dpi"], settings["image_quality"])
 
-        compressed_size = len(compressed_bytes)
+def format_progress(job: Job) -> Tuple[float, str]:
+    """依頁數進度計算進度比例與說明文字（頁數、每秒頁數、剩餘時間）"""
+    done, total = job.pages_done, job.pages_total
+    elapsed = job.run_time
+    if total <= 0:
+        return 0.0, f"⚙️ 處理中…已執行 {elapsed:.0f} 秒"
+    done = min(done, total)
+    rate = done / elapsed if elapsed > 0 else 0.0
+    text = f"⚙️ 第 {done} / {total} 頁・每秒 {rate:.1f} 頁"
+    if rate > 0:
+        text += f"・剩餘約 {(total - done) / rate:.0f} 秒"
+    return done / total, text
 
-        # 如果壓縮後變大，返回原始檔案
-        if compressed_size >= original_size:
-            compressed_bytes = input_bytes
-            compressed_size = original_size
 
-    except Exception:
-        compressed_bytes = input_bytes
-        compressed_size = original_size
+def run_job(job: Job, status, cancel_label: str = "取消") -> object:
+    """在前端等待排程工作完成，顯示排隊狀態與進度並提供取消按鈕
 
-    reduction = ((original_size - compressed_size) / original_size) * 100 if original_size > 0 else 0
+    使用者按下取消、重新操作或離線時 Streamlit 會中斷腳本，此時取消工作。
+    """
+    scheduler = get_job_scheduler()
+    cancel_slot = st.empty()
+    cancel_slot.button(
+        cancel_label, key=f"cancel_job_{id(job)}",
+        on_click=lambda: st.session_state.update(job_cancelled=True)
+    )
+    try:
+        while not job.finished.wait(0.5):
+            position = scheduler.position(job)
+            if position > 0:
+                eta = scheduler.estimated_wait(job)
+                status.info(f"⏳ 排隊中：前方還有 {position - 1} 個工作，預估等待約 {eta:.0f} 秒")
+            else:
+                fraction, text = format_progress(job)
+                status.progress(fraction, text=text)
+    finally:
+        if not job.finished.is_set():
+            scheduler.cancel(job)
+    status.empty()
+    cancel_slot.empty()
+    return job.result()
+
+
+def batch_output_name(filename: str, used: set) -> str:
+    """批次壓縮結果在 ZIP 內的檔名，同名檔案加上編號"""
+    stem = filename.rsplit(".", 1)[0]
+    name = f"{stem}_compressed.pdf"
+    count = 2
+    while name in used:
+        name = f"{stem}_compressed ({count}).pdf"
+        count += 1
+    used.add(name)
+    return name
+
+
+def run_compress_batch(uploaded_files, quality: str, target_size_mb: float, engine: str, table, status,
+                       linearize: bool = False) -> Tuple[List[dict], BinaryIO]:
+    """批次壓縮多個上傳檔，完成一個就寫入 ZIP 一個，並即時更新狀態表
+
+    每個工作階段最多同時送出 BATCH_WORKERS 個工作到共用排程器，其餘留在本地等待，
+    避免一次上傳大量檔案時佔滿全伺服器的佇列。單一檔案失敗、逾時或超過
+    BATCH_FILE_TIMEOUT 只會標記在狀態表，不影響其他檔案。
+    回傳 (各檔案統計, 已倒回開頭的 ZIP)。
+    """
+    scheduler = get_job_scheduler()
+    rows = [
+        {"檔案": f.name, "狀態": "⏳ 等待中", "原始大小": format_size(f.size), "壓縮後": "", "減少": "", "耗時": ""}
+        for f in uploaded_files
+    ]
+    results = [None] * len(uploaded_files)
+    pending = list(range(len(uploaded_files)))
+    running = {}
+    timed_out = set()
+    used_names = set()
+
+    def show():
+        done = sum(1 for result in results if result is not None)
+        status.progress(done / len(rows), text=f"⚙️ 已完成 {done} / {len(rows)} 個檔案")
+        table.dataframe(rows, hide_index=True)
+
+    def finished_outputs():
+        try:
+            while pending or running:
+                while pending and len(running) < max(1, BATCH_WORKERS):
+                    index = pending.pop(0)
+                    input_file = spool_upload(uploaded_files[index])
+                    output_file = SessionFile()
+                    job = scheduler.submit(
+                        pdftools.compress_pdf_file, input_file.path, output_file.path, quality, target_size_mb,
+                        cache=get_compress_cache(), backend=get_gs_backend(), engine=engine,
+                        history=get_compress_history(), linearize=linearize
+                    )
+                    running[index] = (job, input_file, output_file)
+
+                for index, (job, input_file, output_file) in list(running.items()):
+                    row = rows[index]
+                    if not job.finished.is_set():
+                        position = scheduler.position(job)
+                        if position > 0:
+                            row["狀態"] = f"⏳ 排隊中（第 {position} 位）"
+                        else:
+                            if BATCH_FILE_TIMEOUT > 0 and job.run_time > BATCH_FILE_TIMEOUT:
+                                timed_out.add(index)
+                                scheduler.cancel(job)
+                            fraction, _ = format_progress(job)
+                            row["狀態"] = f"⚙️ 處理中 {fraction * 100:.0f}%"
+                        continue
+
+                    del running[index]
+                    input_file.close()
+                    row["耗時"] = f"{job.run_time:.1f} 秒"
+                    try:
+                        stats = job.result()
+                    except CompressCancelled:
+                        stats = {"outcome": "timeout" if index in timed_out else "cancelled"}
+                    except Exception as e:
+                        stats = {"outcome": "failed", "error": str(e)}
+                    results[index] = stats
+
+                    if stats["outcome"] == "success":
+                        if stats["cache_hit"]:
+                            row["狀態"] = "✅ 完成（快取）"
+                        elif stats["fallback"] and stats["gs_timed_out"]:
+                            row["狀態"] = "✅ 完成（Ghostscript 逾時，改用圖片壓縮）"
+                        else:
+                            row["狀態"] = "✅ 完成"
+                        row["壓縮後"] = format_size(stats["compressed_size"])
+                        row["減少"] = f"{stats['reduction']:.1f}%"
+                        try:
+                            yield batch_output_name(uploaded_files[index].name, used_names), output_file.path
+                        finally:
+                            output_file.close()
+                    else:
+                        output_file.close()
+                        row["狀態"] = {
+                            "timeout": "⏱️ 逾時",
+                            "cancelled": "已取消",
+                        }.get(stats["outcome"], "❌ 失敗" + (f"：{stats['error']}" if stats.get("error") else ""))
+                    show()
+
+                if running:
+                    show()
+                    next(iter(running.values()))[0].finished.wait(0.5)
+        finally:
+            # 使用者取消、重新操作或離線時中止尚未完成的工作
+            for job, input_file, output_file in running.values():
+                scheduler.cancel(job)
+                input_file.close()
+                output_file.close()
 
-    stats = {
-        "original_size": original_size,
-        "compressed_size": compressed_size,
-        "reduction": reduction
-    }
+    show()
+    archive = spooled_zip_files(finished_outputs())
+    status.empty()
+    return results, archive
 
-    return compressed_bytes, stats
 
+def open_document(uploaded_file) -> CachedDocument:
+    """將上傳檔寫到磁碟並解析，供文件快取未命中時載入"""
+    return CachedDocument(spool_upload(uploaded_file))
 
-def split_pdf(input_bytes: bytes, mode: str, page_range: str = "") -> List[Tuple[str, bytes]]:
-    """拆分 PDF 檔案"""
-    reader = PdfReader(io.BytesIO(input_bytes))
-    total_pages = len(reader.pages)
-    results = []
 
-    if mode == "all":
-        pages_to_split = list(range(total_pages))
-    else:
-        pages_to_split = parse_page_range(page_range, total_pages)
+def hold_document(cache: DocumentCache, uploaded_file):
+    """在 with 區塊內取得上傳檔的已解析文件（同一份上傳檔只解析一次）"""
+    return cache.hold(uploaded_file.file_id, lambda: open_document(uploaded_file))
 
-    for page_idx in pages_to_split:
-        writer = PdfWriter()
-        writer.add_page(reader.pages[page_idx])
 
-        output = io.BytesIO()
-        writer.write(output)
+@st.cache_resource
+def get_document_cache() -> DocumentCache:
+    """取得跨工作階段共用的已解析文件快取"""
+    return DocumentCache(int(DOC_CACHE_MB * 1024 * 1024))
 
-        filename = f"page_{page_idx + 1}.pdf"
-        results.append((filename, output.getvalue()))
 
-    return results
+def deferred_split_part(cache: DocumentCache, uploaded_file, page_indices: range):
+    """回傳點擊下載時才產生單一拆分結果的函式
 
+    點擊時才向文件快取取得文件：文件可能已被其他工作階段的上傳擠出快取而關閉，此時會重新解析。
+    """
+    def build() -> bytes:
+        with hold_document(cache, uploaded_file) as doc, doc.lock:
+            return pdftools.build_split_part(doc.reader, page_indices)
+    return measured_download(build, "split_part")
 
-def parse_page_range(range_str: str, total_pages: int) -> List[int]:
-    """解析頁數範圍字串"""
-    pages = set()
-    parts = range_str.replace(" ", "").split(",")
 
-    for part in parts:
-        if "-" in part:
-            try:
-                start, end = part.split("-")
-                start = int(start)
-                end = int(end)
-                for i in range(start, end + 1):
-                    if 1 <= i <= total_pages:
-                        pages.add(i - 1)
-            except ValueError:
-                continue
-        else:
-            try:
-                page = int(part)
-                if 1 <= page <= total_pages:
-                    pages.add(page - 1)
-            except ValueError:
-                continue
+def deferred_split_zip(cache: DocumentCache, uploaded_file, parts: List[Tuple[str, range]]):
+    """回傳點擊下載時才逐頁產生並串流打包 ZIP 的函式（文件同樣在點擊時才取得）"""
+    def build() -> bytes:
+        with hold_document(cache, uploaded_file) as doc, doc.lock:
+            with spooled_zip(pdftools.iter_split_parts(doc.reader, parts)) as archive:
+                return download_data(archive)
+    return measured_download(build, "split_zip")
 
-    return sorted(list(pages))
 
+@st.cache_resource
+def get_metrics_log():
+    """設定 PDF_METRICS_LOG 時，將各階段的 JSON 紀錄寫到標準錯誤或檔案（每個程序一次）"""
+    return metrics.configure_log()
 
-def merge_pdfs(files: List[bytes]) -> bytes:
-    """合併多個 PDF 檔案"""
-    merger = PdfMerger()
 
-    for pdf_bytes in files:
-        merger.append(io.BytesIO(pdf_bytes))
+@st.cache_resource
+def get_metrics_server():
+    """設定 PDF_METRICS_PORT 時，於背景提供 Prometheus 文字格式的 /metrics 端點（每個程序一個）"""
+    if METRICS_PORT <= 0:
+        return None
+    try:
+        return metrics.serve_metrics(METRICS_PORT, METRICS_HOST)
+    except OSError:
+        logger.warning("無法在 %s:%d 提供效能統計端點", METRICS_HOST, METRICS_PORT, exc_info=True)
+        return None
 
-    output = io.BytesIO()
-    merger.write(output)
-    merger.close()
 
-    return output.getvalue()
+def is_admin() -> bool:
+    """網址帶有正確的 ?admin= 權杖時才顯示管理頁"""
+    token = st.query_params.get("admin", "")
+    return bool(ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
 
 
-def create_zip(files: List[Tuple[str, bytes]]) -> bytes:
-    """將多個檔案打包成 ZIP"""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for filename, content in files:
-            zip_file.writestr(filename, content)
-    return zip_buffer.getvalue()
+def admin_page():
+    """管理頁：各處理階段的耗時百分位數、執行結果、資源用量與 Prometheus 格式輸出"""
+    st.markdown("### 📈 效能統計")
+    stages = metrics.registry.stats()
+    if not stages:
+        st.info("目前還沒有任何處理紀錄。")
+    else:
+        st.dataframe([
+            {
+                "階段": name,
+                "次數": entry["count"],
+                "p50 (秒)": round(entry["p50_s"], 3),
+                "p95 (秒)": round(entry["p95_s"], 3),
+                "p99 (秒)": round(entry["p99_s"], 3),
+                "最長 (秒)": round(entry["max_s"], 3),
+                "輸入": format_size(entry["bytes_in"]),
+                "輸出": format_size(entry["bytes_out"]),
+                "CPU (秒)": round(entry["cpu_s"], 2),
+                "Ghostscript CPU (秒)": round(entry["child_cpu_s"], 2),
+                "Ghostscript 最高記憶體": format_size(entry["child_max_rss_kb"] * 1024),
+            }
+            for name, entry in sorted(stages.items())
+        ], hide_index=True)
+        st.markdown("**執行結果**")
+        st.dataframe([
+            {"階段": name, "結果": outcome, "次數": count}
+            for name, entry in sorted(stages.items()) for outcome, count in sorted(entry["outcomes"].items())
+        ], hide_index=True)
+        st.caption(f"百分位數以每個階段最近 {metrics.registry.window} 筆計算；"
+                   f"本程序目前記憶體 {format_size(metrics.process_rss_kb() * 1024)}")
+
+    with st.expander("⚙️ 工作排程狀態"):
+        job_stats = get_job_scheduler().stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("排隊中", job_stats["queue_depth"])
+            st.caption(f"執行中 {job_stats['running']} / 上限 {job_stats['max_concurrent']}")
+        with col2:
+            st.metric("平均等待", f"{job_stats['avg_wait']:.1f} 秒")
+            st.caption(f"最長 {job_stats['max_wait']:.1f} 秒")
+        with col3:
+            st.metric("平均執行", f"{job_stats['avg_run']:.1f} 秒")
+            st.caption(f"完成 {job_stats['completed']}・失敗 {job_stats['failed']}・取消 {job_stats['cancelled']}")
+
+    with st.expander("⚙️ 壓縮快取狀態"):
+        cache_stats = get_compress_cache().stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("命中率", f"{cache_stats['hit_rate'] * 100:.1f}%")
+            st.caption(f"命中 {cache_stats['hits']}（記憶體 {cache_stats['memory_hits']} / 磁碟 {cache_stats['disk_hits']}）・未命中 {cache_stats['misses']}")
+        with col2:
+            st.metric("記憶體用量", format_size(cache_stats["memory_bytes"]))
+            st.caption(f"{cache_stats['memory_entries']} 筆・淘汰 {cache_stats['memory_evictions']} 次")
+        with col3:
+            st.metric("磁碟用量", format_size(cache_stats["disk_bytes"]))
+            st.caption(f"{cache_stats['disk_entries']} 筆・淘汰 {cache_stats['disk_evictions']} 次")
+
+    with st.expander("⚙️ 目標大小參數學習"):
+        history = get_compress_history()
+        if history is None:
+            st.caption("未啟用：設定 PDF_HISTORY_DB 後才記錄壓縮結果並預測參數")
+        else:
+            history_stats = history.stats()
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("首次即達標", f"{history_stats['hit_rate'] * 100:.1f}%")
+                st.caption(f"最終達標 {history_stats['met_rate'] * 100:.1f}%")
+            with col2:
+                st.metric("平均執行次數", f"{history_stats['avg_passes']:.2f}")
+                st.caption(f"目標大小請求 {history_stats['requests']} 次・使用預測 {history_stats['learned']} 次")
+            with col3:
+                st.metric("紀錄筆數", history_stats["samples"])
+                if history_stats["model_ready"]:
+                    st.caption("已依紀錄預測參數")
+                else:
+                    st.caption(f"累積 {HISTORY_MIN_SAMPLES} 筆後啟用預測")
+
+    with st.expander("⚙️ Ghostscript 引擎"):
+        backend = get_gs_backend()
+        st.markdown(f"目前使用：**{backend.name}**")
+        startup_times = list(getattr(backend, "startup_times", []))
+        if startup_times:
+            st.caption(f"gsapi 實例初始化平均 {sum(startup_times) / len(startup_times) * 1000:.0f} ms"
+                       f"（{len(startup_times)} 次）")
+
+    with st.expander("⚙️ 首次可互動時間"):
+        startup_stats = get_startup_metrics().stats()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("中位數", f"{startup_stats['p50_ms']:.0f} ms")
+            st.caption(f"共 {startup_stats['sessions']} 個工作階段")
+        with col2:
+            st.metric("P95", f"{startup_stats['p95_ms']:.0f} ms")
+            st.caption(f"最長 {startup_stats['max_ms']:.0f} ms・預算 {TTI_BUDGET_MS:.0f} ms")
+        with col3:
+            cold_start = startup_stats["cold_start_ms"]
+            st.metric("冷啟動", f"{cold_start:.0f} ms" if cold_start is not None else "—")
+            st.caption("伺服器啟動後的第一個工作階段")
+
+    with st.expander("Prometheus 格式"):
+        st.code(metrics.registry.prometheus(), language="text")
+    st.button("重新整理", key="admin_refresh")
 
 
 def main_app():
@@ -450,11 +616,14 @@ def main_app():
         st.markdown("### 壓縮 PDF 檔案")
         st.markdown("上傳 PDF 檔案，減少檔案大小以便分享或儲存。使用 Ghostscript 專業壓縮引擎。")
 
-        uploaded_file = st.file_uploader(
-            "選擇要壓縮的 PDF 檔案",
+        uploaded_files = st.file_uploader(
+            "選擇要壓縮的 PDF 檔案（可一次選擇多個）",
             type=["pdf"],
+            accept_multiple_files=True,
             key="compress_uploader"
         )
+        # 只有一個檔案時顯示預檢與詳細結果，多個檔案改用批次壓縮
+        uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
 
         quality = st.radio(
             "選擇壓縮程度：",
@@ -469,6 +638,18 @@ def main_app():
             key="compress_quality"
         )
 
+        engine = st.radio(
+            "壓縮引擎：",
+            options=["ghostscript", "image", "scan", "lossless"],
+            format_func=lambda x: {
+                "ghostscript": "Ghostscript（重新產生整份文件，壓縮率最高）",
+                "image": "圖片重新壓縮（只處理圖片，適合照片多的文件，速度較快）",
+                "scan": "掃描檔模式（黑白頁面存成黑白、灰階頁面存成灰階，適合手機掃描的講義與考卷）",
+                "lossless": "無損最佳化（不重新取樣，適合純文字文件）"
+            }[x],
+            key="compress_engine"
+        )
+
         # 目標大小選項
         use_target_size = st.checkbox("設定目標檔案大小", key="use_target_size")
         target_size_mb = 0.0
@@ -483,37 +664,199 @@ def main_app():
             )
             st.info(f"💡 將自動嘗試不同參數，找到最接近 {target_size_mb} MB 的壓縮結果（處理時間較長）")
 
+        linearize = st.checkbox(
+            "快速網頁檢視（線性化）",
+            help="重新排列檔案內容，放上學習平台或網站後，瀏覽器下載到第一頁所需的部分就能開始顯示，不必等整份下載完",
+            key="compress_linearize"
+        )
+
+
+        if st.session_state.pop("job_cancelled", False):
+            st.warning("已取消壓縮")
 
         if uploaded_file is not None:
             st.markdown(f"**已上傳：** {uploaded_file.name} ({format_size(uploaded_file.size)})")
 
+            profile = get_preflight_profile(uploaded_file)
+            if profile is not None:
+                predictions = pdftools.predict_quality_sizes(profile)
+                if engine == "ghostscript":
+                    if pdftools.is_text_dominated(profile):
+                        st.caption("📊 此文件以文字為主，將先以無損最佳化處理，重新取樣幾乎沒有效果。")
+                    else:
+                        predicted = predictions[quality]
+                        st.caption(
+                            f"📊 預估壓縮後約 {format_size(predicted)}"
+                            f"（減少約 {(1 - predicted / profile['file_size']) * 100:.0f}%，依檔案結構估算）"
+                        )
+                        if use_target_size:
+                            smallest = pdftools.predict_compressed_size(profile, 36, 20)
+                            if smallest > target_size_mb * 1024 * 1024:
+                                st.caption(f"⚠️ 預估最小只能壓到約 {format_size(smallest)}，可能無法達到目標大小。")
+
+                with st.expander("📊 檔案結構分析"):
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.metric("圖片", format_size(profile["image_bytes"]))
+                    with col2:
+                        st.metric("字型", format_size(profile["font_bytes"]))
+                    with col3:
+                        st.metric("頁面內容", format_size(profile["content_bytes"]))
+                    with col4:
+                        st.metric("其他結構", format_size(profile["other_bytes"]))
+
+                    images = profile["images"]
+                    if images:
+                        dpis = sorted(image["dpi"] for image in images)
+                        filters = {}
+                        for image in images:
+                            filters[image["filter"]] = filters.get(image["filter"], 0) + 1
+                        largest = max(images, key=lambda image: image["width"] * image["height"])
+                        st.caption(
+                            f"{profile['pages']} 頁・{len(images)} 張圖片・"
+                            f"有效解析度 {dpis[0]:.0f}～{dpis[-1]:.0f} DPI（中位數 {dpis[len(dpis) // 2]:.0f}）・"
+                            f"最大 {largest['width']}×{largest['height']} 像素"
+                        )
+                        st.caption("編碼方式：" + "、".join(f"{name} × {count}" for name, count in sorted(filters.items())))
+                    else:
+                        st.caption(f"{profile['pages']} 頁・沒有圖片")
+
+                    st.caption("各壓縮程度的預估大小：" + "・".join(
+                        f"{label} {format_size(predictions[key])}"
+                        for key, label in [("low", "低度"), ("medium", "中度"), ("high", "高度"), ("extreme", "極限")]
+                    ))
+
             if st.button("開始壓縮", key="compress_btn", type="primary"):
                 with st.spinner("正在壓縮中，請稍候...（大型檔案可能需要 1-2 分鐘）"):
                     try:
-                        compressed_bytes, stats = compress_pdf(uploaded_file.getvalue(), quality, target_size_mb)
+                        # 上傳檔與壓縮結果都放在磁碟，以路徑交給 Ghostscript
+                        input_file = spool_upload(uploaded_file)
+                        output_file = SessionFile()
+                        try:
+                            job = get_job_scheduler().submit(
+                                pdftools.compress_pdf_file, input_file.path, output_file.path, quality, target_size_mb,
+                                cache=get_compress_cache(), backend=get_gs_backend(), engine=engine,
+                                history=get_compress_history(), linearize=linearize,
+                                profile=get_preflight_profile(uploaded_file)
+                            )
+                            stats = run_job(job, st.empty(), "取消壓縮")
+                        finally:
+                            input_file.close()
+
+                        if stats["outcome"] == "timeout":
+                            st.error(f"壓縮逾時（超過 {GS_TIMEOUT} 秒），未能產生壓縮檔。請改用較低的壓縮程度或拆分後再試。")
+                        elif stats["outcome"] == "failed":
+                            if stats["engine"] in ("image", "scan"):
+                                st.error("圖片重新壓縮失敗，未能產生壓縮檔。")
+                            elif stats["engine"] == "lossless":
+                                st.error("無損最佳化失敗，未能產生壓縮檔。")
+                            else:
+                                st.error("Ghostscript 執行失敗，未能產生壓縮檔。")
+                        else:
+                            if stats["fallback"] and stats["gs_timed_out"]:
+                                st.warning(f"Ghostscript 壓縮逾時（超過 {GS_TIMEOUT} 秒），已改用圖片重新壓縮。")
+                            elif stats["fallback"]:
+                                st.info("Ghostscript 無法使用，已改用圖片重新壓縮。")
+                            elif stats["engine"] == "lossless" and engine != "lossless":
+                                st.info("此文件以文字為主，已改用無損最佳化（不重新取樣，速度較快）。")
+                            if stats["cache_hit"]:
+                                st.success("壓縮完成！（使用快取結果）")
+                            else:
+                                st.success("壓縮完成！")
+
+                            col1, col2, col3 = st.columns(3)
+                            with col1:
+                                st.metric("原始大小", format_size(stats["original_size"]))
+                            with col2:
+                                st.metric("壓縮後大小", format_size(stats["compressed_size"]))
+                            with col3:
+                                st.metric("減少", f"{stats['reduction']:.1f}%")
+                            if stats["skipped_runs"]:
+                                st.caption(f"📊 依預檢結果略過 {stats['skipped_runs']} 組不會更小的壓縮參數")
+                            if target_size_mb > 0 and stats["gs_passes"]:
+                                st.caption(f"⚙️ Ghostscript 共執行 {stats['gs_passes']} 次")
+                            if stats["scan"]:
+                                scan_counts = stats["scan"]
+                                st.caption(
+                                    f"📊 掃描檔模式：黑白 {scan_counts.get('bitonal', 0)} 張・灰階 {scan_counts.get('gray', 0)} 張・"
+                                    f"彩色 {scan_counts.get('color', 0)} 張圖片重新編碼"
+                                )
+                            if linearize:
+                                show_linearize_result(stats)
+
+                            original_name = uploaded_file.name.rsplit(".", 1)[0]
+                            download_name = f"{original_name}_compressed.pdf"
+
+                            # 保留結果檔到下次壓縮或工作階段結束，點擊下載時才讀取
+                            st.session_state.compress_output = output_file
+                            st.download_button(
+                                label="下載壓縮後的 PDF",
+                                data=measured_download(output_file.read_bytes, "compress"),
+                                file_name=download_name,
+                                mime="application/pdf",
+                                on_click="ignore",
+                                type="primary"
+                            )
+                    except CompressCancelled:
+                        st.warning("壓縮已取消")
+                    except Exception as e:
+                        st.error(f"壓縮過程中發生錯誤：{str(e)}")
 
-                        st.success("壓縮完成！")
+        elif uploaded_files:
+            total_size = sum(f.size for f in uploaded_files)
+            st.markdown(f"**已上傳：** {len(uploaded_files)} 個檔案（共 {format_size(total_size)}）")
+
+            if len(uploaded_files) > BATCH_MAX_FILES:
+                st.warning(f"一次最多批次壓縮 {BATCH_MAX_FILES} 個檔案，請分批上傳。")
+            elif st.button("開始批次壓縮", key="compress_batch_btn", type="primary"):
+                status = st.empty()
+                table = st.empty()
+                cancel_slot = st.empty()
+                cancel_slot.button(
+                    "取消批次壓縮", key="cancel_batch",
+                    on_click=lambda: st.session_state.update(job_cancelled=True)
+                )
+                try:
+                    results, archive = run_compress_batch(
+                        uploaded_files, quality, target_size_mb, engine, table, status, linearize=linearize
+                    )
+                    cancel_slot.empty()
 
+                    succeeded = [stats for stats in results if stats["outcome"] == "success"]
+                    failed = len(results) - len(succeeded)
+                    if not succeeded:
+                        st.error("所有檔案都未能壓縮，請改用較低的壓縮程度或其他壓縮引擎再試。")
+                    else:
+                        if failed:
+                            st.warning(f"{failed} 個檔案壓縮失敗或逾時，其餘檔案已完成。")
+                        else:
+                            st.success(f"批次壓縮完成！共 {len(succeeded)} 個檔案")
+
+                        original_size = sum(stats["original_size"] for stats in succeeded)
+                        compressed_size = sum(stats["compressed_size"] for stats in succeeded)
                         col1, col2, col3 = st.columns(3)
                         with col1:
-                            st.metric("原始大小", format_size(stats["original_size"]))
+                            st.metric("原始大小", format_size(original_size))
                         with col2:
-                            st.metric("壓縮後大小", format_size(stats["compressed_size"]))
+                            st.metric("壓縮後大小", format_size(compressed_size))
                         with col3:
-                            st.metric("減少", f"{stats['reduction']:.1f}%")
-
-                        original_name = uploaded_file.name.rsplit(".", 1)[0]
-                        download_name = f"{original_name}_compressed.pdf"
+                            reduction = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
+                            st.metric("減少", f"{reduction:.1f}%")
 
+                        # 保留 ZIP 到下次壓縮或工作階段結束，點擊下載時才讀取
+                        st.session_state.compress_output = archive
                         st.download_button(
-                            label="下載壓縮後的 PDF",
-                            data=compressed_bytes,
-                            file_name=download_name,
-                            mime="application/pdf",
+                            label=f"下載全部壓縮結果 (ZIP，{len(succeeded)} 個檔案)",
+                            data=measured_download(lambda: download_data(archive), "batch_zip"),
+                            file_name="compressed_pdfs.zip",
+                            mime="application/zip",
+                            on_click="ignore",
                             type="primary"
                         )
-                    except Exception as e:
-                        st.error(f"壓縮過程中發生錯誤：{str(e)}")
+                except CompressCancelled:
+                    st.warning("批次壓縮已取消")
+                except Exception as e:
+                    st.error(f"批次壓縮過程中發生錯誤：{str(e)}")
 
     # ===== 拆分功能 =====
     with tab2:
@@ -528,8 +871,9 @@ def main_app():
 
         if split_file is not None:
             try:
-                reader = PdfReader(io.BytesIO(split_file.getvalue()))
-                total_pages = len(reader.pages)
+                # 同一份上傳檔只解析一次，頁數顯示與拆分共用
+                with hold_document(get_document_cache(), split_file) as split_doc:
+                    total_pages = split_doc.page_count
                 st.info(f"此 PDF 共有 **{total_pages}** 頁")
             except Exception as e:
                 st.error(f"無法讀取 PDF：{str(e)}")
@@ -538,20 +882,43 @@ def main_app():
             if total_pages > 0:
                 split_mode = st.radio(
                     "選擇拆分方式：",
-                    options=["all", "range"],
+                    options=["all", "range", "chunk", "size", "bookmark"],
                     format_func=lambda x: {
                         "all": "每頁拆分成獨立檔案",
-                        "range": "指定頁數範圍"
+                        "range": "指定頁數範圍",
+                        "chunk": "每 N 頁一個檔案",
+                        "size": "依檔案大小分段",
+                        "bookmark": "依第一層書籤分章"
                     }[x],
                     key="split_mode"
                 )
 
                 page_range = ""
+                chunk_pages = 10
+                chunk_mb = 5.0
                 if split_mode == "range":
                     page_range = st.text_input(
                         "輸入頁數範圍（例如：1-3, 5, 7-10）：",
                         key="page_range"
                     )
+                elif split_mode == "chunk":
+                    chunk_pages = st.number_input(
+                        "每個檔案的頁數：",
+                        min_value=1,
+                        max_value=total_pages,
+                        value=min(10, total_pages),
+                        step=1,
+                        key="chunk_pages"
+                    )
+                elif split_mode == "size":
+                    chunk_mb = st.number_input(
+                        "每個檔案的大小上限 (MB)：",
+                        min_value=0.1,
+                        value=5.0,
+                        step=0.5,
+                        help="依頁面內容與圖片、字型大小估算，同一份中共用的資源只計算一次",
+                        key="chunk_mb"
+                    )
 
                 if st.button("開始拆分", key="split_btn", type="primary"):
                     if split_mode == "range" and not page_range.strip():
@@ -559,31 +926,38 @@ def main_app():
                     else:
                         with st.spinner("正在拆分中，請稍候..."):
                             try:
-                                results = split_pdf(split_file.getvalue(), split_mode, page_range)
-
-                                if not results:
-                                    st.warning("沒有符合條件的頁面可拆分")
+                                # 只規劃拆分結果，實際檔案在點擊下載時才產生
+                                with hold_document(get_document_cache(), split_file) as split_doc, split_doc.lock:
+                                    parts = pdftools.plan_split(split_doc.reader, split_mode, page_range,
+                                                                chunk_pages=chunk_pages, chunk_mb=chunk_mb)
+
+                                if not parts:
+                                    if split_mode == "bookmark":
+                                        st.warning("此 PDF 沒有可用的書籤")
+                                    else:
+                                        st.warning("沒有符合條件的頁面可拆分")
                                 else:
-                                    st.success(f"拆分完成！共產生 {len(results)} 個檔案")
+                                    st.success(f"拆分完成！共產生 {len(parts)} 個檔案")
 
                                     original_name = split_file.name.rsplit(".", 1)[0]
-                                    zip_bytes = create_zip(results)
 
                                     st.download_button(
-                                        label=f"下載全部 ({len(results)} 個檔案)",
-                                        data=zip_bytes,
+                                        label=f"下載全部 ({len(parts)} 個檔案)",
+                                        data=deferred_split_zip(get_document_cache(), split_file, parts),
                                         file_name=f"{original_name}_pages.zip",
                                         mime="application/zip",
+                                        on_click="ignore",
                                         type="primary"
                                     )
 
                                     with st.expander("或單獨下載每個檔案"):
-                                        for filename, content in results:
+                                        for filename, page_indices in parts:
                                             st.download_button(
                                                 label=filename,
-                                                data=content,
+                                                data=deferred_split_part(get_document_cache(), split_file, page_indices),
                                                 file_name=f"{original_name}_{filename}",
                                                 mime="application/pdf",
+                                                on_click="ignore",
                                                 key=f"download_{filename}"
                                             )
                             except Exception as e:
@@ -609,105 +983,87 @@ def main_app():
             if len(merge_files) < 2:
                 st.warning("請至少選擇 2 個 PDF 檔案進行合併")
             else:
+                merge_dedupe = st.checkbox(
+                    "去除重複的字型與圖片",
+                    value=True,
+                    help="多份檔案內嵌相同的字型、標誌圖片或色彩描述檔時，只保留一份",
+                    key="merge_dedupe"
+                )
+                merge_linearize = st.checkbox(
+                    "快速網頁檢視（線性化）",
+                    help="重新排列檔案內容，放上學習平台或網站後，瀏覽器下載到第一頁所需的部分就能開始顯示",
+                    key="merge_linearize"
+                )
+
                 if st.button("開始合併", key="merge_btn", type="primary"):
                     with st.spinner("正在合併中，請稍候..."):
                         try:
-                            files_bytes = [f.getvalue() for f in merge_files]
-                            merged_bytes = merge_pdfs(files_bytes)
+                            merged_file, merge_stats = pdftools.merge_pdfs_streaming(
+                                merge_files, dedupe=merge_dedupe, linearize=merge_linearize,
+                                backend=get_gs_backend() if merge_linearize else None
+                            )
 
                             st.success("合併完成！")
-                            st.metric("合併後檔案大小", format_size(len(merged_bytes)))
+                            col1, col2 = st.columns(2)
+                            with col1:
+                                st.metric("合併後檔案大小", format_size(merge_stats["output_size"]))
+                            with col2:
+                                if merge_dedupe:
+                                    st.metric(
+                                        "去除重複節省",
+                                        format_size(merge_stats["saved_bytes"]),
+                                        help=f"共去除 {merge_stats['deduplicated']} 個重複的串流物件"
+                                    )
+                            if merge_linearize:
+                                show_linearize_result(merge_stats)
 
+                            # 保留合併結果到下次合併或工作階段結束，點擊下載時才讀取
+                            st.session_state.merge_output = merged_file
                             st.download_button(
                                 label="下載合併後的 PDF",
-                                data=merged_bytes,
+                                data=measured_download(lambda: download_data(merged_file), "merge"),
                                 file_name="merged.pdf",
                                 mime="application/pdf",
+                                on_click="ignore",
                                 type="primary"
                             )
                         except Exception as e:
                             st.error(f"合併過程中發生錯誤：{str(e)}")
 
-    # 頁尾
+    # 頁尾：快取會保留壓縮後的完整內容，依實際設定說明保存位置
+    if CACHE_DISK_MB > 0:
+        cache_notice = "壓縮結果會以檔案內容的雜湊為索引暫存於伺服器記憶體與磁碟快取，以加速重複處理，空間用盡時由舊到新刪除。"
+    else:
+        cache_notice = "壓縮結果會以檔案內容的雜湊為索引暫存於伺服器記憶體，以加速重複處理，伺服器重新啟動即清除。"
+    if HISTORY_DB:
+        cache_notice += (f"目標大小模式另會記錄每份文件的大小、圖片占比、壓縮參數與結果大小（不含檔名與內容），"
+                         f"用來改善參數選擇，只保留最近 {HISTORY_MAX_SAMPLES} 筆。")
     st.markdown("---")
     st.markdown(
         """
         <div style="text-align: center; color: #888; font-size: 0.9rem;">
             <p>亮言~ 雲卷雲舒 · PDF 全能匠心 - 免費開源工具</p>
-            <p>所有檔案處理皆在伺服器端完成，處理完成後即刻刪除，不會保存您的檔案。</p>
+            <p>所有檔案處理皆在伺服器端完成，處理完成後即刻刪除原始檔案；{cache_notice}</p>
         </div>
-        """,
+        """.format(cache_notice=cache_notice),
         unsafe_allow_html=True
     )
 
 
 # 主程式入口
-# 使用 session_state 控制啟動畫面
-if "splash_shown" not in st.session_state:
-    st.session_state.splash_shown = False
-
-if not st.session_state.splash_shown:
-    # 顯示啟動畫面
-    splash_image_path = Path("assets/splash.png")
-    if splash_image_path.exists():
-        img_base64 = get_image_base64(str(splash_image_path))
-    else:
-        img_base64 = ""
+get_metrics_log()
+get_metrics_server()
+if is_admin():
+    admin_page()
+    st.stop()
+
+# 啟動畫面只在工作階段第一次執行時覆蓋在主畫面上，主畫面同時繪製，不需等待
+first_run = "splash_shown" not in st.session_state
+if first_run:
+    st.session_state.splash_shown = True
+    show_splash_screen()
 
-    st.markdown(f"""
-    <style>
-        #MainMenu {{visibility: hidden;}}
-        footer {{visibility: hidden;}}
-        header {{visibility: hidden;}}
-        .stApp {{
-            background-image: url('data:image/png;base64,{img_base64}');
-            background-size: cover;
-            background-position: center;
-            background-repeat: no-repeat;
-        }}
-        .splash-container {{
-            position: fixed;
-            bottom: 80px;
-            left: 50%;
-            transform: translateX(-50%);
-            width: 60%;
-            max-width: 400px;
-            text-align: center;
-        }}
-        .splash-progress-bg {{
-            background: rgba(255,255,255,0.5);
-            border-radius: 10px;
-            height: 10px;
-            overflow: hidden;
-        }}
-        .splash-progress-bar {{
-            background: linear-gradient(90deg, #4CAF50, #8BC34A);
-            height: 100%;
-            border-radius: 10px;
-            animation: loading 3.5s ease-out forwards;
-        }}
-        .splash-text {{
-            color: #555;
-            font-size: 0.9rem;
-            margin-top: 10px;
-        }}
-        @keyframes loading {{
-            0% {{ width: 0%; }}
-            100% {{ width: 100%; }}
-        }}
-    </style>
-    <div class="splash-container">
-        <div class="splash-progress-bg">
-            <div class="splash-progress-bar"></div>
-        </div>
-        <p class="splash-text">載入中...</p>
-    </div>
-    """, unsafe_allow_html=True)
+main_app()
 
-    # 等待 4 秒後標記已顯示
-    time.sleep(4)
-    st.session_state.splash_shown = True
-    st.rerun()
-else:
-    # 顯示主應用程式
-    main_app()
+if first_run:
+    get_startup_metrics().record((time.perf_counter() - RUN_STARTED) * 1000)
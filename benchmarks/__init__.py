@@ -0,0 +1,6 @@
+"""
+效能基準測試：離線產生合成 PDF 語料，量測壓縮、拆分、合併的時間、記憶體與輸出大小
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+"""
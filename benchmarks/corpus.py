@@ -0,0 +1,239 @@
+"""
+合成 PDF 語料：純文字、掃描圖片、圖文混合、大量頁數與大量字型五類，各有數種大小
+
+所有內容由固定的亂數種子產生，同一版本在任何機器上產生的檔案都相同，不需要網路或外部檔案。
+"""
+
+import io
+import os
+import random
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# 產生方式改變時遞增，舊的語料檔會自動重建
+CORPUS_VERSION = 1
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip "
+    "ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla"
+).split()
+
+
+class PdfBuilder:
+    """最小的 PDF 產生器：直接輸出物件與交叉參照表，產生上千頁時比 PyPDF2 快得多"""
+
+    def __init__(self):
+        self.objects: List[bytes] = []
+        self.pages: List[int] = []
+        self.outline: List[Tuple[str, int]] = []
+        self.pages_id = self.reserve()
+
+    def reserve(self) -> int:
+        self.objects.append(b"")
+        return len(self.objects)
+
+    def add(self, body: bytes, obj_id: int = 0) -> int:
+        if not obj_id:
+            obj_id = self.reserve()
+        self.objects[obj_id - 1] = body
+        return obj_id
+
+    def add_stream(self, entries: str, data: bytes, compress: bool = True) -> int:
+        if compress:
+            data = zlib.compress(data)
+            entries += " /Filter /FlateDecode"
+        return self.add(f"<< {entries} /Length {len(data)} >>\nstream\n".encode() + data + b"\nendstream")
+
+    def add_image(self, image: Image.Image, jpeg_quality: int = 0) -> int:
+        """加入圖片 XObject：jpeg_quality 為 0 時以 Flate 儲存原始像素，否則存成 JPEG"""
+        color_space = "/DeviceGray" if image.mode == "L" else "/DeviceRGB"
+        entries = (f"/Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+                   f"/ColorSpace {color_space} /BitsPerComponent 8")
+        if jpeg_quality:
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=jpeg_quality)
+            return self.add_stream(entries + " /Filter /DCTDecode", buffer.getvalue(), compress=False)
+        return self.add_stream(entries, image.tobytes())
+
+    def add_page(self, content: bytes, resources: str, bookmark: str = ""):
+        content_id = self.add_stream("", content)
+        self.pages.append(self.add(
+            f"<< /Type /Page /Parent {self.pages_id} 0 R /MediaBox [0 0 612 792] "
+            f"/Resources {resources} /Contents {content_id} 0 R >>".encode()
+        ))
+        if bookmark:
+            self.outline.append((bookmark, self.pages[-1]))
+
+    def write(self, path: str):
+        kids = " ".join(f"{page} 0 R" for page in self.pages)
+        self.add(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode(), self.pages_id)
+
+        catalog = f"<< /Type /Catalog /Pages {self.pages_id} 0 R"
+        if self.outline:
+            outlines_id = self.reserve()
+            item_ids = [self.reserve() for _ in self.outline]
+            for index, (title, page) in enumerate(self.outline):
+                links = ""
+                if index > 0:
+                    links += f" /Prev {item_ids[index - 1]} 0 R"
+                if index < len(item_ids) - 1:
+                    links += f" /Next {item_ids[index + 1]} 0 R"
+                self.add(f"<< /Title ({title}) /Parent {outlines_id} 0 R /Dest [{page} 0 R /Fit]{links} >>".encode(),
+                         item_ids[index])
+            self.add(f"<< /Type /Outlines /First {item_ids[0]} 0 R /Last {item_ids[-1]} 0 R "
+                     f"/Count {len(item_ids)} >>".encode(), outlines_id)
+            catalog += f" /Outlines {outlines_id} 0 R"
+        catalog_id = self.add((catalog + " >>").encode())
+
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+            offsets = []
+            for obj_id, body in enumerate(self.objects, 1):
+                offsets.append(f.tell())
+                f.write(b"%d 0 obj\n" % obj_id + body + b"\nendobj\n")
+            xref = f.tell()
+            f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1))
+            f.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+            f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                    % (len(self.objects) + 1, catalog_id, xref))
+
+
+def text_lines(rng: random.Random, count: int, font: str = "/F1", size: int = 11) -> bytes:
+    """產生一頁的文字內容串流"""
+    lines = [f"BT {font} {size} Tf 14 TL 56 740 Td".encode()]
+    for _ in range(count):
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 14)))
+        lines.append(f"({words}) '".encode())
+    lines.append(b"ET")
+    return b"\n".join(lines)
+
+
+HELVETICA = "<< /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >>"
+
+
+def build_text(path: str, pages: int, seed: int):
+    """純文字：每頁約 50 行，標準字型不內嵌"""
+    rng = random.Random(seed)
+    builder = PdfBuilder()
+    for index in range(pages):
+        builder.add_page(text_lines(rng, 50), HELVETICA, f"Chapter {index // 10 + 1}" if index % 10 == 0 else "")
+    builder.write(path)
+
+
+def scanned_page(rng: np.random.RandomState, width: int, height: int) -> Image.Image:
+    """模擬 200 DPI 灰階掃描頁：帶雜訊的紙張底色與一行行深色文字區塊"""
+    paper = rng.normal(235, 6, (height, width)).clip(0, 255).astype(np.uint8)
+    image = Image.fromarray(paper, "L")
+    draw = ImageDraw.Draw(image)
+    y = 150
+    while y < height - 150:
+        x = 150
+        while x < width - 200:
+            word = int(rng.randint(40, 160))
+            draw.rectangle([x, y, x + word, y + 22], fill=int(rng.randint(20, 70)))
+            x += word + 25
+        y += 44
+    return image.filter(ImageFilter.GaussianBlur(0.8))
+
+
+def build_scanned(path: str, pages: int, seed: int):
+    """掃描檔：每頁一張整頁 JPEG 灰階圖片"""
+    rng = np.random.RandomState(seed)
+    builder = PdfBuilder()
+    for _ in range(pages):
+        image_id = builder.add_image(scanned_page(rng, 1700, 2200), jpeg_quality=85)
+        builder.add_page(b"q 612 0 0 792 0 0 cm /Im0 Do Q", f"<< /XObject << /Im0 {image_id} 0 R >> >>")
+    builder.write(path)
+
+
+def photo(rng: np.random.RandomState, width: int, height: int) -> Image.Image:
+    """平滑的彩色雜訊，壓縮特性接近照片"""
+    small = rng.randint(0, 256, (height // 16, width // 16, 3)).astype(np.uint8)
+    image = Image.fromarray(small, "RGB").resize((width, height), Image.BICUBIC)
+    noise = rng.normal(0, 8, (height, width, 3))
+    return Image.fromarray((np.asarray(image) + noise).clip(0, 255).astype(np.uint8), "RGB")
+
+
+def build_mixed(path: str, pages: int, seed: int):
+    """圖文混合：每頁一段文字、一張 JPEG 照片與一張以 Flate 儲存的圖表"""
+    rng = random.Random(seed)
+    image_rng = np.random.RandomState(seed)
+    builder = PdfBuilder()
+    for index in range(pages):
+        photo_id = builder.add_image(photo(image_rng, 1200, 800), jpeg_quality=92)
+        chart_id = builder.add_image(photo(image_rng, 600, 400).filter(ImageFilter.GaussianBlur(4)))
+        content = (text_lines(rng, 18) + b"\nq 400 0 0 266 106 300 cm /Im0 Do Q"
+                   b"\nq 300 0 0 200 156 60 cm /Im1 Do Q")
+        resources = (f"<< /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> "
+                     f"/XObject << /Im0 {photo_id} 0 R /Im1 {chart_id} 0 R >> >>")
+        builder.add_page(content, resources, f"Section {index + 1}" if index % 5 == 0 else "")
+    builder.write(path)
+
+
+def build_many_pages(path: str, pages: int, seed: int):
+    """大量頁數：每頁只有幾行文字，考驗逐頁處理的固定成本"""
+    rng = random.Random(seed)
+    builder = PdfBuilder()
+    for index in range(pages):
+        builder.add_page(text_lines(rng, 3), HELVETICA, f"Part {index // 100 + 1}" if index % 100 == 0 else "")
+    builder.write(path)
+
+
+def type3_font(builder: PdfBuilder, rng: random.Random) -> int:
+    """產生一套 Type3 字型：每個字元是一條隨機多邊形路徑，字型資料全部放在 PDF 內"""
+    procs = []
+    for code in range(32, 127):
+        points = " ".join(f"{rng.randint(0, 600)} {rng.randint(0, 700)} l" for _ in range(rng.randint(20, 40)))
+        data = f"600 0 0 0 600 700 d1 0 0 m {points} h f".encode()
+        procs.append(f"/g{code} {builder.add_stream('', data)} 0 R")
+    differences = " ".join(f"/g{code}" for code in range(32, 127))
+    return builder.add(
+        f"<< /Type /Font /Subtype /Type3 /FontBBox [0 0 600 700] /FontMatrix [0.001 0 0 0.001 0 0] "
+        f"/CharProcs << {' '.join(procs)} >> /Encoding << /Type /Encoding /Differences [32 {differences}] >> "
+        f"/FirstChar 32 /LastChar 126 /Widths [{' '.join(['600'] * 95)}] >>".encode()
+    )
+
+
+def build_font_heavy(path: str, pages: int, seed: int):
+    """大量字型：數十套內嵌字型，每頁輪流使用其中數套"""
+    rng = random.Random(seed)
+    builder = PdfBuilder()
+    fonts = [type3_font(builder, rng) for _ in range(max(4, pages * 2))]
+    for index in range(pages):
+        used = [fonts[(index * 4 + k) % len(fonts)] for k in range(4)]
+        content = b"\n".join(text_lines(rng, 12, f"/T{k}", 10) for k in range(4))
+        font_entries = " ".join(f"/T{k} {font_id} 0 R" for k, font_id in enumerate(used))
+        builder.add_page(content, f"<< /Font << {font_entries} >> >>")
+    builder.write(path)
+
+
+# 語料種類 -> (產生函式, 各大小的頁數)
+CORPUS_KINDS = {
+    "text": (build_text, {"s": 10, "m": 100, "l": 500}),
+    "scanned": (build_scanned, {"s": 4, "m": 20, "l": 80}),
+    "mixed": (build_mixed, {"s": 5, "m": 30, "l": 100}),
+    "many_pages": (build_many_pages, {"s": 500, "m": 2000, "l": 5000}),
+    "font_heavy": (build_font_heavy, {"s": 5, "m": 20, "l": 60}),
+}
+
+
+def build_corpus(directory: str, kinds: List[str], sizes: List[str]) -> Dict[str, str]:
+    """產生（或沿用已產生的）語料，回傳 {文件名稱: 路徑}；文件名稱如 scanned-m"""
+    os.makedirs(directory, exist_ok=True)
+    documents = {}
+    for kind in kinds:
+        builder, page_counts = CORPUS_KINDS[kind]
+        for size in sizes:
+            name = f"{kind}-{size}"
+            path = os.path.join(directory, f"{name}-v{CORPUS_VERSION}.pdf")
+            if not os.path.exists(path):
+                partial = path + ".partial"
+                # 以名稱決定亂數種子，每次產生的內容都相同
+                builder(partial, page_counts[size], seed=sum(map(ord, name)))
+                os.replace(partial, path)
+            documents[name] = path
+    return documents
@@ -0,0 +1,487 @@
+"""
+多工作階段負載測試：在本機啟動 Streamlit 伺服器，以無頭用戶端模擬 N 個同時上線的使用者
+
+每個使用者透過 WebSocket 收發 Streamlit 協定訊息、以 HTTP 上傳基準語料，依序操作壓縮、拆分、合併分頁並下載結果。
+逐級提高同時上線人數，回報吞吐量、各操作 p50/p95/p99 延遲、逾時比例、主畫面首次繪製時間與主機記憶體。
+
+    python -m benchmarks.load --concurrency 1,2,4,8 --rounds 2 --output load.json
+    python -m benchmarks.load --concurrency 4 --server-env PDF_MAX_CONCURRENT_JOBS=4 --server-env PDF_SPLASH_SECONDS=4
+
+需要 websockets 套件（pip install -r requirements-dev.txt）。
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from pdftools.config import GS_TIMEOUT
+
+from .corpus import CORPUS_KINDS, build_corpus
+from .run import environment
+
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+OPERATIONS = ["compress", "split", "merge"]
+
+# Alert 訊息的格式代碼
+ALERT_ERROR = 1
+ALERT_SUCCESS = 4
+
+
+class Session:
+    """一個瀏覽器工作階段：以 WebSocket 收發協定訊息、以 HTTP 上傳與下載檔案，並記住各元件的狀態"""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.ws_url = "ws" + self.base_url[len("http"):] + "/_stcore/stream"
+        self.timeout = timeout
+        self.session_id = ""
+        self.page_hash = ""
+        # 元件 key -> 元件 ID；送出重新執行時附上所有元件目前的值，與瀏覽器相同
+        self.widgets: Dict[str, str] = {}
+        self.states = {}
+        self.alerts: List[Tuple[int, str]] = []
+        self.exceptions: List[str] = []
+        self.downloads = {}
+        self.responses = {}
+        self.ws = None
+        self._connection = None
+
+    def __enter__(self):
+        self._connection = ws_connect(self.ws_url, subprotocols=["streamlit"], max_size=None,
+                                      open_timeout=self.timeout)
+        self.ws = self._connection.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._connection.__exit__(*exc)
+
+    def _handle(self, msg: ForwardMsg):
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id
+            self.page_hash = msg.new_session.page_script_hash
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element_type = msg.delta.new_element.WhichOneof("type")
+            element = getattr(msg.delta.new_element, element_type)
+            widget_id = getattr(element, "id", "")
+            if widget_id.startswith("$$ID-"):
+                # 元件 ID 的格式為 $$ID-雜湊-key
+                self.widgets[widget_id.split("-", 2)[2]] = widget_id
+            if element_type == "alert":
+                self.alerts.append((element.format, element.body))
+            elif element_type == "exception":
+                self.exceptions.append(element.message)
+            elif element_type == "download_button":
+                self.downloads[element.label] = element
+        elif kind == "file_urls_response":
+            self.responses[msg.file_urls_response.response_id] = msg.file_urls_response
+        elif kind == "backend_operation_response":
+            self.responses[msg.backend_operation_response.request_id] = msg.backend_operation_response
+
+    def _wait(self, predicate) -> ForwardMsg:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("等待伺服器回應逾時")
+            msg = ForwardMsg()
+            msg.ParseFromString(self.ws.recv(timeout=remaining))
+            self._handle(msg)
+            if predicate(msg):
+                return msg
+
+    def _send(self, msg: BackMsg):
+        self.ws.send(msg.SerializeToString())
+
+    def rerun(self, trigger: str = "") -> float:
+        """送出重新執行（可同時按下一個按鈕），等待腳本結束並回傳秒數"""
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = self.page_hash
+        for state in self.states.values():
+            msg.rerun_script.widget_states.widgets.append(state)
+        if trigger:
+            button = msg.rerun_script.widget_states.widgets.add()
+            button.id = self.widgets[trigger]
+            button.trigger_value = True
+        self.alerts, self.exceptions, self.downloads = [], [], {}
+        started = time.perf_counter()
+        self._send(msg)
+        self._wait(lambda m: m.WhichOneof("type") == "script_finished")
+        return time.perf_counter() - started
+
+    def upload(self, key: str, files: List[Tuple[str, bytes]]):
+        """上傳檔案並設定到指定的上傳元件（下次重新執行時生效）"""
+        request = BackMsg()
+        request_id = uuid.uuid4().hex
+        request.file_urls_request.request_id = request_id
+        request.file_urls_request.session_id = self.session_id
+        request.file_urls_request.file_names.extend(name for name, _ in files)
+        self._send(request)
+        self._wait(lambda m: request_id in self.responses)
+        response = self.responses.pop(request_id)
+        if response.error_msg:
+            raise RuntimeError(response.error_msg)
+
+        state = BackMsg().rerun_script.widget_states.widgets.add()
+        state.id = self.widgets[key]
+        for (name, data), urls in zip(files, response.file_urls):
+            boundary = uuid.uuid4().hex
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="UploadedFile"; filename="{name}"\r\n'
+                    f'Content-Type: application/pdf\r\n\r\n').encode() + data + f"\r\n--{boundary}--\r\n".encode()
+            url = urls.upload_url if urls.upload_url.startswith("http") else self.base_url + urls.upload_url
+            http_request = urllib.request.Request(url, data=body, method="PUT", headers={
+                "Content-Type": f"multipart/form-data; boundary={boundary}"})
+            urllib.request.urlopen(http_request, timeout=self.timeout).close()
+            info = state.file_uploader_state_value.uploaded_file_info.add()
+            info.name, info.size, info.file_id = name, len(data), urls.file_id
+            info.file_urls.CopyFrom(urls)
+        self.states[state.id] = state
+
+    def download(self, label_prefix: str) -> Tuple[float, int]:
+        """按下標籤以 label_prefix 開頭的下載按鈕並取回檔案，回傳 (秒數, 位元組數)"""
+        button = next(button for label, button in self.downloads.items() if label.startswith(label_prefix))
+        started = time.perf_counter()
+        url = button.url
+        if not url:
+            # 點擊時才產生內容的下載按鈕：請伺服器執行產生函式並取得網址
+            request = BackMsg()
+            request_id = uuid.uuid4().hex
+            request.backend_operation_request.request_id = request_id
+            request.backend_operation_request.session_id = self.session_id
+            request.backend_operation_request.deferred_file.file_id = button.deferred_file_id
+            self._send(request)
+            self._wait(lambda m: request_id in self.responses)
+            response = self.responses.pop(request_id)
+            if response.error_msg:
+                raise RuntimeError(response.error_msg)
+            url = response.deferred_file.url
+        with urllib.request.urlopen(url if url.startswith("http") else self.base_url + url,
+                                    timeout=self.timeout) as f:
+            size = len(f.read())
+        return time.perf_counter() - started, size
+
+    def outcome(self, success_text: str) -> str:
+        """依畫面上的訊息判斷操作結果：success / timeout / failed / error"""
+        if self.exceptions:
+            return "error"
+        if any(fmt == ALERT_SUCCESS and success_text in body for fmt, body in self.alerts):
+            return "success"
+        if any(fmt == ALERT_ERROR and "逾時" in body for fmt, body in self.alerts):
+            return "timeout"
+        return "failed"
+
+
+def unique_copy(data: bytes, tag: str) -> bytes:
+    """在檔尾附加註解讓每次上傳的內容都不同，避免壓縮快取使結果失真"""
+    return data + f"\n% load-test {tag}\n".encode()
+
+
+def run_operation(session: Session, op: str, document: Tuple[str, bytes], tag: str) -> List[dict]:
+    """操作一個分頁並下載結果，回傳操作與下載兩筆紀錄"""
+    name, data = document
+    if op == "compress":
+        session.upload("compress_uploader", [(name, unique_copy(data, tag))])
+        button, success_text, download_label = "compress_btn", "壓縮完成", "下載壓縮後"
+    elif op == "split":
+        session.upload("split_uploader", [(name, unique_copy(data, tag))])
+        button, success_text, download_label = "split_btn", "拆分完成", "下載全部"
+    else:
+        session.upload("merge_uploader", [(name, unique_copy(data, tag)), ("2-" + name, unique_copy(data, tag + "b"))])
+        button, success_text, download_label = "merge_btn", "合併完成", "下載合併後"
+    session.rerun()
+
+    records = []
+    latency = session.rerun(button)
+    outcome = session.outcome(success_text)
+    records.append({"op": op, "latency_s": latency, "outcome": outcome, "document": name})
+    if outcome == "success":
+        try:
+            seconds, size = session.download(download_label)
+            records.append({"op": f"{op}_download", "latency_s": seconds, "outcome": "success", "bytes": size})
+        except Exception as e:
+            records.append({"op": f"{op}_download", "latency_s": 0.0, "outcome": "error", "error": repr(e)})
+    return records
+
+
+class MemorySampler:
+    """定期取樣伺服器程序樹（含 Ghostscript 子程序）的常駐記憶體與主機可用記憶體"""
+
+    def __init__(self, root_pid: Optional[int], interval: float = 0.5):
+        self.root_pid = root_pid
+        self.interval = interval
+        self.peak_tree_kb = 0
+        self.min_available_kb = None
+        self.total_kb = meminfo().get("MemTotal", 0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.root_pid:
+                self.peak_tree_kb = max(self.peak_tree_kb, tree_rss_kb(self.root_pid))
+            available = meminfo().get("MemAvailable")
+            if available is not None:
+                self.min_available_kb = available if self.min_available_kb is None else min(self.min_available_kb,
+                                                                                            available)
+            self._stop.wait(self.interval)
+
+
+def meminfo() -> Dict[str, int]:
+    """讀取 /proc/meminfo（KB），非 Linux 時回傳空字典"""
+    try:
+        with open("/proc/meminfo") as f:
+            return {line.split(":")[0]: int(line.split()[1]) for line in f}
+    except (OSError, ValueError, IndexError):
+        return {}
+
+
+def tree_rss_kb(root_pid: int) -> int:
+    """程序與其所有子孫程序的常駐記憶體合計（KB）"""
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields.get("PPid", "0").strip()), []).append(pid)
+        rss[pid] = int(fields.get("VmRSS", "0 kB").split()[0])
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += rss.get(pid, 0)
+        stack += children.get(pid, [])
+    return total
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, server_env: Dict[str, str]) -> subprocess.Popen:
+    """在本機啟動無頭 Streamlit 伺服器並等待就緒；關閉 XSRF 檢查以便用戶端直接上傳"""
+    command = [
+        sys.executable, "-m", "streamlit", "run", APP_PATH,
+        "--server.headless", "true", "--server.port", str(port), "--server.address", "127.0.0.1",
+        "--server.enableXsrfProtection", "false", "--server.enableCORS", "false",
+        "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false",
+    ]
+    process = subprocess.Popen(command, env=dict(os.environ, **server_env), stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL, cwd=os.path.dirname(APP_PATH))
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Streamlit 伺服器啟動失敗")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as f:
+                if f.read().strip() == b"ok":
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("等待 Streamlit 伺服器就緒逾時")
+
+
+def percentile(values: List[float], quantile: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * quantile))] if values else 0.0
+
+
+def summarize(records: List[dict], elapsed: float) -> dict:
+    """依操作彙總延遲百分位數與結果比例"""
+    ops = {}
+    for op in sorted({record["op"] for record in records}):
+        selected = [record for record in records if record["op"] == op]
+        latencies = [record["latency_s"] for record in selected if record["outcome"] == "success"]
+        outcomes = {}
+        for record in selected:
+            outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+        ops[op] = {
+            "count": len(selected),
+            "outcomes": outcomes,
+            "timeout_rate": outcomes.get("timeout", 0) / len(selected),
+            "p50_s": round(percentile(latencies, 0.5), 3),
+            "p95_s": round(percentile(latencies, 0.95), 3),
+            "p99_s": round(percentile(latencies, 0.99), 3),
+            "max_s": round(max(latencies, default=0.0), 3),
+        }
+    completed = [record for record in records if record["op"] in OPERATIONS and record["outcome"] == "success"]
+    operations = [record for record in records if record["op"] in OPERATIONS]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "throughput_ops_per_min": round(len(completed) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "timeout_rate": (sum(record["outcome"] == "timeout" for record in operations) / len(operations)
+                         if operations else 0.0),
+        "error_rate": (sum(record["outcome"] in ("error", "failed") for record in operations) / len(operations)
+                       if operations else 0.0),
+        "ops": ops,
+    }
+
+
+def run_level(base_url: str, concurrency: int, rounds: int, ops: List[str], documents: List[Tuple[str, bytes]],
+              timeout: float, server_pid: Optional[int]) -> dict:
+    """以 concurrency 個同時上線的使用者各操作 rounds 輪"""
+    records = []
+    lock = threading.Lock()
+    # 所有使用者同時開啟頁面，模擬尖峰
+    barrier = threading.Barrier(concurrency)
+
+    def user(index: int):
+        try:
+            barrier.wait()
+            started = time.perf_counter()
+            with Session(base_url, timeout) as session:
+                session.rerun()
+                first_render = {"op": "first_render", "latency_s": time.perf_counter() - started,
+                                "outcome": "error" if session.exceptions else "success"}
+                with lock:
+                    records.append(first_render)
+                for round_index in range(rounds):
+                    for op_index, op in enumerate(ops):
+                        document = documents[(index + round_index + op_index) % len(documents)]
+                        tag = f"{index}-{round_index}-{uuid.uuid4().hex[:8]}"
+                        try:
+                            result = run_operation(session, op, document, tag)
+                        except TimeoutError:
+                            result = [{"op": op, "latency_s": timeout, "outcome": "timeout", "document": document[0]}]
+                        except Exception as e:
+                            result = [{"op": op, "latency_s": 0.0, "outcome": "error", "error": repr(e)}]
+                        with lock:
+                            records.extend(result)
+        except Exception as e:
+            with lock:
+                records.append({"op": "first_render", "latency_s": 0.0, "outcome": "error", "error": repr(e)})
+
+    threads = [threading.Thread(target=user, args=(index,), daemon=True) for index in range(concurrency)]
+    with MemorySampler(server_pid) as memory:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        **summarize(records, elapsed),
+        "server_peak_rss_mb": round(memory.peak_tree_kb / 1024, 1) if server_pid else None,
+        "host_min_available_mb": round(memory.min_available_kb / 1024, 1) if memory.min_available_kb else None,
+        "host_total_mb": round(memory.total_kb / 1024, 1) if memory.total_kb else None,
+        "errors": sorted({record["error"] for record in records if "error" in record})[:10],
+    }
+
+
+def format_level(level: dict) -> str:
+    ops = level["ops"]
+    parts = [f"{level['concurrency']:>3} 人  {level['throughput_ops_per_min']:>6.1f} 次/分"]
+    for op in ["first_render"] + OPERATIONS:
+        if op in ops:
+            parts.append(f"{op} p50 {ops[op]['p50_s']:.2f}s p95 {ops[op]['p95_s']:.2f}s")
+    parts.append(f"逾時 {level['timeout_rate']:.0%} 錯誤 {level['error_rate']:.0%}")
+    if level["server_peak_rss_mb"] is not None:
+        parts.append(f"伺服器記憶體 {level['server_peak_rss_mb']:.0f}MB")
+    return "  ".join(parts)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description="PDF 工具箱多工作階段負載測試")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="逐級測試的同時上線人數（逗號分隔）")
+    parser.add_argument("--rounds", type=int, default=1, help="每位使用者操作的輪數")
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help="每輪依序操作的分頁（逗號分隔）")
+    parser.add_argument("--kinds", default="text,scanned,mixed", help="上傳的語料種類（逗號分隔）")
+    parser.add_argument("--size", default="s", choices=["s", "m", "l"], help="語料大小")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf_tools_bench_corpus"))
+    parser.add_argument("--timeout", type=float, default=GS_TIMEOUT * 2, help="單一操作的用戶端逾時秒數")
+    parser.add_argument("--url", help="改測試已在執行的伺服器（需關閉 server.enableXsrfProtection），不另外啟動")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="啟動伺服器時額外設定的環境變數，可重複指定")
+    parser.add_argument("--output", default="load-results.json", help="結果 JSON 檔")
+    args = parser.parse_args(argv)
+
+    if ws_connect is None:
+        print("需要 websockets 套件：pip install -r requirements-dev.txt", file=sys.stderr)
+        return 2
+
+    kinds = [kind for kind in args.kinds.split(",") if kind in CORPUS_KINDS]
+    paths = build_corpus(args.corpus_dir, kinds, [args.size])
+    documents = []
+    for name, path in paths.items():
+        with open(path, "rb") as f:
+            documents.append((f"{name}.pdf", f.read()))
+    ops = [op for op in args.ops.split(",") if op in OPERATIONS]
+    server_env = dict(item.split("=", 1) for item in args.server_env)
+
+    levels = []
+    for concurrency in [int(value) for value in args.concurrency.split(",") if value]:
+        server = None
+        try:
+            if args.url:
+                base_url, server_pid = args.url, None
+            else:
+                # 每一級都重新啟動伺服器，記憶體高峰與冷啟動互不影響
+                port = free_port()
+                server = start_server(port, server_env)
+                base_url, server_pid = f"http://127.0.0.1:{port}", server.pid
+            level = run_level(base_url, concurrency, args.rounds, ops, documents, args.timeout, server_pid)
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+        levels.append(level)
+        print(format_level(level), file=sys.stderr)
+
+    # 容量：逾時與錯誤皆為零的最高同時上線人數
+    healthy = [level["concurrency"] for level in levels if level["timeout_rate"] == 0 and level["error_rate"] == 0]
+    capacity = max(healthy, default=0)
+    print(f"無逾時與錯誤的最高同時上線人數：{capacity}", file=sys.stderr)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": dict(environment(), settings=dict(environment()["settings"], **server_env)),
+        "options": {"rounds": args.rounds, "ops": ops, "kinds": kinds, "size": args.size, "timeout": args.timeout},
+        "capacity": capacity,
+        "levels": levels,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
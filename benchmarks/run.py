@@ -0,0 +1,314 @@
+"""
+效能基準測試執行器
+
+每個測試項目在獨立的子行程中執行，量測牆鐘時間、CPU 時間（含 Ghostscript 子程序）、
+最高常駐記憶體、Ghostscript 執行次數、輸出大小與顯示第一頁前須下載的位元組數，結果寫成 JSON。
+指定 --baseline 時與先前儲存的結果比較，超過門檻的項目列為退步並以結束碼 1 結束。
+
+    python -m benchmarks.run --sizes s,m --output results.json
+    python -m benchmarks.run --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from .corpus import CORPUS_KINDS, CORPUS_VERSION, build_corpus
+
+QUALITIES = ["low", "medium", "high", "extreme"]
+SPLIT_MODES = ["all", "chunk"]
+MERGE_IMPLS = ["streaming", "pypdf"]
+
+# 指標 -> (允許的倍數, 允許的絕對差)；兩者都超過才算退步，避免極短項目的雜訊
+THRESHOLDS = {
+    "wall_s": (1.25, 0.05),
+    "cpu_s": (1.25, 0.05),
+    "peak_rss_kb": (1.2, 10 * 1024),
+    "gs_peak_rss_kb": (1.2, 10 * 1024),
+    "output_size": (1.02, 1024),
+    "gs_passes": (1.0, 0),
+    "first_page_bytes": (1.02, 1024),
+}
+
+
+def case_id(case: dict) -> str:
+    """測試項目的識別字串，用來與基準比對"""
+    if case["op"] == "compress":
+        key = f"compress/{case['doc']}/{case['engine']}/{case['quality']}"
+        if case["target_mb"] > 0:
+            key += f"/target={case['target_mb']:g}"
+        if case.get("linearize"):
+            key += "/linearize"
+        return key
+    if case["op"] == "split":
+        return f"split/{case['doc']}/{case['mode']}"
+    return f"merge/{case['doc']}/{case['impl']}" + ("/linearize" if case.get("linearize") else "")
+
+
+def plan_cases(documents: Dict[str, str], ops: List[str], qualities: List[str]) -> List[dict]:
+    """依語料與操作列出所有測試項目"""
+    cases = []
+    for name, path in documents.items():
+        if "compress" in ops:
+            for quality in qualities:
+                cases.append({"op": "compress", "doc": name, "path": path, "engine": "ghostscript",
+                              "quality": quality, "target_mb": 0})
+            # 目標大小模式：原始大小的一半，語料固定所以目標也固定
+            target_mb = round(os.path.getsize(path) / 2 / (1024 * 1024), 2)
+            if target_mb > 0:
+                cases.append({"op": "compress", "doc": name, "path": path, "engine": "ghostscript",
+                              "quality": "high", "target_mb": target_mb})
+            for engine in ("image", "scan", "lossless"):
+                cases.append({"op": "compress", "doc": name, "path": path, "engine": engine,
+                              "quality": "medium", "target_mb": 0})
+            # 線性化前後顯示第一頁所需的下載量
+            cases.append({"op": "compress", "doc": name, "path": path, "engine": "ghostscript",
+                          "quality": "medium", "target_mb": 0, "linearize": True})
+        if "split" in ops:
+            for mode in SPLIT_MODES:
+                cases.append({"op": "split", "doc": name, "path": path, "mode": mode})
+
+    if "merge" in ops:
+        # 同一大小的所有語料依序合併
+        by_size = {}
+        for name, path in documents.items():
+            by_size.setdefault(name.rsplit("-", 1)[1], []).append(path)
+        for size, paths in by_size.items():
+            if len(paths) < 2:
+                continue
+            for impl in MERGE_IMPLS:
+                cases.append({"op": "merge", "doc": f"all-{size}", "paths": paths, "impl": impl})
+            cases.append({"op": "merge", "doc": f"all-{size}", "paths": paths, "impl": "streaming", "linearize": True})
+    for case in cases:
+        case["id"] = case_id(case)
+    return cases
+
+
+def run_case(case: dict) -> dict:
+    """在目前行程中執行單一測試項目（由 --worker 呼叫）"""
+    import resource
+    from PyPDF2 import PdfReader
+    from pdftools import (compress_pdf_file, first_page_bytes, iter_split_parts, merge_pdfs, merge_pdfs_streaming,
+                          metrics, plan_split, spooled_zip)
+
+    # macOS 的 ru_maxrss 單位是位元組，Linux 是 KB
+    rss_unit = 1024 if sys.platform == "darwin" else 1
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result = {"baseline_rss_kb": self_before.ru_maxrss // rss_unit}
+    start = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if case["op"] == "compress":
+            output_path = os.path.join(tmp, "output.pdf")
+            stats = compress_pdf_file(case["path"], output_path, case["quality"], case["target_mb"],
+                                      engine=case["engine"], linearize=case.get("linearize", False))
+            result.update(input_size=stats["original_size"], output_size=stats["compressed_size"],
+                          gs_passes=stats["gs_passes"], engine=stats["engine"], outcome=stats["outcome"],
+                          fallback=stats["fallback"], first_page_bytes=stats["first_page_bytes"],
+                          linearized=stats["linearized"])
+        elif case["op"] == "split":
+            # 與網頁版相同的流程：逐份產生並串流打包成 ZIP
+            with open(case["path"], "rb") as handle:
+                reader = PdfReader(handle)
+                parts = plan_split(reader, case["mode"], chunk_pages=10)
+                archive = spooled_zip(iter_split_parts(reader, parts))
+                archive.seek(0, os.SEEK_END)
+                result.update(input_size=os.path.getsize(case["path"]), output_size=archive.tell(), parts=len(parts))
+                archive.close()
+        else:
+            handles = [open(path, "rb") for path in case["paths"]]
+            try:
+                if case["impl"] == "streaming":
+                    output, stats = merge_pdfs_streaming(handles, linearize=case.get("linearize", False))
+                    output.close()
+                    output_size = stats["output_size"]
+                    result.update(first_page_bytes=stats["first_page_bytes"], linearized=stats["linearized"])
+                else:
+                    output = merge_pdfs(handles)
+                    output_size = len(output)
+                    result["first_page_bytes"] = first_page_bytes(io.BytesIO(output))
+            finally:
+                for handle in handles:
+                    handle.close()
+            result.update(input_size=sum(os.path.getsize(path) for path in case["paths"]), output_size=output_size)
+
+    result["wall_s"] = time.perf_counter() - start
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result["cpu_s"] = (
+        (self_after.ru_utime - self_before.ru_utime) + (self_after.ru_stime - self_before.ru_stime)
+        + (children_after.ru_utime - children_before.ru_utime) + (children_after.ru_stime - children_before.ru_stime)
+    )
+    result["peak_rss_kb"] = self_after.ru_maxrss // rss_unit
+    # Ghostscript 的記憶體高峰取執行引擎回報的值：gsapi 的工作程序到行程結束前都不會被回收，
+    # RUSAGE_CHILDREN 看不到；子程序模式下則與 wait4 取得的值相同
+    result["gs_peak_rss_kb"] = max((entry["child_max_rss_kb"] for entry in metrics.registry.stats().values()),
+                                   default=0)
+    return result
+
+
+def run_in_subprocess(case: dict, timeout: float) -> dict:
+    """在新的子行程中執行測試項目，避免前一個項目的記憶體高峰與快取影響結果"""
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--worker"],
+            input=json.dumps(case), capture_output=True, text=True, timeout=timeout,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": f"逾時（超過 {timeout:.0f} 秒）"}
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "執行失敗"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def aggregate(runs: List[dict]) -> dict:
+    """多次執行取時間的中位數與記憶體的最大值"""
+    errors = [run["error"] for run in runs if "error" in run]
+    if errors:
+        return {"error": errors[0]}
+    result = dict(runs[0])
+    for key in ("wall_s", "cpu_s"):
+        result[key] = round(statistics.median(run[key] for run in runs), 4)
+    for key in ("peak_rss_kb", "gs_peak_rss_kb"):
+        result[key] = max(run[key] for run in runs)
+    if len(runs) > 1:
+        result["wall_s_runs"] = [round(run["wall_s"], 4) for run in runs]
+    return result
+
+
+def ghostscript_version() -> Optional[str]:
+    try:
+        return subprocess.run(["gs", "--version"], capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        completed = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        return completed.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def environment() -> dict:
+    """記錄會影響結果的執行環境，比較時環境不同會提出警告"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ghostscript": ghostscript_version(),
+        "git_commit": git_commit(),
+        "corpus_version": CORPUS_VERSION,
+        "settings": {key: value for key, value in sorted(os.environ.items()) if key.startswith("PDF_")},
+    }
+
+
+def compare(results: List[dict], baseline: dict) -> List[dict]:
+    """與基準比較，回傳退步的項目"""
+    baseline_results = {result["id"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get(result["id"])
+        if previous is None or "error" in previous:
+            continue
+        if "error" in result:
+            regressions.append({"id": result["id"], "metric": "error", "baseline": None, "current": result["error"]})
+            continue
+        for metric, (ratio, slack) in THRESHOLDS.items():
+            if metric not in result or metric not in previous:
+                continue
+            before, after = previous[metric], result[metric]
+            if after > before * ratio and after - before > slack:
+                regressions.append({"id": result["id"], "metric": metric, "baseline": before, "current": after})
+    return regressions
+
+
+def format_row(result: dict) -> str:
+    if "error" in result:
+        return f"{result['id']:<52} 錯誤：{result['error']}"
+    line = (f"{result['id']:<52} {result['wall_s']:>8.2f}s {result['cpu_s']:>8.2f}s "
+            f"{result['peak_rss_kb'] / 1024:>7.0f}MB {result['output_size'] / 1024:>10.0f}KB")
+    if result.get("gs_passes"):
+        line += f"  gs×{result['gs_passes']}"
+    if "first_page_bytes" in result:
+        line += f"  首頁 {result['first_page_bytes'] / 1024:.0f}KB"
+    return line
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="PDF 工具箱效能基準測試")
+    parser.add_argument("--kinds", default=",".join(CORPUS_KINDS), help="語料種類（逗號分隔）")
+    parser.add_argument("--sizes", default="s,m", help="語料大小：s、m、l（逗號分隔）")
+    parser.add_argument("--ops", default="compress,split,merge", help="要測試的操作（逗號分隔）")
+    parser.add_argument("--qualities", default=",".join(QUALITIES), help="壓縮程度（逗號分隔）")
+    parser.add_argument("--filter", default="", help="只執行識別字串包含此文字的項目")
+    parser.add_argument("--repeat", type=int, default=1, help="每個項目執行次數，時間取中位數")
+    parser.add_argument("--timeout", type=float, default=900, help="每次執行的逾時秒數")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf_tools_bench_corpus"),
+                        help="語料存放位置（已產生的檔案會沿用）")
+    parser.add_argument("--output", default="benchmark-results.json", help="結果 JSON 檔")
+    parser.add_argument("--baseline", help="與此基準 JSON 比較，有退步時結束碼為 1")
+    parser.add_argument("--save-baseline", metavar="PATH", help="將本次結果另存為基準")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_case(json.loads(sys.stdin.read()))))
+        return 0
+
+    kinds = [kind for kind in args.kinds.split(",") if kind]
+    sizes = [size for size in args.sizes.split(",") if size]
+    print(f"準備語料（{args.corpus_dir}）…", file=sys.stderr)
+    documents = build_corpus(args.corpus_dir, kinds, sizes)
+    cases = [case for case in plan_cases(documents, args.ops.split(","), args.qualities.split(","))
+             if args.filter in case["id"]]
+
+    results = []
+    for case in cases:
+        runs = [run_in_subprocess(case, args.timeout) for _ in range(max(1, args.repeat))]
+        result = {"id": case["id"], "op": case["op"], "doc": case["doc"],
+                  **{key: case[key] for key in ("engine", "quality", "target_mb", "mode", "impl", "linearize") if key in case},
+                  **aggregate(runs)}
+        results.append(result)
+        print(format_row(result), file=sys.stderr)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(), "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.output}", file=sys.stderr)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"已儲存基準 {args.save_baseline}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("ghostscript", "cpu_count", "corpus_version", "settings"):
+            if baseline["environment"].get(key) != report["environment"].get(key):
+                print(f"⚠️ 執行環境不同（{key}），比較結果僅供參考", file=sys.stderr)
+        regressions = compare(results, baseline)
+        for regression in regressions:
+            print(f"退步：{regression['id']} {regression['metric']} "
+                  f"{regression['baseline']} → {regression['current']}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("沒有發現退步", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+PDF 工具箱引擎：壓縮、拆分、合併，不依賴 Streamlit，可直接在程式或命令列中使用
+
+    from pdftools import compress_pdf_file, split_pdf, merge_pdfs_streaming
+
+    stats = compress_pdf_file("input.pdf", "output.pdf", "medium", target_size_mb=4)
+
+命令列批次處理請執行 python -m pdftools --help
+
+各名稱在第一次取用時才載入所在模組，import pdftools 不會連帶載入 PyPDF2、Pillow 與 numpy。
+"""
+
+import importlib
+
+# 公開名稱 -> 所在模組
+_EXPORTS = {
+    "ZipStreamWriter": "archive", "create_zip": "archive", "spooled_zip": "archive",
+    "spooled_zip_files": "archive", "write_zip": "archive",
+    "CachedDocument": "cache", "CompressCache": "cache", "CompressHistory": "cache", "DocumentCache": "cache",
+    "compress_pdf": "compress", "compress_pdf_file": "compress", "optimize_pdf_lossless": "compress",
+    "SessionFile": "files", "StagedFile": "files",
+    "GsapiBackend": "ghostscript", "SubprocessBackend": "ghostscript", "build_gs_command": "ghostscript",
+    "create_gs_backend": "ghostscript",
+    "compress_image": "images", "compress_pdf_images": "images",
+    "first_page_bytes": "linearize", "is_linearized": "linearize", "linearize_pdf": "linearize",
+    "CompressCancelled": "jobs", "Job": "jobs", "JobScheduler": "jobs",
+    "merge_pdfs": "merge", "merge_pdfs_streaming": "merge",
+    "build_cost_profile": "preflight", "is_text_dominated": "preflight", "predict_compressed_size": "preflight",
+    "predict_quality_sizes": "preflight", "prune_candidates": "preflight",
+    "build_split_part": "split", "iter_split_parts": "split", "parse_page_intervals": "split",
+    "parse_page_range": "split", "plan_split": "split", "split_pdf": "split",
+    "format_size": "utils",
+    "StreamingPdfWriter": "writer",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
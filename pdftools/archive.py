@@ -0,0 +1,213 @@
+"""
+ZIP 打包：以標準函式庫 zipfile 寫入，依取樣結果逐項決定儲存或壓縮，多執行緒平行 Deflate
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Tuple
+
+from .config import MEMORY_BUFFER_MB, ZIP_LEVEL, ZIP_SAMPLE_KB, ZIP_STORE_RATIO, ZIP_WORKERS
+from .metrics import iter_paused, stage
+
+
+def should_deflate(sample: bytes) -> bool:
+    """以快速壓縮取樣資料，壓縮後仍大於 ZIP_STORE_RATIO 時不值得再花 CPU 壓縮"""
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * ZIP_STORE_RATIO
+
+
+def sample_bytes(data: bytes) -> bytes:
+    """取開頭、中間與結尾各一段作為樣本（PDF 的圖片串流常集中在檔案中段）"""
+    size = ZIP_SAMPLE_KB * 1024
+    if len(data) <= size * 3:
+        return data
+    middle = len(data) // 2
+    return data[:size] + data[middle:middle + size] + data[-size:]
+
+
+def sample_file(path: str) -> bytes:
+    """從檔案讀取開頭、中間與結尾的樣本"""
+    size = ZIP_SAMPLE_KB * 1024
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if file_size <= size * 3:
+            return f.read()
+        sample = f.read(size)
+        f.seek(file_size // 2)
+        sample += f.read(size)
+        f.seek(file_size - size)
+        return sample + f.read(size)
+
+
+def pack_entry(data: bytes, level: int = ZIP_LEVEL) -> Tuple[int, int, bytes]:
+    """決定單一項目的儲存方式並完成壓縮，回傳 (壓縮方式, CRC-32, 寫入的資料)
+
+    zlib 在壓縮與計算 CRC 時會釋放 GIL，可在多個執行緒平行執行。
+    """
+    crc = zlib.crc32(data)
+    if level > 0 and should_deflate(sample_bytes(data)):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        packed = compressor.compress(data) + compressor.flush()
+        if len(packed) < len(data):
+            return zipfile.ZIP_DEFLATED, crc, packed
+    return zipfile.ZIP_STORED, crc, data
+
+
+class ZipStreamWriter:
+    """依序寫入的 ZIP 寫入器，輸出可為不可搜尋的串流
+
+    實際格式交給 zipfile 處理（不可搜尋時改寫資料描述區，超過 4 GB 或 65535 個項目時使用 ZIP64），
+    這裡只依取樣結果決定每個項目要儲存還是 Deflate，並統計打包結果。
+    所有項目使用建立寫入器時的時間，內容相同時輸出的位元組也相同。
+    """
+
+    def __init__(self, output: BinaryIO, level: int = ZIP_LEVEL):
+        self.level = level
+        self._zip = zipfile.ZipFile(output, mode="w", allowZip64=True)
+        self._date_time = time.localtime()[:6]
+        self.counters = {"entries": 0, "stored": 0, "deflated": 0, "input_bytes": 0, "output_bytes": 0}
+
+    def _compress_type(self, sample: bytes) -> int:
+        return zipfile.ZIP_DEFLATED if self.level > 0 and should_deflate(sample) else zipfile.ZIP_STORED
+
+    def _record(self):
+        info = self._zip.infolist()[-1]
+        self.counters["entries"] += 1
+        self.counters["stored" if info.compress_type == zipfile.ZIP_STORED else "deflated"] += 1
+        self.counters["input_bytes"] += info.file_size
+        self.counters["output_bytes"] += info.compress_size
+
+    def add_packed(self, filename: str, compress_type: int, crc: int, size: int, data: bytes):
+        """寫入已由 pack_entry 處理好的項目
+
+        zipfile 只能在寫入時自行壓縮，沒有寫入已壓縮資料的公開介面；這裡比照 ZipFile._open_to_write
+        建立 ZipInfo 並直接寫出本地標頭與資料。CRC 與大小事先已知，不可搜尋的輸出也不需要資料描述區。
+        """
+        zf = self._zip
+        info = zipfile.ZipInfo(filename, date_time=self._date_time)
+        info.compress_type = compress_type
+        info.external_attr = 0o644 << 16
+        info.file_size = size
+        info.compress_size = len(data)
+        info.CRC = crc
+        zip64 = size > zipfile.ZIP64_LIMIT or len(data) > zipfile.ZIP64_LIMIT
+        with zf._lock:
+            if zf._seekable:
+                zf.fp.seek(zf.start_dir)
+            info.header_offset = zf.fp.tell()
+            zf._writecheck(info)
+            zf._didModify = True
+            zf.fp.write(info.FileHeader(zip64))
+            zf.fp.write(data)
+            zf.start_dir = zf.fp.tell()
+            zf.filelist.append(info)
+            zf.NameToInfo[info.filename] = info
+        self._record()
+
+    def add(self, filename: str, data: bytes):
+        """寫入記憶體中的資料"""
+        compress_type, crc, packed = pack_entry(data, self.level)
+        self.add_packed(filename, compress_type, crc, len(data), packed)
+
+    def add_file(self, filename: str, path: str):
+        """分段讀取磁碟上的檔案寫入，記憶體用量不隨檔案大小增加"""
+        self._zip.write(path, filename, compress_type=self._compress_type(sample_file(path)),
+                        compresslevel=self.level)
+        self._record()
+
+    def close(self):
+        """寫出中央目錄與結尾記錄（不關閉 output）"""
+        self._zip.close()
+
+    def abort(self):
+        """寫入失敗時放棄這份壓縮檔：輸出可能已無法寫入，結束時的錯誤一律忽略"""
+        with contextlib.suppress(Exception):
+            self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_zip(files: Iterable[Tuple[str, bytes]], output: BinaryIO, workers: int = ZIP_WORKERS) -> dict:
+    """將檔案依序寫入 ZIP，files 可為產生器；回傳打包統計
+
+    產生下一份檔案的同時，已產生的檔案在 workers 個執行緒中平行取樣並壓縮，依加入順序寫出，
+    最多同時保留 workers × 2 份在記憶體中；輸出與 workers 無關。
+    """
+    with stage("zip", workers=workers) as record:
+        counters = _write_zip(iter_paused(files, record), output, workers)
+        record.update(bytes_in=counters["input_bytes"], bytes_out=counters["output_bytes"],
+                      entries=counters["entries"], stored=counters["stored"])
+    return counters
+
+
+def _write_zip(files: Iterable[Tuple[str, bytes]], output: BinaryIO, workers: int) -> dict:
+    with ZipStreamWriter(output) as writer:
+        if workers <= 1:
+            for filename, content in files:
+                writer.add(filename, content)
+            return writer.counters
+
+        def write_next():
+            filename, size, future = in_flight.popleft()
+            compress_type, crc, packed = future.result()
+            writer.add_packed(filename, compress_type, crc, size, packed)
+
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for filename, content in files:
+                if len(content) < ZIP_SAMPLE_KB * 1024:
+                    # 小檔案直接處理，省下執行緒切換的成本
+                    future = Future()
+                    future.set_result(pack_entry(content, writer.level))
+                else:
+                    future = executor.submit(pack_entry, content, writer.level)
+                in_flight.append((filename, len(content), future))
+                # 依加入順序寫出，已完成的立即寫出，並限制積壓的份數
+                while in_flight and (in_flight[0][2].done() or len(in_flight) >= workers * 2):
+                    write_next()
+            while in_flight:
+                write_next()
+    return writer.counters
+
+
+def create_zip(files: Iterable[Tuple[str, bytes]]) -> bytes:
+    """將多個檔案打包成 ZIP"""
+    zip_buffer = io.BytesIO()
+    write_zip(files, zip_buffer)
+    return zip_buffer.getvalue()
+
+
+def spooled_zip_files(files: Iterable[Tuple[str, str]]) -> BinaryIO:
+    """將磁碟上的檔案 (ZIP 內檔名, 路徑) 逐一分段寫入暫存 ZIP，files 可為產生器；回傳已倒回開頭的檔案"""
+    output = tempfile.SpooledTemporaryFile(max_size=int(MEMORY_BUFFER_MB * 1024 * 1024))
+    with stage("zip", workers=1) as record:
+        with ZipStreamWriter(output) as writer:
+            for filename, path in iter_paused(files, record):
+                writer.add_file(filename, path)
+        record.update(bytes_in=writer.counters["input_bytes"], bytes_out=writer.counters["output_bytes"],
+                      entries=writer.counters["entries"], stored=writer.counters["stored"])
+    output.seek(0)
+    return output
+
+
+def spooled_zip(files: Iterable[Tuple[str, bytes]]) -> BinaryIO:
+    """將檔案串流寫入暫存 ZIP（超過記憶體上限時自動改存磁碟），回傳已倒回開頭的檔案"""
+    output = tempfile.SpooledTemporaryFile(max_size=int(MEMORY_BUFFER_MB * 1024 * 1024))
+    write_zip(files, output)
+    output.seek(0)
+    return output
@@ -0,0 +1,454 @@
+"""
+壓縮結果快取、壓縮紀錄與已解析文件快取
+"""
+
+import hashlib
+import math
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .config import HISTORY_MAX_SAMPLES, HISTORY_MIN_SAMPLES
+
+
+class CompressCache:
+    """壓縮結果快取：以內容雜湊為鍵，記憶體 LRU 並溢出至有上限的磁碟空間"""
+
+    def __init__(self, max_memory_bytes: int, max_disk_bytes: int, disk_dir: str,
+                 max_memory_entry_bytes: Optional[int] = None):
+        self.max_memory_bytes = max_memory_bytes
+        # 超過此大小的項目直接放在磁碟層，不佔用記憶體
+        self.max_memory_entry_bytes = min(max_memory_bytes, max_memory_entry_bytes or max_memory_bytes)
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = Path(disk_dir)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self.counters = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+        # 載入既有的磁碟快取（依修改時間排序，最舊的最先淘汰）
+        if self.max_disk_bytes > 0:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            entries = sorted(self.disk_dir.glob("*.pdf"), key=lambda p: p.stat().st_mtime)
+            for path in entries:
+                size = path.stat().st_size
+                self._disk[path.stem] = size
+                self._disk_bytes += size
+            self._evict_disk()
+
+    @staticmethod
+    def make_key(input_bytes: bytes, *params) -> str:
+        """以輸入內容的 SHA-256 與壓縮參數組成快取鍵"""
+        digest = hashlib.sha256(input_bytes).hexdigest()
+        suffix = "_".join(f"{p:g}" if isinstance(p, float) else str(p) for p in params)
+        return f"{digest}_{suffix}" if suffix else digest
+
+    @staticmethod
+    def make_file_key(path: str, *params) -> str:
+        """以檔案內容的 SHA-256（分段讀取）與壓縮參數組成快取鍵"""
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        suffix = "_".join(f"{p:g}" if isinstance(p, float) else str(p) for p in params)
+        return f"{sha.hexdigest()}_{suffix}" if suffix else sha.hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.pdf"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """查詢快取，未命中時回傳 None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.counters["hits"] += 1
+                self.counters["memory_hits"] += 1
+                return data
+
+            if key in self._disk:
+                path = self._disk_path(key)
+                try:
+                    data = path.read_bytes()
+                    os.utime(path)
+                except OSError:
+                    self._disk_bytes -= self._disk.pop(key)
+                    data = None
+                if data is not None:
+                    self._disk.move_to_end(key)
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                    self._put_memory(key, data)
+                    return data
+
+            self.counters["misses"] += 1
+            return None
+
+    def get_file(self, key: str, dest_path: str) -> bool:
+        """查詢快取並將結果寫入 dest_path；磁碟層的項目直接複製，不經過記憶體"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                with open(dest_path, "wb") as f:
+                    f.write(data)
+                self.counters["hits"] += 1
+                self.counters["memory_hits"] += 1
+                return True
+
+            if key in self._disk:
+                path = self._disk_path(key)
+                try:
+                    shutil.copyfile(path, dest_path)
+                    os.utime(path)
+                except OSError:
+                    self._disk_bytes -= self._disk.pop(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                    return True
+
+            self.counters["misses"] += 1
+            return False
+
+    def put(self, key: str, data: bytes):
+        """寫入快取"""
+        with self._lock:
+            if key in self._memory:
+                return
+            if len(data) > self.max_memory_entry_bytes:
+                self._spill(key, data)
+            else:
+                self._put_memory(key, data)
+
+    def put_file(self, key: str, path: str):
+        """以檔案寫入快取；大型檔案直接複製到磁碟層"""
+        size = os.path.getsize(path)
+        if size <= self.max_memory_entry_bytes:
+            with open(path, "rb") as f:
+                self.put(key, f.read())
+            return
+
+        with self._lock:
+            if key in self._disk or self.max_disk_bytes <= 0 or size > self.max_disk_bytes:
+                return
+            disk_path = self._disk_path(key)
+            tmp_path = disk_path.with_suffix(".tmp")
+            try:
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, disk_path)
+            except OSError:
+                return
+            self._disk[key] = size
+            self._disk_bytes += size
+            self._evict_disk()
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.max_memory_entry_bytes:
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            old_key, old_data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_data)
+            self.counters["memory_evictions"] += 1
+            self._spill(old_key, old_data)
+
+    def _spill(self, key: str, data: bytes):
+        """將資料寫入磁碟層"""
+        if self.max_disk_bytes <= 0 or len(data) > self.max_disk_bytes:
+            return
+        if key in self._disk:
+            self._disk.move_to_end(key)
+            return
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        self._disk[key] = len(data)
+        self._disk_bytes += len(data)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.counters["disk_evictions"] += 1
+            try:
+                self._disk_path(old_key).unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        """回傳快取計數與目前用量"""
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+class CompressHistory:
+    """壓縮紀錄：記錄每次 Ghostscript 執行的文件特徵、參數與結果大小，並以最小平方法迴歸預測結果大小
+
+    模型以 log(結果大小) 為目標，特徵為預檢預估大小、原始大小、圖片比例與參數本身，
+    讓預檢的經驗公式依實際結果自動校正。兩個資料表都只保留最近 HISTORY_MAX_SAMPLES 筆。
+    """
+
+    # 目標大小模式可選擇的參數組合
+    DPI_CHOICES = (150, 120, 100, 90, 72, 60, 50, 40, 36)
+    QUALITY_CHOICES = (75, 60, 50, 40, 30, 20)
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._model = None
+        self._model_samples = -1
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "id INTEGER PRIMARY KEY, created REAL, file_size INTEGER, image_bytes INTEGER, "
+                "predicted_size INTEGER, dpi INTEGER, jpeg_quality INTEGER, output_size INTEGER)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS requests ("
+                "id INTEGER PRIMARY KEY, created REAL, target_size INTEGER, passes INTEGER, "
+                "met INTEGER, learned INTEGER)"
+            )
+
+    @staticmethod
+    def features(file_size: int, image_bytes: int, predicted_size: int, dpi: int, jpeg_quality: int) -> List[float]:
+        return [
+            1.0,
+            math.log(max(predicted_size, 1)),
+            math.log(max(file_size, 1)),
+            image_bytes / max(file_size, 1),
+            math.log(max(dpi, 1)),
+            jpeg_quality / 100,
+        ]
+
+    def record_run(self, profile: dict, dpi: int, jpeg_quality: int, output_size: int):
+        """記錄一次 Ghostscript 執行結果"""
+        from .preflight import predict_compressed_size
+
+        predicted = predict_compressed_size(profile, dpi, jpeg_quality)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO runs (created, file_size, image_bytes, predicted_size, dpi, jpeg_quality, output_size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), profile["file_size"], profile["image_bytes"], predicted, dpi, jpeg_quality, output_size)
+            )
+            self._prune("runs")
+
+    def record_request(self, target_size: int, passes: int, met: bool, learned: bool):
+        """記錄一次目標大小請求的執行次數與是否達標"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO requests (created, target_size, passes, met, learned) VALUES (?, ?, ?, ?, ?)",
+                (time.time(), target_size, passes, int(met), int(learned))
+            )
+            self._prune("requests")
+
+    def _prune(self, table: str):
+        """刪除最近 HISTORY_MAX_SAMPLES 筆以前的紀錄（呼叫端持有鎖與交易）"""
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE id <= (SELECT MAX(id) FROM {table}) - ?", (HISTORY_MAX_SAMPLES,)
+        )
+
+    def _fit(self) -> Optional[Tuple[List[float], float]]:
+        """以最近的紀錄重新擬合；紀錄數沒變時沿用上次的結果"""
+        import numpy as np
+
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            if count == self._model_samples:
+                return self._model
+            rows = self._conn.execute(
+                "SELECT file_size, image_bytes, predicted_size, dpi, jpeg_quality, output_size "
+                "FROM runs ORDER BY id DESC LIMIT ?", (HISTORY_MAX_SAMPLES,)
+            ).fetchall()
+
+        model = None
+        if len(rows) >= HISTORY_MIN_SAMPLES:
+            x = np.array([self.features(*row[:5]) for row in rows])
+            y = np.array([math.log(max(row[5], 1)) for row in rows])
+            coef, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+            residuals = y - x @ coef
+            sigma = float(np.sqrt(np.mean(residuals ** 2)))
+            model = (coef.tolist(), sigma)
+
+        with self._lock:
+            self._model = model
+            self._model_samples = count
+        return model
+
+    def choose_params(self, profile: dict, target_size: int) -> Optional[Tuple[int, int]]:
+        """挑選預估結果最接近但不超過目標的 (dpi, JPEG 品質)；紀錄不足或都不符合時回傳 None
+
+        預留一個殘差標準差的餘裕，讓第一次執行就落在目標以下的機率較高。
+        """
+        model = self._fit()
+        if model is None:
+            return None
+        from .preflight import predict_compressed_size
+
+        coef, sigma = model
+        budget = math.log(max(target_size, 1)) - sigma
+        best = None
+        for dpi in self.DPI_CHOICES:
+            for jpeg_quality in self.QUALITY_CHOICES:
+                predicted = predict_compressed_size(profile, dpi, jpeg_quality)
+                features = self.features(profile["file_size"], profile["image_bytes"], predicted, dpi, jpeg_quality)
+                log_size = sum(c * f for c, f in zip(coef, features))
+                if log_size <= budget and (best is None or log_size > best[0]):
+                    best = (log_size, (dpi, jpeg_quality))
+        return best[1] if best is not None else None
+
+    def stats(self) -> dict:
+        """統計資料：紀錄筆數、首次即達標的比例與平均執行次數"""
+        with self._lock:
+            samples = self._conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            requests, avg_passes, met, first_hits, learned = self._conn.execute(
+                "SELECT COUNT(*), AVG(passes), SUM(met), SUM(met AND passes = 1), SUM(learned) FROM requests"
+            ).fetchone()
+        return {
+            "samples": samples,
+            "model_ready": samples >= HISTORY_MIN_SAMPLES,
+            "requests": requests,
+            "avg_passes": avg_passes or 0.0,
+            "met_rate": (met or 0) / requests if requests else 0.0,
+            "hit_rate": (first_hits or 0) / requests if requests else 0.0,
+            "learned": learned or 0,
+        }
+
+
+class CachedDocument:
+    """已解析的 PDF：保留 PdfReader 與頁面資訊，讀取端需持有 lock（PdfReader 非執行緒安全）
+
+    file 為已寫到磁碟的暫存檔（具有 path、size() 與 close()），文件關閉時一併刪除。
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.size = file.size()
+        self.lock = threading.RLock()
+        self.closed = False
+        # 由 DocumentCache 維護：目前持有此文件的使用者數，以及是否已被淘汰
+        self.users = 0
+        self.evicted = False
+        self._handle = open(file.path, "rb")
+        try:
+            from PyPDF2 import PdfReader
+
+            self.reader = PdfReader(self._handle)
+            self.page_count = len(self.reader.pages)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self._handle.close()
+            self.file.close()
+
+
+class DocumentCache:
+    """跨工作階段共用的已解析文件快取，依檔案大小做 LRU 淘汰
+
+    文件只在 hold() 區塊內保證開啟。被淘汰的文件若仍有人持有，等最後一個使用者離開時才關閉；
+    呼叫端不可保存文件物件，之後需要時以同一個鍵重新取得（已淘汰時會重新解析）。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CachedDocument]" = OrderedDict()
+        self._bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @contextmanager
+    def hold(self, key: str, load: Callable[[], CachedDocument]) -> Iterator[CachedDocument]:
+        """取得 key 對應的文件並在區塊內保持開啟；未命中時以 load() 解析並加入快取"""
+        doc = self._acquire(key, load)
+        try:
+            yield doc
+        finally:
+            self._release(doc)
+
+    def _acquire(self, key: str, load: Callable[[], CachedDocument]) -> CachedDocument:
+        with self._lock:
+            doc = self._entries.get(key)
+            if doc is not None:
+                self._entries.move_to_end(key)
+                doc.users += 1
+                self.counters["hits"] += 1
+                return doc
+            self.counters["misses"] += 1
+
+        doc = load()
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None:
+                # 其他執行緒已先解析同一份文件
+                existing.users += 1
+                closable = [doc]
+                doc = existing
+            else:
+                doc.users += 1
+                self._entries[key] = doc
+                self._bytes += doc.size
+                closable = self._evict()
+        for old_doc in closable:
+            old_doc.close()
+        return doc
+
+    def _evict(self) -> List[CachedDocument]:
+        """淘汰超出上限的文件（至少保留最新加入的一份），回傳沒有人持有、可以立即關閉的文件"""
+        closable = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, old_doc = self._entries.popitem(last=False)
+            self._bytes -= old_doc.size
+            self.counters["evictions"] += 1
+            old_doc.evicted = True
+            if old_doc.users == 0:
+                closable.append(old_doc)
+        return closable
+
+    def _release(self, doc: CachedDocument):
+        with self._lock:
+            doc.users -= 1
+            close = doc.evicted and doc.users == 0
+        if close:
+            doc.close()
+
+    def stats(self) -> dict:
+        """回傳快取計數與目前用量"""
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "bytes": self._bytes}
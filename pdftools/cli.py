@@ -0,0 +1,409 @@
+"""
+命令列批次處理：python -m pdftools compress|split|merge
+
+輸入可為檔案、資料夾（遞迴尋找 .pdf）或萬用字元樣式；
+compress 與 split 以多個行程平行處理，每個檔案可設定逾時，
+--json 會輸出每個檔案的大小與耗時摘要，方便排程或 CI 使用。
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing.util
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+
+from . import metrics
+from .cache import CompressCache, CompressHistory
+from .compress import compress_pdf_file
+from .config import CACHE_DIR, CACHE_DISK_MB, GS_MAX_WORKERS, QUALITY_SETTINGS
+from .ghostscript import create_gs_backend
+from .jobs import CompressCancelled
+from .merge import merge_pdfs_streaming
+from .split import build_split_part, plan_split
+from .utils import format_size
+
+SPLIT_MODES = ["all", "range", "chunk", "size", "bookmark"]
+
+
+def collect_inputs(patterns: List[str]) -> List[Tuple[str, str]]:
+    """展開輸入為 (檔案路徑, 相對輸出路徑) 清單；資料夾內的檔案保留子資料夾結構"""
+    inputs = []
+    seen = set()
+
+    def add(path: str, relative: str):
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            inputs.append((path, relative))
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        path = os.path.join(root, name)
+                        add(path, os.path.relpath(path, pattern))
+        elif os.path.isfile(pattern):
+            add(pattern, os.path.basename(pattern))
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path):
+                    add(path, os.path.basename(path))
+    return inputs
+
+
+@contextmanager
+def atomic_output(path: str):
+    """產生與 path 同資料夾的暫存檔路徑，區塊正常結束時才以 os.replace 換成 path
+
+    逾時、錯誤或 Ctrl+C 中止時刪除暫存檔，不會留下寫到一半的輸出；區塊內刪除暫存檔表示放棄這次輸出。
+    """
+    # 只產生名稱不預先建立（mkstemp 建立的檔案權限為 0600，換上去後輸出檔會變成只有自己可讀）
+    temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{uuid.uuid4().hex[:12]}.part")
+    try:
+        yield temp_path
+        if os.path.exists(temp_path):
+            os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _run_with_timeout(timeout: float, func, *args, **kwargs):
+    """執行 func 並在逾時後設定 cancel_event
+
+    Ghostscript、qpdf 與圖片壓縮立即中止；預檢、無損最佳化與拆分在處理下一頁前中止（拋出 CompressCancelled）。
+    """
+    cancel_event = threading.Event()
+    timer = threading.Timer(timeout, cancel_event.set) if timeout > 0 else None
+    if timer is not None:
+        timer.daemon = True
+        timer.start()
+    try:
+        return func(*args, cancel_event=cancel_event, **kwargs)
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+# 工作行程共用的 Ghostscript 執行引擎（gsapi 時為常駐的工作程序池），每個行程只建立一次
+_backend = None
+
+
+def init_worker():
+    """工作行程初始化：建立 Ghostscript 執行引擎，行程結束時關閉"""
+    global _backend
+    if _backend is None:
+        _backend = create_gs_backend()
+        # 行程池的工作行程結束時不執行 atexit，改以 multiprocessing 的結束處理關閉
+        multiprocessing.util.Finalize(_backend, _backend.close, exitpriority=10)
+
+
+def close_worker():
+    """關閉本行程的 Ghostscript 執行引擎"""
+    global _backend
+    if _backend is not None:
+        _backend.close()
+        _backend = None
+
+
+def compress_one(input_path: str, output_path: str, options: dict) -> dict:
+    """壓縮單一檔案（在工作行程中執行），回傳摘要"""
+    start = time.monotonic()
+    result = {"input": input_path, "output": output_path}
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        cache = None
+        if options["cache_dir"]:
+            # 各行程只使用磁碟層，啟動時會載入其他行程已寫入的結果
+            cache = CompressCache(0, int(options["cache_mb"] * 1024 * 1024), options["cache_dir"])
+        history = CompressHistory(options["history"]) if options["history"] else None
+        init_worker()
+        with atomic_output(output_path) as temp_path:
+            stats = _run_with_timeout(
+                options["timeout"], compress_pdf_file, input_path, temp_path, options["quality"],
+                options["target_mb"], cache=cache, backend=_backend, engine=options["engine"],
+                history=history, linearize=options["linearize"]
+            )
+            result.update(stats)
+            result["status"] = "ok" if stats["outcome"] == "success" else stats["outcome"]
+            if result["status"] != "ok":
+                os.remove(temp_path)
+    except CompressCancelled:
+        result["status"] = "timeout"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    result["seconds"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def _split_file(input_path: str, output_dir: str, options: dict, cancel_event: threading.Event) -> List[dict]:
+    """依 options 拆分 input_path，每份寫成 output_dir 下的一個檔案，回傳各份的摘要"""
+    reader = PdfReader(input_path)
+    parts = plan_split(reader, options["mode"], options["range"],
+                       chunk_pages=options["chunk_pages"], chunk_mb=options["chunk_mb"])
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for filename, page_indices in parts:
+        if cancel_event.is_set():
+            raise CompressCancelled()
+        path = os.path.join(output_dir, filename)
+        with atomic_output(path) as temp_path, open(temp_path, "wb") as handle:
+            handle.write(build_split_part(reader, page_indices, cancel_event))
+        outputs.append({"file": path, "pages": len(page_indices), "size": os.path.getsize(path)})
+    return outputs
+
+
+def split_one(input_path: str, output_dir: str, options: dict) -> dict:
+    """拆分單一檔案至 output_dir（在工作行程中執行），回傳摘要；逾時前已完成的各份會保留"""
+    start = time.monotonic()
+    result = {"input": input_path, "output": output_dir}
+    try:
+        outputs = _run_with_timeout(options["timeout"], _split_file, input_path, output_dir, options)
+        result.update(status="ok", original_size=os.path.getsize(input_path), parts=outputs)
+    except CompressCancelled:
+        result["status"] = "timeout"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+    result["seconds"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def run_batch(func, tasks: List[Tuple[str, str]], options: dict, jobs: int, on_result,
+              initializer=None) -> List[dict]:
+    """以多個行程平行執行 func(輸入, 輸出, options)，依輸入順序回傳結果；initializer 在每個工作行程啟動時執行"""
+    if jobs <= 1 or len(tasks) <= 1:
+        results = []
+        for input_path, output_path in tasks:
+            results.append(func(input_path, output_path, options))
+            on_result(results[-1])
+        return results
+
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=initializer) as executor:
+        futures = {
+            executor.submit(func, input_path, output_path, options): index
+            for index, (input_path, output_path) in enumerate(tasks)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = {"input": tasks[index][0], "output": tasks[index][1], "status": "error",
+                                  "error": str(e)}
+            on_result(results[index])
+    return results
+
+
+def print_result(result: dict, stream=sys.stderr):
+    """輸出單一檔案的處理結果"""
+    status = result["status"]
+    line = f"[{status}] {result['input']}"
+    if "compressed_size" in result:
+        engine = result.get("engine") or "cache"
+        if result.get("fallback") and result.get("gs_timed_out"):
+            engine += "，Ghostscript 逾時"
+        line += (f"  {format_size(result['original_size'])} → {format_size(result['compressed_size'])}"
+                 f" (-{result['reduction']:.1f}%, {engine})")
+    elif "parts" in result:
+        line += f"  → {len(result['parts'])} 個檔案"
+    if result.get("error"):
+        line += f"  {result['error']}"
+    if "seconds" in result:
+        line += f"  {result['seconds']:.1f}s"
+    print(line, file=stream)
+
+
+def summarize(results: List[dict], elapsed: float) -> dict:
+    """彙整批次結果"""
+    totals = {
+        "files": len(results),
+        "ok": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] in ("error", "failed")),
+        "timeout": sum(1 for r in results if r["status"] == "timeout"),
+        "original_size": sum(r.get("original_size", 0) for r in results),
+        "seconds": round(elapsed, 3),
+    }
+    if any("compressed_size" in r for r in results):
+        totals["compressed_size"] = sum(r.get("compressed_size", r.get("original_size", 0)) for r in results)
+    return {"results": results, "totals": totals}
+
+
+def write_summary(summary: dict, path: Optional[str]):
+    """將摘要以 JSON 寫入檔案，路徑為 - 時輸出至 stdout"""
+    if path is None:
+        return
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if path == "-":
+        print(text)
+    else:
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(text)
+
+
+def cmd_compress(args) -> int:
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("找不到任何 PDF 檔案", file=sys.stderr)
+        return 2
+
+    tasks = []
+    for input_path, relative in inputs:
+        stem, ext = os.path.splitext(relative)
+        tasks.append((input_path, os.path.join(args.output_dir, f"{stem}{args.suffix}{ext}")))
+
+    options = {
+        "quality": args.quality,
+        "target_mb": args.target_mb,
+        "engine": args.engine,
+        "timeout": args.timeout,
+        "cache_dir": args.cache_dir,
+        "cache_mb": args.cache_mb,
+        "history": args.history,
+        "linearize": args.linearize,
+    }
+    start = time.monotonic()
+    try:
+        results = run_batch(compress_one, tasks, options, args.jobs, print_result, initializer=init_worker)
+    finally:
+        # 只有一個行程時引擎建立在本行程
+        close_worker()
+    summary = summarize(results, time.monotonic() - start)
+    write_summary(summary, args.json)
+
+    totals = summary["totals"]
+    print(f"完成 {totals['ok']}/{totals['files']} 個檔案，"
+          f"{format_size(totals['original_size'])} → {format_size(totals.get('compressed_size', 0))}，"
+          f"耗時 {totals['seconds']:.1f} 秒", file=sys.stderr)
+    return 0 if totals["ok"] == totals["files"] else 1
+
+
+def cmd_split(args) -> int:
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("找不到任何 PDF 檔案", file=sys.stderr)
+        return 2
+
+    # 每個輸入檔拆分至各自的子資料夾
+    tasks = [(input_path, os.path.join(args.output_dir, os.path.splitext(relative)[0]))
+             for input_path, relative in inputs]
+    options = {
+        "mode": args.mode,
+        "range": args.range,
+        "chunk_pages": args.chunk_pages,
+        "chunk_mb": args.chunk_mb,
+        "timeout": args.timeout,
+    }
+    start = time.monotonic()
+    results = run_batch(split_one, tasks, options, args.jobs, print_result)
+    summary = summarize(results, time.monotonic() - start)
+    write_summary(summary, args.json)
+
+    totals = summary["totals"]
+    print(f"完成 {totals['ok']}/{totals['files']} 個檔案，耗時 {totals['seconds']:.1f} 秒", file=sys.stderr)
+    return 0 if totals["ok"] == totals["files"] else 1
+
+
+def cmd_merge(args) -> int:
+    inputs = collect_inputs(args.inputs)
+    if len(inputs) < 2:
+        print("請至少提供 2 個 PDF 檔案", file=sys.stderr)
+        return 2
+
+    start = time.monotonic()
+    handles = []
+    try:
+        handles = [open(input_path, "rb") for input_path, _ in inputs]
+        output, stats = merge_pdfs_streaming(handles, dedupe=not args.no_dedupe, linearize=args.linearize)
+        with output, atomic_output(args.output) as temp_path, open(temp_path, "wb") as target:
+            while True:
+                chunk = output.read(1024 * 1024)
+                if not chunk:
+                    break
+                target.write(chunk)
+    except Exception as e:
+        print(f"合併失敗：{e}", file=sys.stderr)
+        return 1
+    finally:
+        for handle in handles:
+            handle.close()
+
+    summary = {
+        "inputs": [input_path for input_path, _ in inputs],
+        "output": args.output,
+        "original_size": sum(os.path.getsize(input_path) for input_path, _ in inputs),
+        "seconds": round(time.monotonic() - start, 3),
+        **stats,
+    }
+    write_summary(summary, args.json)
+    print(f"已合併 {len(inputs)} 個檔案（{stats['pages']} 頁）→ {args.output}，"
+          f"{format_size(stats['output_size'])}，耗時 {summary['seconds']:.1f} 秒", file=sys.stderr)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m pdftools", description="PDF 壓縮、拆分、合併批次工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_batch_options(sub, default_jobs: int, jobs_help: str):
+        sub.add_argument("inputs", nargs="+", help="PDF 檔案、資料夾或萬用字元樣式（如 'scans/**/*.pdf'）")
+        sub.add_argument("-o", "--output-dir", required=True, help="輸出資料夾")
+        sub.add_argument("-j", "--jobs", type=int, default=default_jobs, help=jobs_help)
+        sub.add_argument("--timeout", type=float, default=0,
+                         help="每個檔案的逾時秒數（0 表示不限）：Ghostscript、qpdf 與圖片壓縮立即中止，"
+                              "其餘步驟在處理下一頁前中止")
+        sub.add_argument("--json", metavar="PATH", help="將處理摘要寫成 JSON（- 表示輸出至 stdout）")
+
+    compress = subparsers.add_parser("compress", help="壓縮 PDF")
+    # 每個檔案最多同時執行 GS_MAX_WORKERS 個 gs，預設行程數讓兩者相乘不超過 CPU 核心數
+    add_batch_options(compress, max(1, (os.cpu_count() or 1) // GS_MAX_WORKERS),
+                      f"平行處理的行程數（預設為 CPU 核心數 ÷ PDF_GS_WORKERS，目前每個檔案最多 {GS_MAX_WORKERS} 個 gs）")
+    compress.add_argument("-q", "--quality", choices=list(QUALITY_SETTINGS), default="medium", help="壓縮程度")
+    compress.add_argument("-t", "--target-mb", type=float, default=0, help="目標檔案大小（MB，0 表示不限）")
+    compress.add_argument("-e", "--engine", choices=["ghostscript", "image", "scan", "lossless"],
+                          default="ghostscript", help="壓縮引擎（scan 為掃描檔模式，黑白與灰階頁面改存 1 位元或灰階）")
+    compress.add_argument("--suffix", default="_compressed", help="輸出檔名後綴")
+    compress.add_argument("--cache-dir", nargs="?", const=CACHE_DIR, default=None,
+                          help="啟用磁碟快取（可指定資料夾）")
+    compress.add_argument("--cache-mb", type=float, default=CACHE_DISK_MB or 2048,
+                          help="磁碟快取上限（MB，預設取 PDF_CACHE_DISK_MB，未設定時為 2048）")
+    compress.add_argument("--history", metavar="DB", help="目標大小參數學習紀錄（SQLite 檔案）")
+    compress.add_argument("--linearize", action="store_true", help="輸出線性化檔案（快速網頁檢視）")
+    compress.set_defaults(func=cmd_compress)
+
+    split = subparsers.add_parser("split", help="拆分 PDF")
+    add_batch_options(split, os.cpu_count() or 1, "平行處理的行程數（預設為 CPU 核心數）")
+    split.add_argument("-m", "--mode", choices=SPLIT_MODES, default="all", help="拆分方式")
+    split.add_argument("-r", "--range", default="", help="頁數範圍，例如 1-3, 5, 7-10（range 模式）")
+    split.add_argument("--chunk-pages", type=int, default=10, help="每份頁數（chunk 模式）")
+    split.add_argument("--chunk-mb", type=float, default=5.0, help="每份大小上限 MB（size 模式）")
+    split.set_defaults(func=cmd_split)
+
+    merge = subparsers.add_parser("merge", help="依序合併多個 PDF")
+    merge.add_argument("inputs", nargs="+", help="PDF 檔案、資料夾或萬用字元樣式")
+    merge.add_argument("-o", "--output", required=True, help="輸出檔案")
+    merge.add_argument("--no-dedupe", action="store_true", help="不去除重複的字型與圖片")
+    merge.add_argument("--linearize", action="store_true", help="輸出線性化檔案（快速網頁檢視）")
+    merge.add_argument("--json", metavar="PATH", help="將處理摘要寫成 JSON（- 表示輸出至 stdout）")
+    merge.set_defaults(func=cmd_merge)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    metrics.configure_log()
+    return args.func(args)
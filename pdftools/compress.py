@@ -0,0 +1,612 @@
+"""
+PDF 壓縮：Ghostscript、圖片重新壓縮與無損最佳化三種引擎
+"""
+
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional, Tuple
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from .cache import CompressCache, CompressHistory
+from .config import (GS_MAX_WORKERS, GS_REFINE_ROUNDS, GS_REFINE_TOLERANCE, GS_SHARD_MIN_MB, GS_SHARD_MIN_PAGES,
+                     PREFLIGHT_MIN_GAIN, QUALITY_SETTINGS)
+from .files import StagedFile, path_fds
+from .ghostscript import GsPageCounter, SubprocessBackend, build_gs_command, interpolate_params, plan_shards
+from .jobs import CompressCancelled
+from .linearize import first_page_bytes, is_linearized, linearize_in_place
+from .metrics import stage
+from .preflight import build_cost_profile, is_text_dominated, predict_compressed_size, prune_candidates
+from .writer import StreamingPdfWriter
+
+logger = logging.getLogger(__name__)
+
+
+def copy_outline(reader: PdfReader, writer: PdfWriter, outline: Optional[list] = None, parent=None):
+    """將原始檔案的書籤複製到新檔案（頁碼需一一對應）"""
+    if outline is None:
+        outline = reader.outline
+    last_item = None
+    for item in outline:
+        if isinstance(item, list):
+            # 子書籤緊接在父書籤之後
+            if last_item is not None:
+                copy_outline(reader, writer, item, last_item)
+            continue
+        try:
+            page_number = reader.get_destination_page_number(item)
+        except Exception:
+            page_number = None
+        if page_number is None or not 0 <= page_number < len(writer.pages):
+            last_item = None
+            continue
+        last_item = writer.add_outline_item(item.title, page_number, parent=parent)
+
+
+def merge_shards(shard_paths: List[str], reader: PdfReader, output_path: str):
+    """依序合併分段壓縮結果，並還原原始書籤"""
+    writer = PdfWriter()
+    handles = []
+    try:
+        for path in shard_paths:
+            # 以檔案物件交給 PyPDF2，避免整份讀入記憶體；分段內的連結註解會隨頁面保留
+            handle = open(path, "rb")
+            handles.append(handle)
+            writer.append(handle, import_outline=False)
+        try:
+            copy_outline(reader, writer)
+        except Exception:
+            pass
+
+        with open(output_path, "wb") as output:
+            writer.write(output)
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def compress_outcome(stats: dict) -> str:
+    """效能紀錄用的結果分類：cache_hit / success / original（未能變小而輸出原檔）/ fallback（改用圖片引擎）/
+    timeout / failed"""
+    if stats["cache_hit"]:
+        return "cache_hit"
+    if stats["outcome"] != "success":
+        return stats["outcome"]
+    if stats["fallback"]:
+        return "fallback"
+    if stats["compressed_size"] >= stats["original_size"]:
+        return "original"
+    return "success"
+
+
+def compress_pdf_file(input_path: str, output_path: str, quality: str, target_size_mb: float = 0,
+                      cache: Optional[CompressCache] = None, backend=None,
+                      cancel_event: Optional[threading.Event] = None, on_progress=None,
+                      engine: str = "ghostscript", history: Optional[CompressHistory] = None,
+                      linearize: bool = False, profile: Optional[dict] = None) -> dict:
+    """壓縮 PDF 檔案，結果寫入 output_path
+
+    engine 為 ghostscript（重新產生整份文件）、image（只重新壓縮圖片）、scan（掃描檔模式，
+    黑白與灰階頁面改存 1 位元或灰階圖片）或 lossless（無損最佳化）；
+    Ghostscript 無法執行或逾時時自動改用圖片重新壓縮。
+    全程以檔案路徑交給 Ghostscript 與 PyPDF2，記憶體用量不隨檔案大小增加。
+    on_progress(已處理頁數, 總頁數) 會在每處理完一頁時被呼叫。
+    傳入 history 時會記錄每次 Ghostscript 的結果，目標大小模式並依紀錄挑選第一組參數。
+    linearize 為 True 時輸出線性化（快速網頁檢視）的檔案，瀏覽器下載到第一頁所需的部分就能開始顯示。
+    profile 為呼叫端已對同一份輸入算好的預檢結果（build_cost_profile），傳入時不再重新分析。
+    整體與每次 Ghostscript 執行都會寫入效能紀錄（pdftools.metrics）。
+    """
+    with stage("compress", os.path.getsize(input_path), quality=quality, target_mb=target_size_mb,
+               engine=engine) as record:
+        stats = _compress_pdf_file(input_path, output_path, quality, target_size_mb, cache, backend,
+                                   cancel_event, on_progress, engine, history, linearize, profile)
+        record.update(outcome=compress_outcome(stats), bytes_out=stats["compressed_size"], used_engine=stats["engine"],
+                      gs_passes=stats["gs_passes"], child_cpu_s=stats["gs_cpu_s"],
+                      child_max_rss_kb=stats["gs_max_rss_kb"], gs_timed_out=stats["gs_timed_out"],
+                      linearized=stats["linearized"],
+                      first_page_bytes=stats["first_page_bytes"])
+        if stats["error"]:
+            record["error"] = stats["error"]
+    return stats
+
+
+def _compress_pdf_file(input_path: str, output_path: str, quality: str, target_size_mb: float,
+                       cache: Optional[CompressCache], backend, cancel_event: Optional[threading.Event],
+                       on_progress, engine: str, history: Optional[CompressHistory], linearize: bool,
+                       profile: Optional[dict]) -> dict:
+    original_size = os.path.getsize(input_path)
+    if backend is None:
+        backend = SubprocessBackend()
+
+    cache_key = None
+    if cache is not None:
+        cache_key = CompressCache.make_file_key(input_path, quality, float(target_size_mb), engine,
+                                                *(("linearized",) if linearize else ()))
+        if cache.get_file(cache_key, output_path):
+            compressed_size = os.path.getsize(output_path)
+            reduction = ((original_size - compressed_size) / original_size) * 100 if original_size > 0 else 0
+            return {
+                "original_size": original_size,
+                "compressed_size": compressed_size,
+                "reduction": reduction,
+                "cache_hit": True,
+                "outcome": "success",
+                "engine": None,
+                "fallback": False,
+                "gs_timed_out": False,
+                "predicted_size": None,
+                "skipped_runs": 0,
+                "gs_passes": 0,
+                "gs_cpu_s": 0.0,
+                "gs_max_rss_kb": 0,
+                "scan": None,
+                "linearized": is_linearized(output_path),
+                "first_page_bytes": first_page_bytes(output_path),
+                "error": None
+            }
+
+    settings = QUALITY_SETTINGS.get(quality, QUALITY_SETTINGS["medium"])
+
+    # 預檢檔案結構（只解析不轉換），用來預估壓縮效果並略過不必要的執行；呼叫端已預檢過時直接沿用
+    predicted_size = None
+    skipped_runs = 0
+    if engine == "ghostscript":
+        try:
+            if profile is None:
+                with stage("preflight", original_size):
+                    profile = build_cost_profile(input_path, cancel_event)
+            predicted_size = predict_compressed_size(profile, settings["dpi"], settings["image_quality"])
+        except CompressCancelled:
+            raise
+        except Exception:
+            profile = None
+    else:
+        profile = None
+
+    # 記錄 Ghostscript 是否曾執行失敗或逾時（失敗的結果不寫入快取）
+    gs_failed = False
+    gs_timed_out = False
+    # 實際啟動的 Ghostscript 執行次數，以及所有 gs 程序的 CPU 秒數合計與最高記憶體
+    gs_passes = 0
+    gs_usage = {"cpu_s": 0.0, "max_rss_kb": 0}
+    error = None
+    # 掃描檔模式下各類圖片（bitonal / gray / color）重新編碼的張數
+    scan_counts = None
+    linearized = False
+
+    # 各次 gs 執行的頁數進度；平行執行時回報進度最快的一組
+    progress_lock = threading.Lock()
+    progress_runs = []
+
+    def report_progress():
+        if on_progress is None:
+            return
+        with progress_lock:
+            runs = [(sum(c.done for c in run), sum(c.total for c in run)) for run in progress_runs]
+        done, total = max(runs, key=lambda p: p[0] / p[1] if p[1] else 0, default=(0, 0))
+        on_progress(done, total)
+
+    def new_page_counters(totals: List[int]) -> List[GsPageCounter]:
+        counters = [GsPageCounter(report_progress, total) for total in totals]
+        with progress_lock:
+            progress_runs.append(counters)
+        return counters
+
+    def run_backend(gs_command: List[str], run_cancel: Optional[threading.Event], pass_fds: Tuple[int, ...],
+                    on_output, output: StagedFile, **fields) -> str:
+        """執行一次 gs，並記錄耗時、輸出大小與 gs 程序的 CPU 與記憶體"""
+        usage = {}
+        with stage("gs", original_size, backend=getattr(backend, "name", None), **fields) as record:
+            outcome = backend.run(gs_command, run_cancel, pass_fds, on_output, usage=usage)
+            record.update(outcome="success" if outcome == "done" else outcome,
+                          child_cpu_s=round(usage.get("cpu_s", 0.0), 6), child_max_rss_kb=usage.get("max_rss_kb"))
+            if outcome == "done":
+                record["bytes_out"] = output.size()
+        with progress_lock:
+            gs_usage["cpu_s"] += usage.get("cpu_s", 0.0)
+            gs_usage["max_rss_kb"] = max(gs_usage["max_rss_kb"], usage.get("max_rss_kb", 0))
+        return outcome
+
+    input_fds = path_fds(input_path)
+
+    # 大型檔案改用分段平行壓縮
+    input_handle = None
+    reader = None
+    shards = []
+    if GS_MAX_WORKERS > 1 and original_size >= GS_SHARD_MIN_MB * 1024 * 1024:
+        try:
+            # 傳入檔案物件，PyPDF2 只在需要時讀取物件，不會整份載入記憶體
+            input_handle = open(input_path, "rb")
+            reader = PdfReader(input_handle)
+            total_pages = len(reader.pages)
+            if total_pages >= GS_SHARD_MIN_PAGES:
+                shards = plan_shards(total_pages, GS_MAX_WORKERS)
+        except Exception:
+            shards = []
+
+    def run_gs_sharded(dpi: int, img_quality: int, cancel_event: Optional[threading.Event],
+                       output: StagedFile) -> bool:
+        """分段平行壓縮後合併，任一段失敗即放棄；被取消時回傳 False"""
+        nonlocal gs_timed_out
+        shard_cancel = threading.Event()
+        shard_outputs = [StagedFile(size_hint=original_size // len(shards)) for _ in shards]
+        counters = new_page_counters([last - first + 1 for first, last in shards])
+        try:
+            with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                pending = {
+                    pool.submit(run_backend, build_gs_command(
+                        input_path, shard.path, settings["pdfsettings"], dpi, img_quality, first, last
+                    ), shard_cancel, input_fds + shard.pass_fds, counter.feed, shard,
+                        dpi=dpi, jpeg_quality=img_quality, pages=f"{first}-{last}")
+                    for shard, counter, (first, last) in zip(shard_outputs, counters, shards)
+                }
+                outcomes = []
+                while pending:
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    outcomes += [future.result() for future in done]
+                    if cancel_event is not None and cancel_event.is_set():
+                        shard_cancel.set()
+                    if any(outcome != "done" for outcome in outcomes):
+                        shard_cancel.set()
+
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            if "timeout" in outcomes:
+                gs_timed_out = True
+            if any(outcome != "done" for outcome in outcomes):
+                raise RuntimeError("Ghostscript shard failed")
+            with stage("merge_shards", sum(shard.size() for shard in shard_outputs)) as record:
+                merge_shards([shard.path for shard in shard_outputs], reader, output.path)
+                record["bytes_out"] = output.size()
+            return True
+        finally:
+            for shard in shard_outputs:
+                shard.close()
+
+    def run_gs_compress(dpi: int, img_quality: int, cancel_event: Optional[threading.Event] = None,
+                        output: Optional[StagedFile] = None) -> Optional[StagedFile]:
+        """執行 Ghostscript 壓縮，回傳輸出檔；被取消或失敗時回傳 None"""
+        nonlocal gs_failed, gs_timed_out, gs_passes
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+
+        if output is None:
+            output = StagedFile(size_hint=original_size)
+
+        def record(result: StagedFile) -> StagedFile:
+            if history is not None and profile is not None:
+                try:
+                    history.record_run(profile, dpi, img_quality, result.size())
+                except Exception:
+                    pass
+            return result
+
+        with progress_lock:
+            gs_passes += 1
+        try:
+            if shards:
+                if run_gs_sharded(dpi, img_quality, cancel_event, output):
+                    return record(output)
+                output.close()
+                return None
+
+            # 要求線性化時由 Ghostscript 直接輸出，不必再多處理一次
+            gs_command = build_gs_command(input_path, output.path, settings["pdfsettings"], dpi, img_quality,
+                                          fast_web_view=linearize)
+            counter, = new_page_counters([0])
+            outcome = run_backend(gs_command, cancel_event, input_fds + output.pass_fds, counter.feed, output,
+                                  dpi=dpi, jpeg_quality=img_quality)
+            if outcome == "done" and output.size() > 0:
+                return record(output)
+            if outcome != "cancelled":
+                gs_failed = True
+                gs_timed_out = gs_timed_out or outcome == "timeout"
+        except Exception:
+            gs_failed = True
+        output.close()
+        return None
+
+    def run_candidates(candidates: List[Tuple[int, int]], target_bytes: int) -> Tuple[Optional[int], dict]:
+        """平行執行多組參數，回傳品質最高且符合目標的索引與所有結果
+
+        candidates 依品質由高到低排列。某組符合目標後，品質更低的參數
+        立即取消；品質更高的仍在執行時則繼續等待，全部結束即停止。
+        """
+        cancel_events = [threading.Event() for _ in candidates]
+        results = {}
+        passing_index = None
+        with progress_lock:
+            progress_runs.clear()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(GS_MAX_WORKERS, len(candidates)))) as pool:
+            futures = {
+                pool.submit(run_gs_compress, dpi, img_q, cancel_events[i]): i
+                for i, (dpi, img_q) in enumerate(candidates)
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                if cancel_event is not None and cancel_event.is_set():
+                    for event in cancel_events:
+                        event.set()
+                for future in done:
+                    index = futures[future]
+                    compressed = future.result()
+                    if compressed is None:
+                        continue
+                    results[index] = compressed
+                    if compressed.size() <= target_bytes and (passing_index is None or index < passing_index):
+                        passing_index = index
+                        for j in range(index + 1, len(candidates)):
+                            cancel_events[j].set()
+
+                # 品質更高的參數都已完成，不必再等
+                if passing_index is not None and all(futures[f] > passing_index for f in pending):
+                    for future in pending:
+                        cancel_events[futures[future]].set()
+                        future.cancel()
+                    break
+
+            # 已開始但被取消的工作仍可能在結束前產生結果
+            for future in futures:
+                if not future.cancelled() and future.done() and future.result() is not None:
+                    results.setdefault(futures[future], future.result())
+
+        return passing_index, results
+
+    def run_image_compress(scan: bool = False) -> StagedFile:
+        """以圖片重新壓縮引擎直接寫入輸出檔；設定目標大小時逐步降低品質直到符合
+
+        scan 為 True 時使用掃描檔模式：黑白的圖片存成 1 位元、灰階的存成灰階 JPEG。
+        """
+        nonlocal scan_counts
+        qualities = [settings["image_quality"]]
+        if target_size_mb > 0:
+            qualities += [q for q in (50, 30, 20) if q < settings["image_quality"]]
+        # Pillow 只在用到圖片引擎時才載入
+        from .images import compress_pdf_images
+
+        result = StagedFile.wrap(output_path)
+        for img_quality in qualities:
+            counters = {}
+            with stage("image_compress", original_size, jpeg_quality=img_quality, scan=scan) as record:
+                compress_pdf_images(input_path, output_path, img_quality, cancel_event, on_progress,
+                                    mono_dpi=settings["mono_dpi"] if scan else 0, counters=counters)
+                record.update(counters, bytes_out=result.size())
+            if scan:
+                scan_counts = counters
+            if target_size_mb <= 0 or result.size() <= target_size_mb * 1024 * 1024:
+                break
+        return result
+
+    def run_lossless_optimize() -> StagedFile:
+        """以無損結構最佳化直接寫入輸出檔"""
+        result = StagedFile.wrap(output_path)
+        with stage("lossless", original_size) as record:
+            optimize_pdf_lossless(input_path, output_path, on_progress, cancel_event)
+            record["bytes_out"] = result.size()
+        return result
+
+    # 所有產生過的暫存輸出，結束時統一清除
+    outputs = []
+    best_result = None
+    used_engine = engine
+    fallback = False
+
+    try:
+        # 以文字為主、或預估 Ghostscript 幾乎壓不小（例如圖片已是低解析度）時，
+        # 先做無損最佳化，符合目標就不必執行 Ghostscript
+        if profile is not None and (
+                is_text_dominated(profile) or
+                (target_size_mb <= 0 and predicted_size >= original_size * PREFLIGHT_MIN_GAIN)):
+            try:
+                best_result = run_lossless_optimize()
+            except CompressCancelled:
+                raise
+            except Exception:
+                best_result = None
+            if best_result is not None and (target_size_mb <= 0 or
+                                            best_result.size() <= target_size_mb * 1024 * 1024):
+                used_engine = "lossless"
+            else:
+                best_result = None
+
+        if best_result is not None:
+            pass
+        elif engine in ("image", "scan"):
+            best_result = run_image_compress(scan=engine == "scan")
+        elif engine == "lossless":
+            best_result = run_lossless_optimize()
+        # 如果設定了目標大小，嘗試不同的 DPI 找到最佳壓縮
+        elif target_size_mb > 0:
+            target_bytes = int(target_size_mb * 1024 * 1024)
+
+            # 快速嘗試幾個關鍵的 DPI 值
+            test_params = [
+                (72, 50),   # 先試標準壓縮
+                (50, 30),   # 再試更高壓縮
+                (36, 20),   # 最後試極限壓縮
+            ]
+
+            # 預估大小與品質更高的參數幾乎相同時，只會得到更差的畫質，不必執行
+            if profile is not None:
+                pruned = prune_candidates(profile, test_params)
+                skipped_runs = len(test_params) - len(pruned)
+                test_params = pruned
+
+            # 依過去紀錄挑出最可能一次就落在目標以下的參數，先單獨執行
+            learned_params = None
+            learned_results = {}
+            if history is not None and profile is not None:
+                try:
+                    learned_params = history.choose_params(profile, target_bytes)
+                except Exception:
+                    learned_params = None
+            if learned_params is not None:
+                learned_index, learned_results = run_candidates([learned_params], target_bytes)
+                outputs += learned_results.values()
+                if learned_index is not None:
+                    best_result = learned_results[learned_index]
+
+            if best_result is None:
+                # 同時執行所有候選參數
+                passing_index, results = run_candidates(test_params, target_bytes)
+                outputs += results.values()
+
+                if passing_index is None:
+                    # 都未達標，取最小的結果
+                    best_result = min(list(results.values()) + list(learned_results.values()),
+                                      key=lambda f: f.size(), default=None)
+                else:
+                    best_result = results[passing_index]
+
+                    # 在未達標與達標的參數之間反覆細分 DPI，直到夠接近目標大小；
+                    # 第一組就達標時，上界改用畫質最高的預設參數（該組參數本身不執行）
+                    if passing_index > 0:
+                        high = test_params[passing_index - 1]
+                    else:
+                        high = max((preset["dpi"], preset["image_quality"]) for preset in QUALITY_SETTINGS.values())
+                    low = test_params[passing_index]
+                    for _ in range(GS_REFINE_ROUNDS):
+                        if best_result.size() >= target_bytes * GS_REFINE_TOLERANCE:
+                            break
+                        points = interpolate_params(high, low, max(1, GS_MAX_WORKERS))
+                        if not points:
+                            break
+                        point_index, point_results = run_candidates(points, target_bytes)
+                        outputs += point_results.values()
+                        if point_index is None:
+                            high = points[-1]
+                        else:
+                            best_result = point_results[point_index]
+                            low = points[point_index]
+                            if point_index > 0:
+                                high = points[point_index - 1]
+
+            if best_result is not None:
+                shutil.copyfile(best_result.path, output_path)
+
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            if history is not None and gs_passes > 0 and not cancelled:
+                try:
+                    met = best_result is not None and best_result.size() <= target_bytes
+                    history.record_request(target_bytes, gs_passes, met, learned_params is not None)
+                except Exception:
+                    pass
+        else:
+            # 使用預設設定壓縮，直接寫入輸出檔
+            best_result = run_gs_compress(
+                settings["dpi"], settings["image_quality"], cancel_event,
+                StagedFile.wrap(output_path)
+            )
+
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompressCancelled()
+
+        # Ghostscript 無法執行或逾時，改用圖片重新壓縮
+        if best_result is None and gs_failed:
+            used_engine = "image"
+            fallback = True
+            best_result = run_image_compress()
+
+        compressed_size = best_result.size() if best_result is not None else original_size
+
+        # 如果壓縮失敗或壓縮後變大，返回原始檔案
+        if best_result is None or compressed_size >= original_size:
+            shutil.copyfile(input_path, output_path)
+            compressed_size = original_size
+
+        # 分段壓縮、圖片引擎與無損最佳化的輸出都不是線性化檔案，在此統一處理
+        if linearize:
+            linearized = linearize_in_place(output_path, cancel_event, backend)
+            if cancel_event is not None and cancel_event.is_set():
+                raise CompressCancelled()
+            compressed_size = os.path.getsize(output_path)
+
+        if cache_key is not None and not gs_failed and linearized == linearize:
+            cache.put_file(cache_key, output_path)
+
+    except CompressCancelled:
+        raise
+    except Exception as e:
+        logger.warning("壓縮 %s 時發生錯誤，改為輸出原始檔案", input_path, exc_info=True)
+        error = f"{type(e).__name__}: {e}"
+        shutil.copyfile(input_path, output_path)
+        compressed_size = original_size
+        gs_failed = True
+    finally:
+        for output in outputs:
+            output.close()
+        if input_handle is not None:
+            input_handle.close()
+
+    reduction = ((original_size - compressed_size) / original_size) * 100 if original_size > 0 else 0
+
+    # 執行結果：success（含壓縮後未變小而保留原檔）/ timeout / failed
+    if compressed_size < original_size or not gs_failed:
+        outcome = "success"
+    elif gs_timed_out:
+        outcome = "timeout"
+    else:
+        outcome = "failed"
+
+    stats = {
+        "original_size": original_size,
+        "compressed_size": compressed_size,
+        "reduction": reduction,
+        "cache_hit": False,
+        "outcome": outcome,
+        "engine": used_engine,
+        "fallback": fallback,
+        "gs_timed_out": gs_timed_out,
+        "predicted_size": predicted_size,
+        "skipped_runs": skipped_runs,
+        "gs_passes": gs_passes,
+        "gs_cpu_s": round(gs_usage["cpu_s"], 3),
+        "gs_max_rss_kb": gs_usage["max_rss_kb"],
+        "scan": scan_counts,
+        "linearized": linearized,
+        "first_page_bytes": first_page_bytes(output_path),
+        "error": error
+    }
+
+    return stats
+
+
+def compress_pdf(input_bytes: bytes, quality: str, target_size_mb: float = 0, **kwargs) -> Tuple[bytes, dict]:
+    """壓縮記憶體中的 PDF 位元組資料，參數同 compress_pdf_file"""
+    with stage("write_input", len(input_bytes)) as record:
+        staged_input = StagedFile(input_bytes)
+        record["bytes_out"] = len(input_bytes)
+    with staged_input, StagedFile(size_hint=len(input_bytes)) as output:
+        stats = compress_pdf_file(staged_input.path, output.path, quality, target_size_mb, **kwargs)
+        with stage("read_output", stats["compressed_size"]) as record:
+            data = output.read_bytes()
+            record["bytes_out"] = len(data)
+        return data, stats
+
+
+def optimize_pdf_lossless(input_path: str, output_path: str, on_progress=None,
+                          cancel_event: Optional[threading.Event] = None) -> dict:
+    """無損結構最佳化：壓縮未壓縮的串流、捨棄未參照的物件、合併重複串流並打包成物件串流
+
+    不重新取樣任何圖片，適合以文字為主的文件；回傳去除重複的統計。
+    cancel_event 被設定時在寫完目前這一頁後拋出 CompressCancelled。
+    """
+    def on_page(done: int, total: int):
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompressCancelled()
+        if on_progress is not None:
+            on_progress(done, total)
+
+    with open(input_path, "rb") as input_handle, open(output_path, "wb") as output:
+        reader = PdfReader(input_handle)
+        if reader.is_encrypted:
+            raise ValueError("加密的 PDF 無法進行無損最佳化")
+        writer = StreamingPdfWriter(output, dedupe=True, compress_streams=True, object_streams=True)
+        writer.append(reader, import_catalog=True, on_page=on_page)
+        writer.finish()
+    return dict(writer.counters)
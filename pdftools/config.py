@@ -0,0 +1,117 @@
+"""
+引擎設定（皆可透過環境變數調整）
+"""
+
+import os
+import tempfile
+
+# 壓縮結果快取設定（可透過環境變數調整）
+# 磁碟層會把壓縮後的完整檔案寫到 CACHE_DIR，伺服器重新啟動後仍會沿用，因此預設關閉（0），需要時再明確開啟
+CACHE_MEMORY_MB = float(os.environ.get("PDF_CACHE_MEMORY_MB", "256"))
+CACHE_DISK_MB = float(os.environ.get("PDF_CACHE_DISK_MB", "0"))
+CACHE_DIR = os.environ.get("PDF_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdf_tools_cache"))
+
+# 壓縮紀錄資料庫：目標大小模式依過去結果挑選參數；會保存每份文件的特徵與結果大小，預設不啟用，
+# 設定檔案路徑後才記錄
+HISTORY_DB = os.environ.get("PDF_HISTORY_DB", "")
+# 至少累積這麼多筆紀錄才啟用迴歸預測；只保留並使用最近這麼多筆紀錄，較舊的直接刪除
+HISTORY_MIN_SAMPLES = int(os.environ.get("PDF_HISTORY_MIN_SAMPLES", "12"))
+HISTORY_MAX_SAMPLES = int(os.environ.get("PDF_HISTORY_MAX_SAMPLES", "2000"))
+
+# 拆分頁使用的已解析文件快取上限（以原始檔大小計）
+DOC_CACHE_MB = float(os.environ.get("PDF_DOC_CACHE_MB", "256"))
+
+# Ghostscript 執行設定
+GS_TIMEOUT = 180
+GS_MAX_WORKERS = int(os.environ.get("PDF_GS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# 目標大小模式在未達標與達標的參數之間反覆細分，直到結果達到目標的此比例以上或用完細分次數
+GS_REFINE_ROUNDS = int(os.environ.get("PDF_GS_REFINE_ROUNDS", "3"))
+GS_REFINE_TOLERANCE = float(os.environ.get("PDF_GS_REFINE_TOLERANCE", "0.9"))
+# 超過此大小與頁數的檔案改用分段平行壓縮
+GS_SHARD_MIN_MB = float(os.environ.get("PDF_GS_SHARD_MIN_MB", "20"))
+GS_SHARD_MIN_PAGES = int(os.environ.get("PDF_GS_SHARD_MIN_PAGES", "40"))
+GS_SHARD_PAGES_PER_SHARD = 10
+
+# Ghostscript 壓縮設定（更激進的參數）；mono_dpi 為掃描檔模式下黑白頁面保留的解析度（低於 150 DPI 文字就不易辨識）
+QUALITY_SETTINGS = {
+    "low": {
+        "pdfsettings": "/prepress",
+        "dpi": 300,
+        "image_quality": 95,
+        "mono_dpi": 300
+    },
+    "medium": {
+        "pdfsettings": "/ebook",
+        "dpi": 150,
+        "image_quality": 75,
+        "mono_dpi": 300
+    },
+    "high": {
+        "pdfsettings": "/screen",
+        "dpi": 72,
+        "image_quality": 40,
+        "mono_dpi": 200
+    },
+    "extreme": {
+        "pdfsettings": "/screen",
+        "dpi": 50,
+        "image_quality": 20,
+        "mono_dpi": 150
+    }
+}
+
+# Ghostscript 預設只在圖片解析度超過目標 1.5 倍時才降低取樣
+GS_DOWNSAMPLE_THRESHOLD = 1.5
+
+# 預檢預估壓縮後仍達原始大小的此比例以上時，視為不值得執行 Ghostscript
+PREFLIGHT_MIN_GAIN = float(os.environ.get("PDF_PREFLIGHT_MIN_GAIN", "0.95"))
+
+# Ghostscript 輸入輸出的暫存方式：auto / memfd / tmpfs / file
+GS_IO_MODE = os.environ.get("PDF_GS_IO", "auto")
+
+# ZIP 打包：Deflate 壓縮等級與平行壓縮的執行緒數；
+# 取樣壓縮後仍大於此比例的項目直接儲存不壓縮
+ZIP_LEVEL = int(os.environ.get("PDF_ZIP_LEVEL", "6"))
+ZIP_WORKERS = int(os.environ.get("PDF_ZIP_WORKERS", str(min(4, os.cpu_count() or 1))))
+ZIP_SAMPLE_KB = int(os.environ.get("PDF_ZIP_SAMPLE_KB", "64"))
+ZIP_STORE_RATIO = float(os.environ.get("PDF_ZIP_STORE_RATIO", "0.9"))
+
+# 單一檔案可放在記憶體中的上限，超過時一律寫到磁碟，讓記憶體用量不隨檔案大小成長
+MEMORY_BUFFER_MB = float(os.environ.get("PDF_MEMORY_BUFFER_MB", "32"))
+
+# Ghostscript 執行引擎：subprocess（每次啟動 gs）/ gsapi（常駐工作程序以 libgs 執行）
+GS_BACKEND = os.environ.get("PDF_GS_BACKEND", "subprocess")
+
+# 全伺服器同時執行的壓縮工作上限，超過的工作依序排隊
+MAX_CONCURRENT_JOBS = int(os.environ.get("PDF_MAX_CONCURRENT_JOBS", "2"))
+
+# 批次壓縮：每個工作階段同時送進排程的檔案數、單一檔案的逾時秒數與一次可上傳的檔案數
+BATCH_WORKERS = int(os.environ.get("PDF_BATCH_WORKERS", str(MAX_CONCURRENT_JOBS)))
+BATCH_FILE_TIMEOUT = float(os.environ.get("PDF_BATCH_FILE_TIMEOUT", str(GS_TIMEOUT * 2)))
+BATCH_MAX_FILES = int(os.environ.get("PDF_BATCH_MAX_FILES", "50"))
+
+# 圖片重新壓縮引擎：平行處理的執行緒數，小於門檻的圖片直接略過
+IMAGE_WORKERS = int(os.environ.get("PDF_IMAGE_WORKERS", str(os.cpu_count() or 1)))
+IMAGE_MIN_KB = float(os.environ.get("PDF_IMAGE_MIN_KB", "16"))
+
+# 掃描檔模式：判斷色彩時將圖片縮小到長邊約此像素數再分析；
+# 色偏校正後明顯帶有色彩的像素低於此比例視為灰階，灰階中介於墨色與紙色之間的像素低於此比例視為黑白
+SCAN_SAMPLE_PX = int(os.environ.get("PDF_SCAN_SAMPLE_PX", "1024"))
+SCAN_COLOR_RATIO = float(os.environ.get("PDF_SCAN_COLOR_RATIO", "0.01"))
+SCAN_MIDTONE_RATIO = float(os.environ.get("PDF_SCAN_MIDTONE_RATIO", "0.12"))
+
+# 線性化（快速網頁檢視）使用的工具：auto（優先 qpdf，其次 gs）/ qpdf / gs
+LINEARIZE_TOOL = os.environ.get("PDF_LINEARIZE_TOOL", "auto")
+
+# 圖片資料占檔案大小低於此比例時視為以文字為主，改做無損最佳化而不經 Ghostscript
+LOSSLESS_MAX_IMAGE_RATIO = float(os.environ.get("PDF_LOSSLESS_MAX_IMAGE_RATIO", "0.2"))
+
+# 效能紀錄：每個階段以最近幾筆計算耗時百分位數；JSON 紀錄的輸出位置（- 為標準錯誤，空白則交給 logging 設定）；
+# Prometheus 文字格式端點的連接埠（0 為不啟用）與位址
+METRICS_WINDOW = int(os.environ.get("PDF_METRICS_WINDOW", "1000"))
+METRICS_LOG = os.environ.get("PDF_METRICS_LOG", "")
+METRICS_PORT = int(os.environ.get("PDF_METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("PDF_METRICS_HOST", "127.0.0.1")
+
+# 測量啟動時間用的空白工作（不處理任何頁面）
+GS_PROBE_COMMAND = ['gs', '-q', '-dNOPAUSE', '-dBATCH', '-sDEVICE=pdfwrite', '-sOutputFile=/dev/null', '-c', 'quit']
@@ -0,0 +1,120 @@
+"""
+暫存檔案：交給 Ghostscript 的記憶體檔案／tmpfs／磁碟暫存，以及隨物件回收而刪除的工作檔
+"""
+
+import os
+import re
+import tempfile
+import weakref
+from typing import Tuple
+
+from .config import GS_IO_MODE, MEMORY_BUFFER_MB
+
+
+def path_fds(path: str) -> Tuple[int, ...]:
+    """若路徑為 /dev/fd/N，回傳子程序需要繼承的檔案描述元"""
+    match = re.match(r"^/dev/fd/(\d+)$", path)
+    return (int(match.group(1)),) if match else ()
+
+
+class StagedFile:
+    """Ghostscript 用的暫存檔，優先放在記憶體（memfd / tmpfs），不支援時退回一般暫存檔
+
+    超過 MEMORY_BUFFER_MB 的檔案（依資料大小或 size_hint 判斷）直接放在磁碟。
+    """
+
+    def __init__(self, data: bytes = b"", suffix: str = ".pdf", mode: str = GS_IO_MODE,
+                 size_hint: int = 0):
+        self.fd = None
+        self.path = None
+        self.mode = None
+        self.owned = True
+
+        if mode == "auto" and max(len(data), size_hint) > MEMORY_BUFFER_MB * 1024 * 1024:
+            mode = "file"
+
+        if mode in ("auto", "memfd") and hasattr(os, "memfd_create"):
+            try:
+                self.fd = os.memfd_create("pdf-tools")
+                # 子程序透過 pass_fds 繼承同一個檔案描述元
+                self.path = f"/dev/fd/{self.fd}"
+                self.mode = "memfd"
+            except OSError:
+                self.fd = None
+
+        if self.path is None and mode in ("auto", "tmpfs") and os.access("/dev/shm", os.W_OK):
+            fd, self.path = tempfile.mkstemp(suffix=suffix, dir="/dev/shm")
+            os.close(fd)
+            self.mode = "tmpfs"
+
+        if self.path is None:
+            fd, self.path = tempfile.mkstemp(suffix=suffix)
+            os.close(fd)
+            self.mode = "file"
+
+        if data:
+            with open(self.path, "wb") as f:
+                f.write(data)
+
+    @classmethod
+    def wrap(cls, path: str) -> "StagedFile":
+        """包裝呼叫端提供的既有路徑；close() 不會刪除該檔案"""
+        staged = cls.__new__(cls)
+        staged.fd = None
+        staged.path = path
+        staged.mode = "external"
+        staged.owned = False
+        return staged
+
+    @property
+    def pass_fds(self) -> Tuple[int, ...]:
+        return path_fds(self.path)
+
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if not self.owned:
+            return
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        elif self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SessionFile:
+    """工作階段使用的磁碟暫存檔，物件被回收（如工作階段結束）時自動刪除"""
+
+    def __init__(self, suffix: str = ".pdf"):
+        fd, self.path = tempfile.mkstemp(suffix=suffix, prefix="pdf_tools_")
+        os.close(fd)
+        self._finalizer = weakref.finalize(self, _remove_file, self.path)
+
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        self._finalizer()
@@ -0,0 +1,450 @@
+"""
+Ghostscript 執行：命令組成、子程序與 gsapi 兩種執行引擎、分段壓縮的規劃
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import signal
+import subprocess
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from .config import GS_BACKEND, GS_MAX_WORKERS, GS_PROBE_COMMAND, GS_SHARD_PAGES_PER_SHARD, GS_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_kb(pid: int) -> int:
+    """由 /proc 讀取執行中程序的最高常駐記憶體（KB），無法讀取時回傳 0
+
+    wait4 回報的最高記憶體會包含 fork 時從父程序帶過來的用量，所以改在執行期間讀取 VmHWM。
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def reset_peak_rss() -> bool:
+    """將本程序的 VmHWM 重設為目前的常駐記憶體（Linux 4.0 起支援），成功時回傳 True
+
+    常駐的工作程序以此在每個工作開始前歸零，工作結束後讀到的 VmHWM 才是該工作的高峰。
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def reap_process(process, usage: Optional[dict] = None, block: bool = False) -> bool:
+    """回收已結束的子程序，並將其 CPU 秒數與最高記憶體（KB）填入 usage；尚未結束時回傳 False"""
+    if process.returncode is not None:
+        return True
+    try:
+        pid, status, rusage = os.wait4(process.pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        # 已在其他地方回收，取不到資源用量
+        process.wait()
+        return True
+    if pid == 0:
+        return False
+    process.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    if usage is not None:
+        usage["cpu_s"] = rusage.ru_utime + rusage.ru_stime
+        usage["max_rss_kb"] = rusage.ru_maxrss
+    return True
+
+
+def wait_process(process, timeout: float, cancel_event: Optional[threading.Event] = None,
+                 usage: Optional[dict] = None) -> str:
+    """等待子程序結束，逾時或取消時強制終止；回傳 done / timeout / cancelled
+
+    以 wait4 回收子程序，usage 傳入字典時填入該程序的 CPU 秒數與最高記憶體（執行期間取樣）。
+    """
+    deadline = time.monotonic() + timeout
+    # 與 Popen.wait 相同的輪詢間隔：由 0.5 毫秒逐步加長到 50 毫秒
+    delay = 0.0005
+    peak = 0
+    while True:
+        if reap_process(process, usage):
+            if usage is not None and peak:
+                usage["max_rss_kb"] = peak
+            return "done"
+        if usage is not None:
+            peak = peak_rss_kb(process.pid) or peak
+        if cancel_event is not None and cancel_event.is_set():
+            outcome = "cancelled"
+        elif time.monotonic() >= deadline:
+            outcome = "timeout"
+        else:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+            continue
+        # gs 以獨立的程序群組執行，整組終止
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            process.kill()
+        reap_process(process, usage, block=True)
+        if usage is not None and peak:
+            usage["max_rss_kb"] = peak
+        return outcome
+
+
+class GsPageCounter:
+    """解析 Ghostscript 的標準輸出，計算已處理頁數"""
+
+    PAGE_PATTERN = re.compile(r"^Page (\d+)")
+    RANGE_PATTERN = re.compile(r"^Processing pages (\d+) through (\d+)")
+
+    def __init__(self, on_update=None, total: int = 0):
+        self.done = 0
+        self.total = total
+        self.on_update = on_update
+
+    def feed(self, line: str):
+        match = self.PAGE_PATTERN.match(line)
+        if match:
+            self.done += 1
+        else:
+            match = self.RANGE_PATTERN.match(line)
+            if not match:
+                return
+            self.total = int(match.group(2)) - int(match.group(1)) + 1
+        if self.on_update is not None:
+            self.on_update()
+
+
+def build_gs_command(input_path: str, output_path: str, pdfsettings: str, dpi: int, img_quality: int,
+                     first_page: int = 0, last_page: int = 0, fast_web_view: bool = False) -> List[str]:
+    """組合 Ghostscript 壓縮指令，可指定頁碼範圍（從 1 開始）；fast_web_view 時直接輸出線性化檔案"""
+    gs_command = [
+        'gs',
+        '-sDEVICE=pdfwrite',
+        '-dCompatibilityLevel=1.4',
+        f'-dPDFSETTINGS={pdfsettings}',
+        '-dNOPAUSE',
+        '-dBATCH',
+        '-dDetectDuplicateImages=true',
+        '-dCompressFonts=true',
+        '-dSubsetFonts=true',
+        f'-dColorImageResolution={dpi}',
+        f'-dGrayImageResolution={dpi}',
+        f'-dMonoImageResolution={dpi}',
+        '-dColorImageDownsampleType=/Bicubic',
+        '-dGrayImageDownsampleType=/Bicubic',
+        '-dMonoImageDownsampleType=/Bicubic',
+        '-dDownsampleColorImages=true',
+        '-dDownsampleGrayImages=true',
+        '-dDownsampleMonoImages=true',
+        f'-dJPEGQ={img_quality}',
+    ]
+    if first_page and last_page:
+        gs_command += [f'-dFirstPage={first_page}', f'-dLastPage={last_page}']
+    if fast_web_view:
+        gs_command.append('-dFastWebView=true')
+    gs_command += [f'-sOutputFile={output_path}', input_path]
+    return gs_command
+
+
+class SubprocessBackend:
+    """每次壓縮都啟動新的 gs 子程序（預設引擎）"""
+
+    name = "subprocess"
+
+    def __init__(self, max_workers: int = GS_MAX_WORKERS):
+        # 同時執行的 gs 程序數上限（候選參數與分段共用）
+        self._slots = threading.BoundedSemaphore(max(1, max_workers))
+
+    def _acquire(self, cancel_event: Optional[threading.Event]) -> bool:
+        while not self._slots.acquire(timeout=0.1):
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+        if cancel_event is not None and cancel_event.is_set():
+            self._slots.release()
+            return False
+        return True
+
+    def run(self, gs_command: List[str], cancel_event: Optional[threading.Event] = None,
+            pass_fds: Tuple[int, ...] = (), on_output=None, usage: Optional[dict] = None) -> str:
+        """執行 Ghostscript，回傳 done / failed / timeout / cancelled
+
+        on_output 會逐行收到 gs 的標準輸出（用於顯示頁數進度）；
+        usage 傳入字典時填入 gs 程序的 CPU 秒數（cpu_s）與最高記憶體 KB（max_rss_kb）。
+        """
+        if not self._acquire(cancel_event):
+            return "cancelled"
+        try:
+            process = subprocess.Popen(
+                gs_command,
+                stdout=subprocess.PIPE if on_output else subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=pass_fds,
+                start_new_session=True,
+                text=True,
+                errors="replace",
+            )
+            reader = None
+            if on_output:
+                reader = threading.Thread(
+                    target=lambda: [on_output(line) for line in process.stdout], daemon=True
+                )
+                reader.start()
+            outcome = wait_process(process, GS_TIMEOUT, cancel_event, usage)
+            if reader is not None:
+                reader.join(timeout=1)
+        finally:
+            self._slots.release()
+
+        if outcome == "done" and process.returncode != 0:
+            return "failed"
+        return outcome
+
+    def measure_startup(self) -> float:
+        """以空白工作測量 gs 啟動與初始化所需秒數"""
+        started = time.perf_counter()
+        subprocess.run(GS_PROBE_COMMAND, capture_output=True, timeout=30, check=True)
+        return time.perf_counter() - started
+
+    def close(self):
+        """沒有常駐的程序，與 GsapiBackend 介面一致"""
+
+
+class _ConnWriter:
+    """把 gsapi 的標準輸出逐行轉送回主程序"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffer = ""
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8", "replace")
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self.conn.send(("output", line))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _gsapi_worker(conn):
+    """常駐工作程序：接收參數並以 gsapi 在程序內執行 Ghostscript"""
+    import resource
+
+    import ghostscript
+
+    stdout = _ConnWriter(conn)
+    while True:
+        try:
+            args = conn.recv()
+        except EOFError:
+            return
+        if args is None:
+            return
+
+        # 最後一個參數為輸入檔（以 -c 執行指令時除外）；先以裝置參數
+        # 初始化，再執行輸入檔，以便分開量測初始化時間
+        started = time.perf_counter()
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        peak_reset = reset_peak_rss()
+        kind = "failed"
+        try:
+            if "-c" in args or args[-1].startswith("-"):
+                options, input_path = args, None
+            else:
+                options, input_path = args[:-1], args[-1]
+            options = [a for a in options if a != "-dBATCH"] if input_path else options
+            instance = ghostscript.Ghostscript("gs", *options, stdout=stdout)
+            startup = time.perf_counter() - started
+            try:
+                if input_path:
+                    instance.run_filename(input_path)
+            finally:
+                instance.exit()
+            kind = "done"
+        except Exception:
+            startup = time.perf_counter() - started
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        # 工作程序常駐，ru_maxrss 是程序啟動以來的高峰；只有在工作前成功歸零 VmHWM 時才回報本次的高峰
+        conn.send((kind, {
+            "startup": startup,
+            "cpu_s": (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime),
+            "max_rss_kb": peak_rss_kb(os.getpid()) if peak_reset else 0,
+        }))
+
+
+class GsapiBackend:
+    """常駐工作程序池，每個程序已載入 libgs，以 gsapi 執行而不再啟動 gs 執行檔
+
+    pdfwrite 的裝置參數只能在初始化時設定，所以每個工作仍會建立新的
+    gsapi 實例；省下的是程序啟動、動態連結與 Python 匯入的成本。
+    """
+
+    name = "gsapi"
+
+    def __init__(self, max_workers: int = GS_MAX_WORKERS):
+        # 先在主程序匯入，確認 libgs 可用，也避免 fork 後才匯入
+        import ghostscript  # noqa: F401
+
+        self._context = multiprocessing.get_context("fork")
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.startup_times = []
+        for _ in range(max(1, max_workers)):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_gsapi_worker, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _replace(self, worker):
+        """終止卡住或被取消的工作程序並補上新的（已關閉時不再補上）"""
+        process, conn = worker
+        process.kill()
+        process.join()
+        conn.close()
+        self._release(None)
+
+    def _release(self, worker):
+        """歸還工作程序；已關閉時改為結束它。worker 為 None 時補上一個新程序"""
+        with self._lock:
+            if not self._closed:
+                self._idle.put(worker or self._spawn())
+                return
+        if worker is not None:
+            self._stop(worker)
+
+    @staticmethod
+    def _stop(worker):
+        """通知工作程序結束（之後 fork 的程序也持有管線，只關閉管線收不到 EOF），逾時仍未結束時強制終止"""
+        process, conn = worker
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+        conn.close()
+        process.join(timeout=5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def close(self):
+        """結束所有工作程序；執行中的工作完成後，其程序也會隨即結束"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._stop(worker)
+
+    def run(self, gs_command: List[str], cancel_event: Optional[threading.Event] = None,
+            pass_fds: Tuple[int, ...] = (), on_output=None, usage: Optional[dict] = None) -> str:
+        """執行 Ghostscript，回傳 done / failed / timeout / cancelled；usage 同 SubprocessBackend.run"""
+        while True:
+            if self._closed:
+                raise RuntimeError("gsapi 執行引擎已關閉")
+            try:
+                worker = self._idle.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
+                    return "cancelled"
+
+        # 工作程序不會繼承呼叫端的檔案描述元，改由 /proc 開啟
+        fd_prefix = f"/proc/{os.getpid()}/fd/"
+        args = [arg.replace("/dev/fd/", fd_prefix) for arg in gs_command[1:]]
+
+        process, conn = worker
+        deadline = time.monotonic() + GS_TIMEOUT
+        try:
+            conn.send(args)
+            while True:
+                if conn.poll(0.1):
+                    kind, value = conn.recv()
+                    if kind != "output":
+                        outcome, result = kind, value
+                        break
+                    if on_output:
+                        on_output(value)
+                    continue
+                if cancel_event is not None and cancel_event.is_set():
+                    outcome = "cancelled"
+                elif time.monotonic() >= deadline:
+                    outcome = "timeout"
+                elif not process.is_alive():
+                    outcome = "failed"
+                else:
+                    continue
+                self._replace(worker)
+                return outcome
+        except (EOFError, OSError):
+            self._replace(worker)
+            return "failed"
+
+        if usage is not None:
+            usage.update(cpu_s=result["cpu_s"], max_rss_kb=result["max_rss_kb"])
+        with self._lock:
+            self.startup_times.append(result["startup"])
+        self._release(worker)
+        return outcome
+
+    def measure_startup(self) -> float:
+        """以空白工作測量 gsapi 實例初始化所需秒數"""
+        if self.run(GS_PROBE_COMMAND) != "done":
+            raise RuntimeError("gsapi probe failed")
+        with self._lock:
+            return self.startup_times[-1]
+
+
+def create_gs_backend(name: str = GS_BACKEND):
+    """建立 Ghostscript 執行引擎，gsapi 不可用時退回子程序並記錄警告"""
+    if name == "gsapi":
+        try:
+            return GsapiBackend()
+        except Exception as e:
+            logger.warning("無法啟用 gsapi 執行引擎（%s: %s），改以子程序執行 Ghostscript", type(e).__name__, e)
+    return SubprocessBackend()
+
+
+def plan_shards(total_pages: int, workers: int) -> List[Tuple[int, int]]:
+    """將頁數平均切成多段，回傳 (起始頁, 結束頁) 清單（從 1 開始，含結束頁）"""
+    count = max(1, min(workers, total_pages // GS_SHARD_PAGES_PER_SHARD))
+    shards = []
+    start = 1
+    for i in range(count):
+        end = start + (total_pages - start + 1) // (count - i) - 1
+        shards.append((start, end))
+        start = end + 1
+    return shards
+
+
+def interpolate_params(high: Tuple[int, int], low: Tuple[int, int], count: int) -> List[Tuple[int, int]]:
+    """在兩組 (dpi, JPEGQ) 之間平均取點，依品質由高到低排列"""
+    points = []
+    for k in range(1, count + 1):
+        ratio = k / (count + 1)
+        dpi = round(high[0] - (high[0] - low[0]) * ratio)
+        img_q = round(high[1] - (high[1] - low[1]) * ratio)
+        point = (dpi, img_q)
+        if point not in points and point != high and point != low:
+            points.append(point)
+    return points
@@ -0,0 +1,301 @@
+"""
+圖片重新壓縮引擎：只重新壓縮頁面中的圖片，文字與向量內容保持不變
+
+掃描檔模式另外分析每張圖片的實際色彩：黑白的頁面改存 1 位元 CCITT G4，灰階改存灰階 JPEG，彩色維持彩色。
+"""
+
+import io
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional, Tuple, Union
+
+from PIL import Image, ImageChops, ImageStat, features
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import ArrayObject, DictionaryObject, NameObject, NumberObject, StreamObject
+
+from .config import IMAGE_MIN_KB, IMAGE_WORKERS, SCAN_COLOR_RATIO, SCAN_MIDTONE_RATIO, SCAN_SAMPLE_PX
+from .jobs import CompressCancelled
+from .preflight import iter_page_images
+
+
+def compress_image(image_data: Union[bytes, Image.Image], quality: int) -> bytes:
+    """壓縮單張圖片（可傳入編碼後的圖片資料或已解碼的 Image）"""
+    try:
+        img = image_data if isinstance(image_data, Image.Image) else Image.open(io.BytesIO(image_data))
+
+        # 轉換為 RGB（如果是 RGBA 或其他模式）
+        if img.mode in ('RGBA', 'P', 'LA'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' or img.mode == 'LA' else None)
+            img = background
+        elif img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        # 根據品質等級縮小圖片尺寸
+        if quality <= 15:
+            # 高壓縮：縮小到 35%
+            new_size = (int(img.width * 0.35), int(img.height * 0.35))
+            if new_size[0] > 50 and new_size[1] > 50:
+                img = img.resize(new_size, Image.Resampling.LANCZOS)
+        elif quality <= 50:
+            # 中壓縮：縮小到 60%
+            new_size = (int(img.width * 0.6), int(img.height * 0.6))
+            if new_size[0] > 80 and new_size[1] > 80:
+                img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+        # 儲存為 JPEG 並壓縮
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+    except Exception:
+        return image_data if isinstance(image_data, bytes) else b""
+
+
+def estimate_jpeg_quality(img: Image.Image) -> int:
+    """依量化表估算 JPEG 的品質參數（以 libjpeg 標準亮度表換算）"""
+    tables = getattr(img, "quantization", None)
+    if not tables or 0 not in tables:
+        return 100
+    standard_sum = 3688  # libjpeg 標準亮度量化表總和（品質 50）
+    scale = sum(tables[0]) * 100 / standard_sum
+    if scale <= 100:
+        return int(round((200 - scale) / 2))
+    return int(round(5000 / scale))
+
+
+def read_pdf_image(xobject: StreamObject) -> Optional[Image.Image]:
+    """將 PDF 圖片物件解碼為 Image；不支援的格式回傳 None（保持原樣）"""
+    filters = xobject.get("/Filter")
+    if isinstance(filters, ArrayObject):
+        filters = filters[0] if len(filters) == 1 else None
+        if filters is None:
+            return None
+    if xobject.get("/ImageMask") or "/Decode" in xobject or xobject.get("/BitsPerComponent", 8) != 8:
+        return None
+    color_space = xobject.get("/ColorSpace")
+    if color_space == "/DeviceRGB":
+        mode = "RGB"
+    elif color_space == "/DeviceGray":
+        mode = "L"
+    else:
+        # CMYK、索引色與 ICC 色彩空間維持原樣，避免色彩偏差
+        return None
+
+    if filters == "/DCTDecode":
+        img = Image.open(io.BytesIO(xobject._data))
+        return img if img.mode == mode else None
+    if filters in (None, "/FlateDecode"):
+        size = (int(xobject["/Width"]), int(xobject["/Height"]))
+        return Image.frombytes(mode, size, xobject.get_data())
+    return None
+
+
+# 色偏校正後，任兩個色版相差超過此值的像素視為帶有色彩
+CHROMA_LEVEL = 32
+
+# 色彩模式 -> 掃描檔模式的分類
+SCAN_KINDS = {"1": "bitonal", "L": "gray", "RGB": "color"}
+
+
+def otsu_threshold(histogram: List[int]) -> Tuple[int, float, float]:
+    """以 Otsu 法求灰階直方圖的黑白分界，回傳 (門檻值, 暗部平均, 亮部平均)"""
+    total = sum(histogram)
+    weighted = sum(level * count for level, count in enumerate(histogram))
+    best = (0, 0.0, 0.0)
+    best_variance = -1.0
+    dark_count = dark_sum = 0
+    for level in range(255):
+        dark_count += histogram[level]
+        dark_sum += level * histogram[level]
+        light_count = total - dark_count
+        if dark_count == 0 or light_count == 0:
+            continue
+        dark_mean = dark_sum / dark_count
+        light_mean = (weighted - dark_sum) / light_count
+        variance = dark_count * light_count * (dark_mean - light_mean) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best = (level, dark_mean, light_mean)
+    return best
+
+
+def classify_scan(img: Image.Image) -> Tuple[str, int]:
+    """以縮小後的圖片判斷實際色彩，回傳 (bitonal / gray / color, 黑白門檻值)
+
+    先依各色版平均值校正整體色偏（偏黃的紙張、室內燈光），仍帶有色彩的像素夠少就視為灰階；
+    灰階中介於墨色與紙色之間的中間調夠少時再視為黑白。
+    """
+    factor = max(1, max(img.size) // SCAN_SAMPLE_PX)
+    sample = img.reduce(factor) if factor > 1 else img
+    if sample.mode == "RGB":
+        means = ImageStat.Stat(sample).mean
+        average = sum(means) / 3
+        r, g, b = (channel.point(lambda v, gain=average / max(mean, 1.0): v * gain)
+                   for channel, mean in zip(sample.split(), means))
+        chroma = ImageChops.lighter(ImageChops.lighter(ImageChops.difference(r, g), ImageChops.difference(g, b)),
+                                    ImageChops.difference(r, b))
+        histogram = chroma.histogram()
+        if sum(histogram[CHROMA_LEVEL:]) > sum(histogram) * SCAN_COLOR_RATIO:
+            return "color", 0
+        sample = sample.convert("L")
+
+    histogram = sample.histogram()
+    threshold, dark_mean, light_mean = otsu_threshold(histogram)
+    contrast = light_mean - dark_mean
+    if contrast < 64:
+        return "gray", 0
+    midtones = sum(histogram[int(dark_mean + contrast / 4):int(light_mean - contrast / 4) + 1])
+    if midtones > sum(histogram) * SCAN_MIDTONE_RATIO:
+        return "gray", 0
+    return "bitonal", threshold
+
+
+def encode_bitonal(img: Image.Image, threshold: int, max_side: int) -> Tuple[bytes, Tuple[int, int], str]:
+    """以門檻值轉成黑白並編碼，回傳 (資料, 尺寸, PDF 篩選器)
+
+    長邊超過 max_side 時先以灰階縮小再二值化，筆畫邊緣比直接縮小黑白圖清楚。
+    Pillow 附有 libtiff 時編碼為 CCITT G4，否則以 Flate 壓縮 1 位元像素。
+    """
+    gray = img.convert("L")
+    scale = max_side / max(gray.size)
+    if scale < 1:
+        gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))),
+                           Image.Resampling.LANCZOS)
+
+    if features.check_codec("libtiff"):
+        # 墨色存成 1、紙色存成 0：CCITT 編碼以白色長段為主，大片紙色最省空間，對應 PDF 預設的 BlackIs1 false
+        ink = gray.point(lambda v: 255 if v <= threshold else 0, "1")
+        buffer = io.BytesIO()
+        # 整張圖必須是單一條帶，才能直接取出編碼資料放進 PDF
+        ink.save(buffer, "TIFF", compression="group4", strip_size=1 << 30)
+        buffer.seek(0)
+        with Image.open(buffer) as tiff:
+            offsets, counts = tiff.tag_v2.get(273), tiff.tag_v2.get(279)
+        if offsets is not None and len(offsets) == 1:
+            return buffer.getvalue()[offsets[0]:offsets[0] + counts[0]], gray.size, "/CCITTFaxDecode"
+
+    # DeviceGray 的 1 位元像素以 1 為白色，Pillow 的 1 位元資料逐列補齊到位元組，與 PDF 相同
+    paper = gray.point(lambda v: 255 if v > threshold else 0, "1")
+    return zlib.compress(paper.tobytes()), gray.size, "/FlateDecode"
+
+
+def recompress_pdf_image(xobject: StreamObject, quality: int,
+                         mono_max_side: int = 0) -> Optional[Tuple[bytes, Tuple[int, int], str, str]]:
+    """重新壓縮單張圖片，回傳 (編碼後資料, 尺寸, 色彩模式, PDF 篩選器)；不需處理或沒有變小時回傳 None
+
+    mono_max_side 大於 0 時為掃描檔模式：黑白圖片以此長邊像素數存成 1 位元，灰階圖片改存灰階 JPEG。
+    """
+    raw_size = len(xobject._data)
+    if raw_size < IMAGE_MIN_KB * 1024:
+        return None
+    # 以色彩值範圍指定透明色（/Mask 陣列）的圖片，有損壓縮或改變色彩空間後像素值就對不上範圍，透明處會露出來
+    if "/Mask" in xobject and isinstance(xobject["/Mask"], ArrayObject):
+        return None
+    img = read_pdf_image(xobject)
+    if img is None:
+        return None
+
+    mode = img.mode
+    if mono_max_side:
+        kind, threshold = classify_scan(img)
+        if kind == "bitonal":
+            data, size, filter_name = encode_bitonal(img, threshold, mono_max_side)
+            return (data, size, "1", filter_name) if len(data) < raw_size * 0.9 else None
+        if kind == "gray" and img.mode != "L":
+            img = img.convert("L")
+
+    # 已經是同等或更低品質的 JPEG，重新壓縮只會損失畫質
+    if (xobject.get("/Filter") == "/DCTDecode" and img.mode == mode and
+            estimate_jpeg_quality(img) <= quality):
+        return None
+
+    jpeg = compress_image(img, quality)
+    if not jpeg or len(jpeg) >= raw_size * 0.9:
+        return None
+    with Image.open(io.BytesIO(jpeg)) as result:
+        return jpeg, result.size, result.mode, "/DCTDecode"
+
+
+def compress_pdf_images(input_path: str, output_path: str, image_quality: int,
+                        cancel_event: Optional[threading.Event] = None, on_progress=None,
+                        mono_dpi: int = 0, counters: Optional[dict] = None) -> int:
+    """只重新壓縮頁面中的圖片，文字與向量內容保持不變；回傳重新壓縮的圖片數
+
+    圖片以執行緒平行交給 compress_image（Pillow 解碼、縮放與編碼時會釋放 GIL），
+    同時處理中的圖片數有上限，記憶體用量不隨圖片總數增加。
+    mono_dpi 大於 0 時為掃描檔模式，黑白圖片以頁面尺寸換算此解析度存成 1 位元；
+    傳入 counters 時依結果累加 bitonal / gray / color 的圖片數。
+    """
+    with open(input_path, "rb") as input_handle:
+        writer = PdfWriter()
+        writer.append(input_handle)
+        total_pages = len(writer.pages)
+
+        recompressed = 0
+        seen = set()
+        max_in_flight = max(1, IMAGE_WORKERS) * 2
+        with ThreadPoolExecutor(max_workers=max(1, IMAGE_WORKERS)) as pool:
+            pending = {}
+
+            def collect(futures):
+                nonlocal recompressed
+                for future in futures:
+                    xobject, _ = pending.pop(future)
+                    result = future.result()
+                    if result is None:
+                        continue
+                    data, (width, height), mode, filter_name = result
+                    xobject._data = data
+                    xobject[NameObject("/Filter")] = NameObject(filter_name)
+                    xobject[NameObject("/Width")] = NumberObject(width)
+                    xobject[NameObject("/Height")] = NumberObject(height)
+                    xobject[NameObject("/ColorSpace")] = NameObject("/DeviceRGB" if mode == "RGB" else "/DeviceGray")
+                    xobject[NameObject("/BitsPerComponent")] = NumberObject(1 if mode == "1" else 8)
+                    if "/DecodeParms" in xobject:
+                        del xobject["/DecodeParms"]
+                    if filter_name == "/CCITTFaxDecode":
+                        xobject[NameObject("/DecodeParms")] = DictionaryObject({
+                            NameObject("/K"): NumberObject(-1),
+                            NameObject("/Columns"): NumberObject(width),
+                            NameObject("/Rows"): NumberObject(height),
+                        })
+                    recompressed += 1
+                    if counters is not None:
+                        counters[SCAN_KINDS[mode]] = counters.get(SCAN_KINDS[mode], 0) + 1
+
+            def report(next_page: int):
+                if on_progress is not None:
+                    # 尚有圖片在處理中的最前面一頁之前都已完成
+                    first_pending = min((page for _, page in pending.values()), default=next_page)
+                    on_progress(first_pending, total_pages)
+
+            for page_idx, page in enumerate(writer.pages):
+                # 掃描頁的圖片通常鋪滿整頁，以頁面長邊換算黑白圖片保留的像素數
+                mono_max_side = 0
+                if mono_dpi > 0:
+                    mono_max_side = int(max(float(page.mediabox.width), float(page.mediabox.height)) / 72 * mono_dpi)
+                for xobject in iter_page_images(page.get("/Resources"), seen):
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise CompressCancelled()
+                    if len(pending) >= max_in_flight:
+                        done, _ = wait(set(pending), return_when=FIRST_COMPLETED)
+                        collect(done)
+                        report(page_idx)
+                    pending[pool.submit(recompress_pdf_image, xobject, image_quality, mono_max_side)] = (xobject, page_idx)
+                report(page_idx + 1)
+
+            while pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    for future in pending:
+                        future.cancel()
+                    raise CompressCancelled()
+                done, _ = wait(set(pending), timeout=0.1, return_when=FIRST_COMPLETED)
+                collect(done)
+                report(total_pages)
+
+        with open(output_path, "wb") as output:
+            writer.write(output)
+    return recompressed
@@ -0,0 +1,159 @@
+"""
+全伺服器共用的工作排程
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class CompressCancelled(Exception):
+    """壓縮工作被取消"""
+
+
+class Job:
+    """排程器中的一個工作"""
+
+    def __init__(self, func, args: tuple, kwargs: dict):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.status = "queued"
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._result = None
+        self._error = None
+        self.pages_done = 0
+        self.pages_total = 0
+
+    def update_progress(self, done: int, total: int):
+        """由工作內部回報頁數進度"""
+        self.pages_done = done
+        self.pages_total = total
+
+    @property
+    def wait_time(self) -> float:
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.submitted_at
+
+    @property
+    def run_time(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def result(self):
+        """取得結果，工作失敗時重新拋出原本的例外"""
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class JobScheduler:
+    """全伺服器共用的工作排程器：限制同時執行數量，其餘依先進先出排隊"""
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max(1, max_concurrent)
+        self._queue: "deque[Job]" = deque()
+        self._running = set()
+        self._condition = threading.Condition()
+        self._wait_times = deque(maxlen=200)
+        self._run_times = deque(maxlen=200)
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0}
+        for i in range(self.max_concurrent):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, func, *args, **kwargs) -> Job:
+        """加入工作；func 會額外收到 cancel_event 與 on_progress 參數"""
+        job = Job(func, args, kwargs)
+        job.kwargs["cancel_event"] = job.cancel_event
+        job.kwargs["on_progress"] = job.update_progress
+        with self._condition:
+            self._queue.append(job)
+            self.counters["submitted"] += 1
+            self._condition.notify()
+        return job
+
+    def cancel(self, job: Job):
+        """取消排隊中或執行中的工作"""
+        job.cancel_event.set()
+        with self._condition:
+            if job in self._queue:
+                self._queue.remove(job)
+                self._finish(job, "cancelled")
+
+    def position(self, job: Job) -> int:
+        """排隊順位（從 1 開始），已開始執行則回傳 0"""
+        with self._condition:
+            try:
+                return self._queue.index(job) + 1
+            except ValueError:
+                return 0
+
+    def estimated_wait(self, job: Job) -> float:
+        """依近期平均執行時間估計還需等待的秒數"""
+        position = self.position(job)
+        if position == 0:
+            return 0.0
+        with self._condition:
+            average = sum(self._run_times) / len(self._run_times) if self._run_times else 30.0
+        return ((position - 1) // self.max_concurrent + 1) * average
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                job = self._queue.popleft()
+                self._running.add(job)
+                job.status = "running"
+                job.started_at = time.monotonic()
+                self._wait_times.append(job.wait_time)
+                queued = len(self._queue)
+
+            # 排隊時間寫入效能紀錄（在此匯入以避免與 metrics 互相匯入）
+            from .metrics import record
+            record("queue_wait", job.wait_time, still_queued=queued)
+
+            try:
+                job._result = job.func(*job.args, **job.kwargs)
+                status = "done"
+            except CompressCancelled as e:
+                job._error = e
+                status = "cancelled"
+            except Exception as e:
+                job._error = e
+                status = "cancelled" if job.cancel_event.is_set() else "failed"
+
+            with self._condition:
+                self._running.discard(job)
+                self._run_times.append(job.run_time)
+                self._finish(job, status)
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = time.monotonic()
+        self.counters["completed" if status == "done" else status] += 1
+        if status == "cancelled" and job._error is None:
+            job._error = CompressCancelled()
+        job.finished.set()
+
+    def stats(self) -> dict:
+        """回傳佇列深度、等待時間與執行時間統計"""
+        with self._condition:
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            return {
+                **self.counters,
+                "queue_depth": len(self._queue),
+                "running": len(self._running),
+                "max_concurrent": self.max_concurrent,
+                "avg_wait": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+                "max_wait": max(wait_times, default=0.0),
+                "avg_run": sum(run_times) / len(run_times) if run_times else 0.0,
+                "max_run": max(run_times, default=0.0),
+            }
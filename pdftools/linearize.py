@@ -0,0 +1,154 @@
+"""
+線性化（快速網頁檢視）：重新排列物件，讓瀏覽器下載到第一頁所需的部分就能開始顯示
+
+優先使用 qpdf（只調整物件順序並加上提示表，不重新編碼任何內容）；沒有 qpdf 時改以 Ghostscript 的
+-dFastWebView 重新輸出，並關閉圖片降低取樣，畫質與原檔相同。
+"""
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import BinaryIO, List, Optional, Union
+
+from .config import GS_TIMEOUT, LINEARIZE_TOOL, MEMORY_BUFFER_MB
+from .files import StagedFile, path_fds
+from .ghostscript import SubprocessBackend, wait_process
+from .metrics import stage
+
+# 線性化參數字典必須是檔案的第一個物件，且位於前 1024 個位元組內
+LINEARIZED_PATTERN = re.compile(rb"<<\s*/Linearized\s+[\d.]+(.*?)>>", re.DOTALL)
+
+
+def linearization_params(source: Union[str, BinaryIO]) -> Optional[dict]:
+    """讀取檔案開頭的線性化參數，回傳 {"L": 檔案長度, "E": 第一頁區段結尾, ...}；不是有效的線性化檔案時回傳 None
+
+    線性化後又以增量更新修改過的檔案，/L 不再等於檔案大小，視為失效。
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            head = f.read(1024)
+            size = os.fstat(f.fileno()).st_size
+    else:
+        source.seek(0)
+        head = source.read(1024)
+        source.seek(0, os.SEEK_END)
+        size = source.tell()
+        source.seek(0)
+    match = LINEARIZED_PATTERN.search(head)
+    if match is None:
+        return None
+    # /H 是陣列，只取單一整數的項目
+    params = {key.decode(): int(value) for key, value in re.findall(rb"/([A-Z])\s+(\d+)", match.group(1))}
+    if params.get("L") != size or "E" not in params:
+        return None
+    return params
+
+
+def is_linearized(source: Union[str, BinaryIO]) -> bool:
+    return linearization_params(source) is not None
+
+
+def first_page_bytes(source: Union[str, BinaryIO]) -> int:
+    """依序下載時，顯示第一頁前必須取得的位元組數
+
+    線性化檔案只需下載到第一頁區段的結尾（/E）；一般檔案的交叉參照表在檔尾，必須下載整份檔案。
+    """
+    params = linearization_params(source)
+    if params is not None:
+        return params["E"]
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def linearize_tool() -> Optional[str]:
+    """依 PDF_LINEARIZE_TOOL 選擇工具：auto 時優先 qpdf，其次 gs；找不到時回傳 None"""
+    tools = [LINEARIZE_TOOL] if LINEARIZE_TOOL in ("qpdf", "gs") else ["qpdf", "gs"]
+    return next((tool for tool in tools if shutil.which(tool)), None)
+
+
+def build_linearize_command(tool: str, input_path: str, output_path: str) -> List[str]:
+    if tool == "qpdf":
+        return ["qpdf", "--linearize", input_path, output_path]
+    return [
+        'gs',
+        '-sDEVICE=pdfwrite',
+        '-dNOPAUSE',
+        '-dBATCH',
+        '-dFastWebView=true',
+        '-dAutoRotatePages=/None',
+        '-dDownsampleColorImages=false',
+        '-dDownsampleGrayImages=false',
+        '-dDownsampleMonoImages=false',
+        '-dPassThroughJPEGImages=true',
+        f'-sOutputFile={output_path}',
+        input_path,
+    ]
+
+
+def linearize_pdf(input_path: str, output_path: str, cancel_event: Optional[threading.Event] = None,
+                  backend=None) -> str:
+    """將 input_path 線性化寫入 output_path，回傳 done / failed / timeout / cancelled / unavailable
+
+    使用 Ghostscript 時交給 backend 執行，與壓縮共用同時執行的 gs 程序數上限。
+    """
+    tool = linearize_tool()
+    if tool is None:
+        return "unavailable"
+    command = build_linearize_command(tool, input_path, output_path)
+    pass_fds = path_fds(input_path) + path_fds(output_path)
+    with stage("linearize", os.path.getsize(input_path), tool=tool) as record:
+        if tool == "gs":
+            outcome = (backend or SubprocessBackend()).run(command, cancel_event, pass_fds)
+        else:
+            try:
+                process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                           pass_fds=pass_fds, start_new_session=True)
+                outcome = wait_process(process, GS_TIMEOUT, cancel_event)
+                # qpdf 以結束碼 3 表示成功但有警告（例如修復了損壞的交叉參照表）
+                if outcome == "done" and process.returncode not in (0, 3):
+                    outcome = "failed"
+            except OSError:
+                outcome = "failed"
+        if outcome == "done" and not is_linearized(output_path):
+            outcome = "failed"
+        record["outcome"] = "success" if outcome == "done" else outcome
+        if outcome == "done":
+            record.update(bytes_out=os.path.getsize(output_path), first_page_bytes=first_page_bytes(output_path))
+    return outcome
+
+
+def linearize_in_place(path: str, cancel_event: Optional[threading.Event] = None, backend=None) -> bool:
+    """就地線性化 path（已經線性化時不再處理），失敗時保留原檔；回傳結果是否為線性化檔案"""
+    if is_linearized(path):
+        return True
+    with StagedFile(size_hint=os.path.getsize(path)) as output:
+        if linearize_pdf(path, output.path, cancel_event, backend) != "done":
+            return False
+        shutil.copyfile(output.path, path)
+    return True
+
+
+def linearize_file(source: BinaryIO, cancel_event: Optional[threading.Event] = None,
+                   backend=None) -> Optional[BinaryIO]:
+    """線性化檔案物件的內容，回傳新的已倒回開頭的暫存檔；無法線性化時回傳 None（source 保持不變）"""
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    with StagedFile(size_hint=size) as staged:
+        with open(staged.path, "wb") as f:
+            shutil.copyfileobj(source, f)
+        source.seek(0)
+        if not linearize_in_place(staged.path, cancel_event, backend):
+            return None
+        output = tempfile.SpooledTemporaryFile(max_size=int(MEMORY_BUFFER_MB * 1024 * 1024))
+        with open(staged.path, "rb") as f:
+            shutil.copyfileobj(f, output)
+    output.seek(0)
+    return output
@@ -0,0 +1,79 @@
+"""
+PDF 合併
+"""
+
+import io
+import os
+import tempfile
+from typing import BinaryIO, Iterable, List, Tuple, Union
+
+from PyPDF2 import PdfMerger, PdfReader
+
+from .config import MEMORY_BUFFER_MB
+from .files import StagedFile
+from .linearize import first_page_bytes, is_linearized, linearize_file, linearize_in_place
+from .metrics import stage
+from .utils import as_stream, data_size
+from .writer import StreamingPdfWriter
+
+
+def merge_pdfs(files: List[Union[bytes, BinaryIO]], linearize: bool = False, backend=None) -> bytes:
+    """合併多個 PDF 檔案（可傳入位元組資料或檔案物件）；linearize 為 True 時輸出線性化（快速網頁檢視）的檔案"""
+    with stage("merge", sum(data_size(data) for data in files), impl="pypdf", files=len(files)) as record:
+        merger = PdfMerger()
+
+        for pdf_bytes in files:
+            merger.append(as_stream(pdf_bytes))
+
+        output = io.BytesIO()
+        merger.write(output)
+        merger.close()
+
+        record["bytes_out"] = output.tell()
+
+    if linearize:
+        with StagedFile(output.getvalue()) as staged:
+            if linearize_in_place(staged.path, backend=backend):
+                return staged.read_bytes()
+    return output.getvalue()
+
+
+def merge_pdfs_streaming(files: Iterable[Union[bytes, BinaryIO]], dedupe: bool = True, linearize: bool = False,
+                         backend=None) -> Tuple[BinaryIO, dict]:
+    """串流合併多個 PDF 至暫存檔，記憶體用量只取決於最大的單一輸入；回傳 (已倒回開頭的檔案, 統計)
+
+    linearize 為 True 時再以 qpdf 或 Ghostscript 線性化（快速網頁檢視），無法線性化時輸出一般檔案。
+    """
+    with stage("merge", impl="streaming") as record:
+        output = tempfile.SpooledTemporaryFile(max_size=int(MEMORY_BUFFER_MB * 1024 * 1024))
+        writer = StreamingPdfWriter(output, dedupe=dedupe)
+
+        for data in record_inputs(files, record):
+            reader = PdfReader(as_stream(data))
+            if reader.is_encrypted:
+                reader.decrypt("")
+            writer.append(reader)
+        writer.finish()
+
+        stats = dict(writer.counters, pages=len(writer.page_refs), output_size=output.tell())
+        record.update(bytes_out=stats["output_size"], pages=stats["pages"])
+        output.seek(0)
+
+    if linearize:
+        linear = linearize_file(output, backend=backend)
+        if linear is not None:
+            output.close()
+            output = linear
+            output.seek(0, os.SEEK_END)
+            stats["output_size"] = output.tell()
+    stats.update(linearized=is_linearized(output), first_page_bytes=first_page_bytes(output))
+    return output, stats
+
+
+def record_inputs(files: Iterable[Union[bytes, BinaryIO]], record: dict) -> Iterable[Union[bytes, BinaryIO]]:
+    """逐一取出輸入並累計檔案數與大小（files 可為產生器）"""
+    record.update(files=0, bytes_in=0)
+    for data in files:
+        record["files"] += 1
+        record["bytes_in"] += data_size(data)
+        yield data
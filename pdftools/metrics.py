@@ -0,0 +1,241 @@
+"""
+效能紀錄：各處理階段的耗時、輸入輸出大小、CPU 與記憶體用量及執行結果
+
+每個階段結束時寫出一筆 JSON 紀錄（logger 名稱 pdftools.metrics），並彙總成百分位數統計，
+可輸出為 Prometheus 文字格式。
+
+    with stage("merge", bytes_in=total) as record:
+        ...
+        record["bytes_out"] = size
+"""
+
+import json
+import logging
+import math
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+from .config import METRICS_LOG, METRICS_WINDOW
+from .jobs import CompressCancelled
+
+logger = logging.getLogger(__name__)
+
+# 彙總時累加的欄位
+SUM_FIELDS = ("bytes_in", "bytes_out", "cpu_s", "child_cpu_s")
+_END = object()
+# configure_log 加入的輸出目標
+_log_handler = None
+
+
+def process_rss_kb() -> int:
+    """本程序目前的常駐記憶體（KB），無法取得時回傳 0
+
+    不使用 ru_maxrss：那是程序啟動以來的最高值，長時間執行的伺服器中無法反映現況。
+    """
+    try:
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def _label(value: str) -> str:
+    """Prometheus 標籤值的跳脫：反斜線、雙引號與換行"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """彙總各階段的紀錄：次數、各結果次數、累計量與最近 window 筆耗時"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, record: dict):
+        with self._lock:
+            entry = self._stages.get(record["stage"])
+            if entry is None:
+                entry = self._stages[record["stage"]] = {
+                    "count": 0, "outcomes": {}, "duration_s": 0.0, "child_max_rss_kb": 0,
+                    "recent": deque(maxlen=self.window), **{key: 0 for key in SUM_FIELDS},
+                }
+            entry["count"] += 1
+            entry["outcomes"][record["outcome"]] = entry["outcomes"].get(record["outcome"], 0) + 1
+            entry["duration_s"] += record["duration_s"]
+            entry["recent"].append(record["duration_s"])
+            for key in SUM_FIELDS:
+                entry[key] += record.get(key) or 0
+            entry["child_max_rss_kb"] = max(entry["child_max_rss_kb"], record.get("child_max_rss_kb") or 0)
+
+    def stats(self) -> dict:
+        """回傳 {階段: 統計}，耗時百分位數以最近 window 筆計算"""
+        with self._lock:
+            stages = {name: dict(entry, outcomes=dict(entry["outcomes"]), recent=sorted(entry["recent"]))
+                      for name, entry in self._stages.items()}
+        for entry in stages.values():
+            recent = entry.pop("recent")
+            # nearest-rank：第 ceil(n × q) 小的值
+            for label, quantile in (("p50_s", 0.5), ("p95_s", 0.95), ("p99_s", 0.99)):
+                entry[label] = recent[max(0, math.ceil(round(len(recent) * quantile, 9)) - 1)]
+            entry["max_s"] = recent[-1]
+        return stages
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+    def prometheus(self) -> str:
+        """以 Prometheus 文字格式輸出"""
+        stages = self.stats()
+        lines = [
+            "# HELP pdftools_stage_duration_seconds Stage duration (quantiles over the most recent runs).",
+            "# TYPE pdftools_stage_duration_seconds summary",
+        ]
+        stages = {_label(name): entry for name, entry in stages.items()}
+        for name, entry in sorted(stages.items()):
+            for label, quantile in (("p50_s", "0.5"), ("p95_s", "0.95"), ("p99_s", "0.99")):
+                lines.append(f'pdftools_stage_duration_seconds{{stage="{name}",quantile="{quantile}"}} {entry[label]:.6f}')
+            lines.append(f'pdftools_stage_duration_seconds_sum{{stage="{name}"}} {entry["duration_s"]:.6f}')
+            lines.append(f'pdftools_stage_duration_seconds_count{{stage="{name}"}} {entry["count"]}')
+
+        lines += ["# HELP pdftools_stage_total Finished stages by outcome.", "# TYPE pdftools_stage_total counter"]
+        for name, entry in sorted(stages.items()):
+            for outcome, count in sorted(entry["outcomes"].items()):
+                lines.append(f'pdftools_stage_total{{stage="{name}",outcome="{_label(outcome)}"}} {count}')
+
+        for metric, key, kind, help_text in (
+            ("pdftools_stage_bytes_in_total", "bytes_in", "counter", "Bytes read by the stage."),
+            ("pdftools_stage_bytes_out_total", "bytes_out", "counter", "Bytes produced by the stage."),
+            ("pdftools_stage_cpu_seconds_total", "cpu_s", "counter", "CPU time of the calling thread."),
+            ("pdftools_stage_child_cpu_seconds_total", "child_cpu_s", "counter", "CPU time of Ghostscript processes."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for name, entry in sorted(stages.items()):
+                lines.append(f'{metric}{{stage="{name}"}} {round(entry[key], 6)}')
+
+        lines += ["# HELP pdftools_stage_child_max_rss_bytes Peak RSS of a Ghostscript process.",
+                  "# TYPE pdftools_stage_child_max_rss_bytes gauge"]
+        for name, entry in sorted(stages.items()):
+            if entry["child_max_rss_kb"]:
+                lines.append(f'pdftools_stage_child_max_rss_bytes{{stage="{name}"}} {entry["child_max_rss_kb"] * 1024}')
+        lines += ["# HELP pdftools_process_resident_memory_bytes Current RSS of this process.",
+                  "# TYPE pdftools_process_resident_memory_bytes gauge",
+                  f"pdftools_process_resident_memory_bytes {process_rss_kb() * 1024}"]
+        return "\n".join(lines) + "\n"
+
+
+# 程序內共用的彙總
+registry = MetricsRegistry()
+
+
+def record(name: str, duration_s: float, outcome: str = "success", **fields):
+    """寫出一筆已量測好的紀錄"""
+    entry = {"stage": name, "outcome": outcome, "duration_s": round(duration_s, 6), **fields}
+    registry.observe(entry)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(dict(entry, ts=round(time.time(), 3)), ensure_ascii=False, default=str))
+
+
+@contextmanager
+def stage(name: str, bytes_in: int = 0, **fields) -> Iterator[dict]:
+    """量測一個階段：耗時與本執行緒 CPU 時間，例外時結果記為 error
+
+    呼叫端可在 record 中填入 bytes_out、outcome、child_cpu_s、child_max_rss_kb 等欄位。
+    """
+    entry = {"bytes_in": bytes_in, "bytes_out": 0, "outcome": "success", **fields}
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    try:
+        yield entry
+    except GeneratorExit:
+        entry["outcome"] = "closed"
+        raise
+    except BaseException as e:
+        if entry["outcome"] == "success":
+            entry["outcome"] = "cancelled" if isinstance(e, CompressCancelled) else "error"
+        entry.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        duration = time.perf_counter() - started - entry.pop("paused_s", 0.0)
+        entry["cpu_s"] = round(time.thread_time() - cpu_started - entry.pop("paused_cpu_s", 0.0), 6)
+        record(name, duration, entry.pop("outcome"), **entry)
+
+
+@contextmanager
+def paused(entry: dict):
+    """區塊內的時間不計入 entry 所屬的階段（例如等待上游產生資料、交給呼叫端處理）"""
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    try:
+        yield
+    finally:
+        entry["paused_s"] = entry.get("paused_s", 0.0) + time.perf_counter() - started
+        entry["paused_cpu_s"] = entry.get("paused_cpu_s", 0.0) + time.thread_time() - cpu_started
+
+
+def iter_paused(items: Iterable, entry: dict) -> Iterator:
+    """逐項取出 items，等待上游產生的時間不計入階段耗時"""
+    iterator = iter(items)
+    while True:
+        with paused(entry):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1", metrics: Optional[MetricsRegistry] = None):
+    """在背景執行緒提供 http://host:port/metrics（Prometheus 文字格式），回傳伺服器物件"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    metrics = metrics or registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="pdftools-metrics").start()
+    return server
+
+
+def configure_log(target: str = METRICS_LOG) -> Optional[logging.Handler]:
+    """將 JSON 紀錄逐行寫到 target：- 為標準錯誤，其他為檔案路徑；空白時只交給 logging 的既有設定
+
+    由應用程式與命令列的進入點呼叫；重複呼叫時取代先前加入的輸出目標。
+    """
+    global _log_handler
+    if _log_handler is not None:
+        logger.removeHandler(_log_handler)
+        _log_handler.close()
+        _log_handler = None
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+    if not target:
+        return None
+    handler = logging.StreamHandler(sys.stderr) if target == "-" else logging.FileHandler(target, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    _log_handler = handler
+    return handler
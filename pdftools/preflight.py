@@ -0,0 +1,249 @@
+"""
+預檢：不轉換檔案，只解析結構來預估壓縮效果
+"""
+
+import os
+import re
+import threading
+from typing import BinaryIO, Iterable, List, Optional, Tuple, Union
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, StreamObject
+
+from .config import GS_DOWNSAMPLE_THRESHOLD, LOSSLESS_MAX_IMAGE_RATIO, QUALITY_SETTINGS
+from .jobs import CompressCancelled
+
+
+def resolved_length(stream) -> int:
+    """取得串流物件在檔案中的壓縮後長度"""
+    # PyPDF2 解析後會移除 /Length，改以原始資料長度為準
+    data = getattr(stream, "_data", None)
+    if data is not None:
+        return len(data)
+    length = stream.get("/Length", 0)
+    if hasattr(length, "get_object"):
+        length = length.get_object()
+    try:
+        return int(length)
+    except (TypeError, ValueError):
+        return 0
+
+
+def font_file_bytes(font) -> int:
+    """字型內嵌檔案（含複合字型的子字型）的位元組數"""
+    size = 0
+    descriptors = [font.get("/FontDescriptor")]
+    descendants = font.get("/DescendantFonts")
+    if descendants is not None:
+        descriptors += [d.get_object().get("/FontDescriptor") for d in descendants.get_object()]
+    for descriptor in descriptors:
+        if descriptor is None:
+            continue
+        descriptor = descriptor.get_object()
+        for key in ("/FontFile", "/FontFile2", "/FontFile3"):
+            if key in descriptor:
+                size += resolved_length(descriptor[key].get_object())
+    return size
+
+
+# 內容串流中常見的圖片放置方式：「a b c d e f cm /名稱 Do」
+IMAGE_PLACEMENT_PATTERN = re.compile(
+    rb"([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+[-\d.]+\s+[-\d.]+\s+cm\s*(/[^\s/\[\]()<>]+)\s*Do"
+)
+
+
+def stream_filter_name(stream: StreamObject) -> str:
+    filters = stream.get("/Filter")
+    if filters is None:
+        return "none"
+    if isinstance(filters, ArrayObject):
+        return "+".join(str(f) for f in filters)
+    return str(filters)
+
+
+def iter_page_images(resources, seen: set) -> Iterable[StreamObject]:
+    """列出頁面資源中的圖片物件（含表單 XObject 內的圖片），同一物件只列出一次"""
+    if resources is None:
+        return
+    xobjects = resources.get_object().get("/XObject")
+    if xobjects is None:
+        return
+    for xobject in xobjects.get_object().values():
+        obj = xobject.get_object()
+        if id(obj) in seen or not isinstance(obj, StreamObject):
+            continue
+        seen.add(id(obj))
+        if obj.get("/Subtype") == "/Image":
+            yield obj
+        elif obj.get("/Subtype") == "/Form":
+            yield from iter_page_images(obj.get("/Resources"), seen)
+
+
+def build_cost_profile(source: Union[str, BinaryIO], cancel_event: Optional[threading.Event] = None) -> dict:
+    """預檢：解析一次 PDF，統計圖片、字型、頁面內容與其他結構各占的位元組數，並列出每張圖片的資訊
+
+    圖片的有效 DPI 依內容串流中的放置尺寸計算；找不到放置方式時以鋪滿頁面估算。
+    cancel_event 被設定時在下一頁之前拋出 CompressCancelled。
+    """
+    if isinstance(source, str):
+        file_size = os.path.getsize(source)
+        with open(source, "rb") as handle:
+            return build_cost_profile_from(PdfReader(handle), file_size, cancel_event)
+    source.seek(0, os.SEEK_END)
+    file_size = source.tell()
+    source.seek(0)
+    return build_cost_profile_from(PdfReader(source), file_size, cancel_event)
+
+
+def build_cost_profile_from(reader: PdfReader, file_size: int, cancel_event: Optional[threading.Event] = None) -> dict:
+    """由已開啟的 reader 建立預檢結果，參見 build_cost_profile"""
+    if reader.is_encrypted:
+        raise ValueError("加密的 PDF 無法預檢")
+
+    images = {}
+    seen_fonts = set()
+    seen_contents = set()
+    font_bytes = 0
+    content_bytes = 0
+    content_uncompressed_bytes = 0
+
+    for page in reader.pages:
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompressCancelled()
+        page_width = float(page.mediabox.width) or 612.0
+        page_height = float(page.mediabox.height) or 792.0
+
+        contents = page.get("/Contents")
+        content_streams = []
+        if contents is not None:
+            contents = contents.get_object()
+            content_streams = [c.get_object() for c in (contents if isinstance(contents, list) else [contents])]
+        for stream in content_streams:
+            if id(stream) in seen_contents:
+                continue
+            seen_contents.add(id(stream))
+            content_bytes += resolved_length(stream)
+            if "/Filter" not in stream:
+                content_uncompressed_bytes += resolved_length(stream)
+
+        resources = page.get("/Resources")
+        resources = resources.get_object() if resources is not None else {}
+
+        fonts = resources.get("/Font")
+        if fonts is not None:
+            for ref in fonts.get_object().values():
+                if hasattr(ref, "idnum") and ref.idnum in seen_fonts:
+                    continue
+                if hasattr(ref, "idnum"):
+                    seen_fonts.add(ref.idnum)
+                font_bytes += font_file_bytes(ref.get_object())
+
+        # 只在頁面直接使用圖片時才解讀內容串流，找出放置尺寸
+        xobjects = resources.get("/XObject")
+        placements = {}
+        if xobjects is not None and content_streams:
+            page_images = {
+                name: ref for name, ref in xobjects.get_object().items()
+                if ref.get_object().get("/Subtype") == "/Image"
+            }
+            if page_images:
+                data = b"\n".join(stream.get_data() for stream in content_streams)
+                for match in IMAGE_PLACEMENT_PATTERN.finditer(data):
+                    try:
+                        a, b, c, d = (float(v) for v in match.groups()[:4])
+                    except ValueError:
+                        continue
+                    name = match.group(5).decode("latin-1")
+                    width_pt, height_pt = (a * a + b * b) ** 0.5, (c * c + d * d) ** 0.5
+                    if width_pt > 0 and height_pt > 0:
+                        placements[name] = (width_pt, height_pt)
+
+        if xobjects is None:
+            continue
+        names = {id(ref.get_object()): name for name, ref in xobjects.get_object().items()}
+        for xobject in iter_page_images(resources, set()):
+            width = int(xobject.get("/Width", 0) or 0)
+            height = int(xobject.get("/Height", 0) or 0)
+            width_pt, height_pt = placements.get(names.get(id(xobject)), (page_width, page_height))
+            dpi = max(width / (width_pt / 72), height / (height_pt / 72)) if width and height else 0.0
+            info = images.get(id(xobject))
+            if info is not None:
+                info["dpi"] = max(info["dpi"], dpi)
+                continue
+            color_space = xobject.get("/ColorSpace")
+            images[id(xobject)] = {
+                "width": width,
+                "height": height,
+                "components": 1 if color_space == "/DeviceGray" else 4 if color_space == "/DeviceCMYK" else 3,
+                "filter": stream_filter_name(xobject),
+                "bytes": len(xobject._data),
+                "dpi": dpi,
+            }
+
+    image_list = list(images.values())
+    image_bytes = sum(image["bytes"] for image in image_list)
+    return {
+        "file_size": file_size,
+        "pages": len(reader.pages),
+        "image_bytes": image_bytes,
+        "font_bytes": font_bytes,
+        "content_bytes": content_bytes,
+        "content_uncompressed_bytes": content_uncompressed_bytes,
+        "other_bytes": max(0, file_size - image_bytes - font_bytes - content_bytes),
+        "images": image_list,
+    }
+
+
+def jpeg_bytes_per_pixel(quality: int) -> float:
+    """JPEG 每個 RGB 像素的平均位元組數（依一般照片與掃描檔的經驗值內插）"""
+    points = [(10, 0.03), (20, 0.045), (30, 0.06), (50, 0.085), (75, 0.13), (95, 0.32), (100, 0.6)]
+    if quality <= points[0][0]:
+        return points[0][1]
+    for (q1, b1), (q2, b2) in zip(points, points[1:]):
+        if quality <= q2:
+            return b1 + (b2 - b1) * (quality - q1) / (q2 - q1)
+    return points[-1][1]
+
+
+def predict_compressed_size(profile: dict, dpi: int, image_quality: int) -> int:
+    """依預檢結果預估以指定 DPI 與圖片品質執行 Ghostscript 後的大小"""
+    # 字型大致保留；未壓縮的內容串流約可壓到三成；其餘結構重新寫出後通常會變小
+    total = (profile["font_bytes"]
+             + profile["content_bytes"] - profile["content_uncompressed_bytes"]
+             + int(profile["content_uncompressed_bytes"] * 0.3)
+             + int(profile["other_bytes"] * 0.6))
+    per_pixel = jpeg_bytes_per_pixel(image_quality)
+    for image in profile["images"]:
+        scale = 1.0
+        if image["dpi"] > dpi * GS_DOWNSAMPLE_THRESHOLD:
+            scale = dpi / image["dpi"]
+        pixels = image["width"] * image["height"] * scale * scale
+        estimate = pixels * per_pixel * image["components"] / 3
+        total += int(min(image["bytes"], estimate))
+    return min(total, profile["file_size"])
+
+
+def predict_quality_sizes(profile: dict) -> dict:
+    """各壓縮程度的預估大小"""
+    return {
+        quality: predict_compressed_size(profile, settings["dpi"], settings["image_quality"])
+        for quality, settings in QUALITY_SETTINGS.items()
+    }
+
+
+def prune_candidates(profile: dict, candidates: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """略過預估大小與前一組（品質較高）幾乎相同的參數；candidates 依品質由高到低排列"""
+    kept = []
+    last_size = None
+    for dpi, img_quality in candidates:
+        size = predict_compressed_size(profile, dpi, img_quality)
+        if last_size is not None and size >= last_size * 0.98:
+            continue
+        kept.append((dpi, img_quality))
+        last_size = size
+    return kept
+
+
+def is_text_dominated(profile: dict) -> bool:
+    """圖片資料占檔案大小的比例低於 LOSSLESS_MAX_IMAGE_RATIO 時視為以文字為主"""
+    return profile["image_bytes"] < profile["file_size"] * LOSSLESS_MAX_IMAGE_RATIO
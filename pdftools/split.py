@@ -0,0 +1,227 @@
+"""
+PDF 拆分：依頁、頁數範圍、固定頁數、檔案大小或書籤分段
+"""
+
+import io
+import re
+import threading
+from typing import BinaryIO, Iterable, List, Optional, Tuple, Union
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from .jobs import CompressCancelled
+from .metrics import paused, stage
+from .preflight import font_file_bytes, resolved_length
+from .utils import as_stream, data_size
+
+
+def parse_page_intervals(range_str: str, total_pages: int) -> List[Tuple[int, int]]:
+    """解析頁數範圍字串為合併後的區間清單 [(起始索引, 結束索引(不含))]，不逐頁展開"""
+    intervals = []
+    parts = range_str.replace(" ", "").split(",")
+
+    for part in parts:
+        try:
+            if "-" in part:
+                start, end = part.split("-")
+                start = int(start)
+                end = int(end)
+            else:
+                start = end = int(part)
+        except ValueError:
+            continue
+        # 超出實際頁數的部分直接截斷
+        start = max(start, 1)
+        end = min(end, total_pages)
+        if start <= end:
+            intervals.append((start - 1, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def parse_page_range(range_str: str, total_pages: int) -> List[int]:
+    """解析頁數範圍字串"""
+    return [i for start, end in parse_page_intervals(range_str, total_pages) for i in range(start, end)]
+
+
+def chunk_name(start: int, end: int) -> str:
+    """以頁碼區間命名拆分結果"""
+    if end - start == 1:
+        return f"page_{start + 1}.pdf"
+    return f"pages_{start + 1}-{end}.pdf"
+
+
+def page_resource_costs(page) -> Tuple[int, dict]:
+    """估算單頁大小：回傳 (頁面內容串流長度, {共用資源物件編號: 長度})"""
+    # 頁面字典本身與交叉參照表的固定開銷
+    content_bytes = 256
+    contents = page.get("/Contents")
+    if contents is not None:
+        contents = contents.get_object()
+        streams = contents if isinstance(contents, list) else [contents]
+        for stream in streams:
+            content_bytes += resolved_length(stream.get_object())
+
+    shared = {}
+    resources = page.get("/Resources")
+    if resources is None:
+        return content_bytes, shared
+    resources = resources.get_object()
+
+    xobjects = resources.get("/XObject")
+    if xobjects is not None:
+        for ref in xobjects.get_object().values():
+            if hasattr(ref, "idnum"):
+                shared[ref.idnum] = resolved_length(ref.get_object())
+
+    fonts = resources.get("/Font")
+    if fonts is not None:
+        for ref in fonts.get_object().values():
+            size = font_file_bytes(ref.get_object())
+            if hasattr(ref, "idnum"):
+                shared[ref.idnum] = size
+            else:
+                content_bytes += size
+
+    return content_bytes, shared
+
+
+def plan_size_chunks(reader: PdfReader, max_bytes: int) -> List[Tuple[int, int]]:
+    """依估算大小切分：同一份中重複使用的圖片與字型只計算一次"""
+    chunks = []
+    start = 0
+    chunk_bytes = 0
+    seen = set()
+    for page_idx, page in enumerate(reader.pages):
+        content_bytes, shared = page_resource_costs(page)
+        new_shared = {idnum: size for idnum, size in shared.items() if idnum not in seen}
+        page_bytes = content_bytes + sum(new_shared.values())
+
+        if page_idx > start and chunk_bytes + page_bytes > max_bytes:
+            chunks.append((start, page_idx))
+            start = page_idx
+            seen = set()
+            # 新的一份需要重新帶入本頁的全部共用資源
+            page_bytes = content_bytes + sum(shared.values())
+            chunk_bytes = 0
+
+        chunk_bytes += page_bytes
+        seen.update(shared)
+
+    if start < len(reader.pages):
+        chunks.append((start, len(reader.pages)))
+    return chunks
+
+
+def plan_bookmark_chunks(reader: PdfReader) -> List[Tuple[str, int, int]]:
+    """依第一層書籤切分：回傳 (書籤標題, 起始索引, 結束索引(不含))"""
+    total_pages = len(reader.pages)
+    starts = {}
+    for item in reader.outline:
+        # 巢狀清單為子書籤，只取第一層
+        if isinstance(item, list):
+            continue
+        try:
+            page_idx = reader.get_destination_page_number(item)
+        except Exception:
+            continue
+        if page_idx is not None and 0 <= page_idx < total_pages and page_idx not in starts:
+            starts[page_idx] = str(item.title or "")
+
+    if not starts:
+        return []
+    bounds = sorted(starts)
+    chunks = []
+    # 第一個書籤之前的頁面（如封面）自成一份
+    if bounds[0] > 0:
+        chunks.append(("", 0, bounds[0]))
+    for i, start in enumerate(bounds):
+        end = bounds[i + 1] if i + 1 < len(bounds) else total_pages
+        chunks.append((starts[start], start, end))
+    return chunks
+
+
+def safe_filename(title: str) -> str:
+    """移除檔名中不允許的字元"""
+    title = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", title).strip(" .")
+    return title[:80]
+
+
+def plan_split(reader: PdfReader, mode: str, page_range: str = "", chunk_pages: int = 10,
+               chunk_mb: float = 5.0) -> List[Tuple[str, range]]:
+    """規劃拆分結果：回傳 (檔名, 頁面索引區間)，此時尚未產生任何 PDF"""
+    total_pages = len(reader.pages)
+
+    if mode == "all":
+        return [(chunk_name(i, i + 1), range(i, i + 1)) for i in range(total_pages)]
+
+    if mode == "range":
+        return [
+            (chunk_name(i, i + 1), range(i, i + 1))
+            for start, end in parse_page_intervals(page_range, total_pages)
+            for i in range(start, end)
+        ]
+
+    if mode == "chunk":
+        step = max(1, int(chunk_pages))
+        return [
+            (chunk_name(start, min(start + step, total_pages)), range(start, min(start + step, total_pages)))
+            for start in range(0, total_pages, step)
+        ]
+
+    if mode == "size":
+        max_bytes = max(1, int(chunk_mb * 1024 * 1024))
+        return [(chunk_name(start, end), range(start, end)) for start, end in plan_size_chunks(reader, max_bytes)]
+
+    if mode == "bookmark":
+        parts = []
+        for index, (title, start, end) in enumerate(plan_bookmark_chunks(reader)):
+            title = safe_filename(title)
+            name = f"{index:02d}_{title}.pdf" if title else f"{index:02d}_{chunk_name(start, end)}"
+            parts.append((name, range(start, end)))
+        return parts
+
+    raise ValueError(f"不支援的拆分方式：{mode}")
+
+
+def build_split_part(reader: PdfReader, page_indices: Iterable[int],
+                     cancel_event: Optional[threading.Event] = None) -> bytes:
+    """產生單一拆分結果的 PDF：同一份中共用的字型與圖片只寫入一次
+
+    cancel_event 被設定時在加入下一頁之前拋出 CompressCancelled。
+    """
+    writer = PdfWriter()
+    for page_idx in page_indices:
+        if cancel_event is not None and cancel_event.is_set():
+            raise CompressCancelled()
+        writer.add_page(reader.pages[page_idx])
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def iter_split_parts(reader: PdfReader, parts: List[Tuple[str, range]]) -> Iterable[Tuple[str, bytes]]:
+    """逐一產生拆分結果，每次只有一份在記憶體中；呼叫端處理每份結果的時間不計入拆分耗時"""
+    with stage("split", data_size(reader.stream), parts=len(parts),
+               pages=sum(len(page_indices) for _, page_indices in parts)) as record:
+        for filename, page_indices in parts:
+            content = build_split_part(reader, page_indices)
+            record["bytes_out"] += len(content)
+            with paused(record):
+                yield filename, content
+
+
+def split_pdf(input_bytes: Union[bytes, BinaryIO], mode: str, page_range: str = "",
+              reader: Optional[PdfReader] = None, **options) -> List[Tuple[str, bytes]]:
+    """拆分 PDF 檔案（可傳入位元組資料或檔案物件，或直接傳入已解析的 reader）"""
+    if reader is None:
+        reader = PdfReader(as_stream(input_bytes))
+    parts = plan_split(reader, mode, page_range, **options)
+    return list(iter_split_parts(reader, parts))
@@ -0,0 +1,34 @@
+"""
+共用小工具
+"""
+
+import io
+from typing import BinaryIO, Union
+
+
+def format_size(size: int) -> str:
+    """格式化檔案大小"""
+    if size < 1024:
+        return f"{size} B"
+    elif size < 1024 * 1024:
+        return f"{size/1024:.1f} KB"
+    else:
+        return f"{size/(1024*1024):.2f} MB"
+
+
+def as_stream(data: Union[bytes, BinaryIO]) -> BinaryIO:
+    """位元組資料包成 BytesIO；檔案物件直接使用，避免多複製一份"""
+    return io.BytesIO(data) if isinstance(data, bytes) else data
+
+
+def data_size(data: Union[bytes, BinaryIO]) -> int:
+    """位元組資料或可隨機讀取的檔案物件的大小，不改變目前的讀取位置"""
+    if isinstance(data, bytes):
+        return len(data)
+    try:
+        position = data.tell()
+        size = data.seek(0, io.SEEK_END)
+        data.seek(position)
+        return size
+    except (AttributeError, OSError):
+        return 0
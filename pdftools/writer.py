@@ -0,0 +1,323 @@
+"""
+逐一寫出物件的串流式 PDF 寫入器
+"""
+
+import hashlib
+import io
+import zlib
+from collections import deque
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject,
+                            NumberObject, StreamObject, TextStringObject)
+
+
+class StreamingPdfWriter:
+    """逐一寫出物件的 PDF 寫入器：物件寫出後即釋放，並可依內容雜湊去除重複的串流（字型、圖片、ICC 色彩描述檔）
+
+    只會寫出從頁面（與匯入的目錄項目）參照得到的物件，未被參照的物件自然捨棄。
+    compress_streams 會以 Flate 壓縮未壓縮的串流；object_streams 會把一般物件
+    打包進物件串流（PDF 1.5），並改用交叉參照串流。
+    """
+
+    # 每個物件串流最多容納的物件數
+    OBJECT_STREAM_SIZE = 100
+
+    def __init__(self, output: BinaryIO, dedupe: bool = True, compress_streams: bool = False,
+                 object_streams: bool = False):
+        self.output = output
+        self.dedupe = dedupe
+        self.compress_streams = compress_streams
+        self.object_streams = object_streams
+        # 物件編號 -> 檔案位移，或 (物件串流編號, 串流內索引)；0 號為保留的空物件
+        self.offsets: List[Union[None, int, Tuple[int, int]]] = [None]
+        self.page_refs: List[IndirectObject] = []
+        self.outline = []
+        self.catalog_entries = {}
+        self.info = None
+        self._object_buffer: List[Tuple[int, bytes]] = []
+        self.stream_digests = {}
+        self.counters = {"objects": 0, "streams": 0, "deduplicated": 0, "saved_bytes": 0}
+        self._id_map = {}
+        self._in_progress = {}
+        self._pending = deque()
+
+        self.output.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self.pages_ref = self._allocate()
+
+    def _allocate(self) -> IndirectObject:
+        self.offsets.append(None)
+        return IndirectObject(len(self.offsets) - 1, 0, self)
+
+    def _write_object(self, ref: IndirectObject, obj, data: Optional[bytes] = None):
+        if self.object_streams and data is None:
+            buffer = io.BytesIO()
+            obj.write_to_stream(buffer, None)
+            self._object_buffer.append((ref.idnum, buffer.getvalue()))
+            self.counters["objects"] += 1
+            if len(self._object_buffer) >= self.OBJECT_STREAM_SIZE:
+                self._flush_object_stream()
+            return
+
+        self.offsets[ref.idnum] = self.output.tell()
+        self.output.write(f"{ref.idnum} 0 obj\n".encode())
+        obj.write_to_stream(self.output, None)
+        if data is not None:
+            self.output.write(b"\nstream\n")
+            self.output.write(data)
+            self.output.write(b"\nendstream")
+        self.output.write(b"\nendobj\n")
+        self.counters["objects"] += 1
+
+    def _flush_object_stream(self):
+        """將暫存的一般物件打包成一個物件串流寫出"""
+        if not self._object_buffer:
+            return
+        ref = self._allocate()
+        header = []
+        body = io.BytesIO()
+        for index, (idnum, content) in enumerate(self._object_buffer):
+            header.append(f"{idnum} {body.tell()}")
+            body.write(content)
+            body.write(b"\n")
+            self.offsets[idnum] = (ref.idnum, index)
+        header_bytes = (" ".join(header) + "\n").encode()
+        data = zlib.compress(header_bytes + body.getvalue(), 9)
+        stream = DictionaryObject({
+            NameObject("/Type"): NameObject("/ObjStm"),
+            NameObject("/N"): NumberObject(len(self._object_buffer)),
+            NameObject("/First"): NumberObject(len(header_bytes)),
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+            NameObject("/Length"): NumberObject(len(data)),
+        })
+        self._object_buffer = []
+        self._write_object(ref, stream, data)
+
+    def _translate(self, value):
+        """將來源物件中的間接參照改寫為輸出檔的物件編號"""
+        if isinstance(value, IndirectObject):
+            return self._translate_ref(value)
+        if isinstance(value, DictionaryObject):
+            return DictionaryObject({NameObject(k): self._translate(v) for k, v in value.items()})
+        if isinstance(value, ArrayObject):
+            return ArrayObject(self._translate(v) for v in value)
+        return value
+
+    def _translate_ref(self, ref: IndirectObject):
+        key = (ref.idnum, ref.generation)
+        out = self._id_map.get(key)
+        if out is not None:
+            return out
+        if key in self._in_progress:
+            # 串流之間互相參照時先保留編號，這類串流不做去重
+            if self._in_progress[key] is None:
+                self._in_progress[key] = self._allocate()
+            return self._in_progress[key]
+
+        obj = ref.get_object()
+        if obj is None:
+            return NullObject()
+        if isinstance(obj, StreamObject):
+            return self._copy_stream(key, obj)
+
+        # 一般物件先配發編號再排入佇列，可處理循環參照
+        out = self._allocate()
+        self._id_map[key] = out
+        self._pending.append((out, obj))
+        return out
+
+    def _copy_stream(self, key: Tuple[int, int], stream: StreamObject) -> IndirectObject:
+        self._in_progress[key] = None
+        header = self._translate(DictionaryObject({k: v for k, v in stream.items() if k != "/Length"}))
+        reserved = self._in_progress.pop(key)
+
+        data = stream._data
+        if isinstance(data, str):
+            data = data.encode("latin-1")
+        if self.compress_streams and "/Filter" not in header:
+            compressed = zlib.compress(data, 9)
+            if len(compressed) < len(data):
+                data = compressed
+                header[NameObject("/Filter")] = NameObject("/FlateDecode")
+        header[NameObject("/Length")] = NumberObject(len(data))
+        self.counters["streams"] += 1
+
+        digest = None
+        if self.dedupe and reserved is None:
+            header_bytes = io.BytesIO()
+            header.write_to_stream(header_bytes, None)
+            digest = hashlib.sha256(header_bytes.getvalue() + b"\0" + data).digest()
+            existing = self.stream_digests.get(digest)
+            if existing is not None:
+                self.counters["deduplicated"] += 1
+                self.counters["saved_bytes"] += len(data)
+                self._id_map[key] = existing
+                return existing
+
+        ref = reserved or self._allocate()
+        self._id_map[key] = ref
+        if digest is not None:
+            self.stream_digests[digest] = ref
+        self._write_object(ref, header, data)
+        return ref
+
+    def _drain(self):
+        while self._pending:
+            ref, obj = self._pending.popleft()
+            self._write_object(ref, self._translate(obj))
+
+    def _collect_outline(self, reader: PdfReader, items, page_refs: List[IndirectObject]):
+        nodes = []
+        for item in items:
+            if isinstance(item, list):
+                if nodes:
+                    nodes[-1][2].extend(self._collect_outline(reader, item, page_refs))
+                continue
+            try:
+                page_idx = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            if 0 <= page_idx < len(page_refs):
+                nodes.append((str(item.title or ""), page_refs[page_idx], []))
+        return nodes
+
+    def append(self, reader: PdfReader, import_catalog: bool = False, on_page=None):
+        """加入一份文件的所有頁面與書籤，寫完即可釋放該 reader
+
+        import_catalog 會原樣沿用來源文件的目錄項目（書籤、表單、命名目的地、頁碼標籤等）
+        與文件資訊，適合單一文件的最佳化；合併多份文件時則重建書籤。
+        on_page(已處理頁數, 總頁數) 會在每寫完一頁時被呼叫。
+        """
+        # 物件編號只在同一份來源內有效
+        self._id_map = {}
+        page_refs = []
+        for page in reader.pages:
+            ref = self._allocate()
+            self._id_map[(page.indirect_reference.idnum, page.indirect_reference.generation)] = ref
+            page_refs.append(ref)
+
+        for page_number, (page, ref) in enumerate(zip(reader.pages, page_refs), 1):
+            # 不沿用原本的頁面樹；繼承屬性在讀取頁面時已展開到頁面上
+            out = self._translate(DictionaryObject({k: v for k, v in page.items() if k != "/Parent"}))
+            out[NameObject("/Parent")] = self.pages_ref
+            self._write_object(ref, out)
+            self._drain()
+            if on_page is not None:
+                on_page(page_number, len(page_refs))
+
+        if import_catalog:
+            root = reader.trailer["/Root"]
+            for key, value in root.items():
+                if key not in ("/Type", "/Pages"):
+                    self.catalog_entries[key] = self._translate(value)
+            if "/Info" in reader.trailer:
+                self.info = self._translate(reader.trailer.raw_get("/Info"))
+            self._drain()
+            self.page_refs.extend(page_refs)
+            return
+
+        try:
+            self.outline.extend(self._collect_outline(reader, reader.outline, page_refs))
+        except Exception:
+            pass
+        self.page_refs.extend(page_refs)
+
+    def _write_outline(self, nodes, parent_ref: IndirectObject) -> Tuple[IndirectObject, IndirectObject, int]:
+        refs = [self._allocate() for _ in nodes]
+        count = 0
+        for i, (title, page_ref, children) in enumerate(nodes):
+            item = DictionaryObject({
+                NameObject("/Title"): TextStringObject(title),
+                NameObject("/Parent"): parent_ref,
+                NameObject("/Dest"): ArrayObject([page_ref, NameObject("/Fit")]),
+            })
+            if i > 0:
+                item[NameObject("/Prev")] = refs[i - 1]
+            if i + 1 < len(refs):
+                item[NameObject("/Next")] = refs[i + 1]
+            child_count = 0
+            if children:
+                first, last, child_count = self._write_outline(children, refs[i])
+                item[NameObject("/First")] = first
+                item[NameObject("/Last")] = last
+                item[NameObject("/Count")] = NumberObject(child_count)
+            self._write_object(refs[i], item)
+            count += 1 + child_count
+        return refs[0], refs[-1], count
+
+    def finish(self):
+        """寫出頁面樹、目錄、交叉參照表與檔尾"""
+        catalog = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): self.pages_ref,
+        })
+        for key, value in self.catalog_entries.items():
+            catalog[NameObject(key)] = value
+        if self.outline:
+            outlines_ref = self._allocate()
+            first, last, count = self._write_outline(self.outline, outlines_ref)
+            self._write_object(outlines_ref, DictionaryObject({
+                NameObject("/Type"): NameObject("/Outlines"),
+                NameObject("/First"): first,
+                NameObject("/Last"): last,
+                NameObject("/Count"): NumberObject(count),
+            }))
+            catalog[NameObject("/Outlines")] = outlines_ref
+
+        self._write_object(self.pages_ref, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(self.page_refs),
+            NameObject("/Count"): NumberObject(len(self.page_refs)),
+        }))
+        catalog_ref = self._allocate()
+        self._write_object(catalog_ref, catalog)
+
+        trailer = DictionaryObject({NameObject("/Root"): catalog_ref})
+        if self.info is not None:
+            trailer[NameObject("/Info")] = self.info
+
+        if self.object_streams:
+            self._flush_object_stream()
+            self._write_xref_stream(trailer)
+            return
+
+        xref_offset = self.output.tell()
+        self.output.write(f"xref\n0 {len(self.offsets)}\n".encode())
+        for offset in self.offsets:
+            if offset is None:
+                self.output.write(b"0000000000 65535 f \n")
+            else:
+                self.output.write(f"{offset:010d} 00000 n \n".encode())
+
+        self.output.write(b"trailer\n")
+        trailer[NameObject("/Size")] = NumberObject(len(self.offsets))
+        trailer.write_to_stream(self.output, None)
+        self.output.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+    def _write_xref_stream(self, trailer: DictionaryObject):
+        """以交叉參照串流取代傳統交叉參照表（物件串流內的物件必須以此索引）"""
+        ref = self._allocate()
+        xref_offset = self.output.tell()
+        self.offsets[ref.idnum] = xref_offset
+        width = 4 if xref_offset < 2 ** 32 else 8
+
+        rows = io.BytesIO()
+        for offset in self.offsets:
+            if offset is None:
+                rows.write(b"\x00" + (0).to_bytes(width, "big") + (0xFFFF).to_bytes(2, "big"))
+            elif isinstance(offset, tuple):
+                rows.write(b"\x02" + offset[0].to_bytes(width, "big") + offset[1].to_bytes(2, "big"))
+            else:
+                rows.write(b"\x01" + offset.to_bytes(width, "big") + (0).to_bytes(2, "big"))
+        data = zlib.compress(rows.getvalue(), 9)
+
+        trailer.update({
+            NameObject("/Type"): NameObject("/XRef"),
+            NameObject("/Size"): NumberObject(len(self.offsets)),
+            NameObject("/W"): ArrayObject([NumberObject(1), NumberObject(width), NumberObject(2)]),
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+            NameObject("/Length"): NumberObject(len(data)),
+        })
+        self._write_object(ref, trailer, data)
+        self.output.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
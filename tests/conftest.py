@@ -0,0 +1,118 @@
+import os
+import stat
+import sys
+
+import pytest
+
+# 測試用的假 gs：回報頁數進度，輸出依 ColorImageResolution 等比例截斷輸入（300 DPI 為原大小）
+FAKE_GS = '''#!{python}
+import os, re, sys, time
+opts = dict(m.groups() for m in (re.match(r"-[ds](\\w+)=(.*)", a) for a in sys.argv[1:]) if m)
+dpi = int(opts.get("ColorImageResolution", 300))
+log = os.environ.get("FAKE_GS_LOG")
+if log:
+    with open(log, "a") as f:
+        f.write(" ".join(sys.argv[1:]) + "\\n")
+print("Processing pages 1 through 2.", flush=True)
+for page in (1, 2):
+    time.sleep(float(os.environ.get("FAKE_GS_SLEEP", "0")))
+    print("Page %d" % page, flush=True)
+if os.environ.get("FAKE_GS_FAIL"):
+    sys.exit(1)
+data = open(sys.argv[-1], "rb").read()
+with open(opts["OutputFile"], "wb") as f:
+    f.write(data[:len(data) * dpi // 300])
+'''
+
+
+# 測試用的假 qpdf：在輸入前面加上 /L 正確的線性化參數字典；可指定結束碼或輸出未線性化的檔案
+FAKE_QPDF = '''#!{python}
+import os, sys
+code = int(os.environ.get("FAKE_QPDF_EXIT", "0"))
+if code not in (0, 3):
+    sys.exit(code)
+data = open(sys.argv[-2], "rb").read()
+if not os.environ.get("FAKE_QPDF_PLAIN"):
+    header = b"%%PDF-1.7\\n1 0 obj <</Linearized 1 /L %010d /H [ 100 50 ] /O 3 /E 500 /N 1 /T 90>> endobj\\n"
+    data = header % (len(header % 0) + len(data)) + data
+with open(sys.argv[-1], "wb") as f:
+    f.write(data)
+sys.exit(code)
+'''
+
+
+# 測試用的假 ghostscript（gsapi）模組：行為由輸入檔開頭決定，因為工作程序在建立引擎時就已 fork，
+# 之後再設定的環境變數不會傳到工作程序。ALLOC 會占用 FAKE_GSAPI_ALLOC_MB、SLEEP 會停住、FAIL 會失敗
+FAKE_GSAPI = '''
+import os, re, time
+
+class Ghostscript:
+    def __init__(self, *args, stdout=None):
+        self.options = dict(m.groups() for m in (re.match(r"-[ds](\\w+)=(.*)", a) for a in args[1:]) if m)
+        self.stdout = stdout
+        log = os.environ.get("FAKE_GSAPI_LOG")
+        if log:
+            with open(log, "a") as f:
+                f.write(" ".join(args[1:]) + "\\n")
+
+    def run_filename(self, path):
+        log = os.environ.get("FAKE_GSAPI_LOG")
+        if log:
+            with open(log, "a") as f:
+                f.write("run " + path + "\\n")
+        with open(path, "rb") as f:
+            data = f.read()
+        self.stdout.write("Processing pages 1 through 2.\\nPage 1\\nPage 2\\n")
+        if data.startswith(b"SLEEP"):
+            time.sleep(30)
+        if data.startswith(b"FAIL"):
+            raise RuntimeError("gsapi error")
+        if data.startswith(b"ALLOC"):
+            block = bytearray(int(os.environ.get("FAKE_GSAPI_ALLOC_MB", "64")) * 1024 * 1024)
+            block[::4096] = b"x" * len(block[::4096])
+        dpi = int(self.options.get("ColorImageResolution", 300))
+        with open(self.options["OutputFile"], "wb") as f:
+            f.write(data[:len(data) * dpi // 300])
+
+    def exit(self):
+        pass
+'''
+
+
+def install_tool(tmp_path, monkeypatch, name, script):
+    """將假工具放在 PATH 最前面的資料夾"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir(exist_ok=True)
+    tool = bin_dir / name
+    tool.write_text(script.format(python=sys.executable))
+    tool.chmod(tool.stat().st_mode | stat.S_IXUSR)
+    if str(bin_dir) not in os.environ["PATH"].split(os.pathsep):
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+
+@pytest.fixture
+def fake_gs(tmp_path, monkeypatch):
+    """在 PATH 最前面放一個假 gs，回傳呼叫紀錄檔的路徑"""
+    install_tool(tmp_path, monkeypatch, "gs", FAKE_GS)
+    log = tmp_path / "gs.log"
+    monkeypatch.setenv("FAKE_GS_LOG", str(log))
+    return log
+
+
+@pytest.fixture
+def fake_qpdf(tmp_path, monkeypatch):
+    """在 PATH 最前面放一個假 qpdf"""
+    install_tool(tmp_path, monkeypatch, "qpdf", FAKE_QPDF)
+
+
+@pytest.fixture
+def fake_gsapi(tmp_path, monkeypatch):
+    """以假的 ghostscript 模組取代 libgs 綁定，回傳呼叫紀錄檔的路徑"""
+    module_dir = tmp_path / "pymod"
+    module_dir.mkdir()
+    (module_dir / "ghostscript.py").write_text(FAKE_GSAPI)
+    monkeypatch.syspath_prepend(str(module_dir))
+    monkeypatch.delitem(sys.modules, "ghostscript", raising=False)
+    log = tmp_path / "gsapi.log"
+    monkeypatch.setenv("FAKE_GSAPI_LOG", str(log))
+    return log
@@ -0,0 +1,54 @@
+"""測試用的小型 PDF 產生器"""
+
+import io
+from typing import List, Optional, Tuple
+
+from PyPDF2 import PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+
+
+def stream_object(data: bytes, **entries) -> DecodedStreamObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    for key, value in entries.items():
+        stream[NameObject(f"/{key}")] = value
+    return stream
+
+
+def make_pdf(pages: int = 3, content_bytes: int = 0, shared_image_bytes: int = 0,
+             bookmarks: Optional[List[Tuple[str, int]]] = None, page_text: bool = False) -> bytes:
+    """產生 pages 頁的 PDF
+
+    content_bytes 為每頁內容串流的大小；shared_image_bytes 大於 0 時所有頁面共用同一張圖片；
+    bookmarks 為第一層書籤 [(標題, 頁面索引)]；page_text 為 True 時每頁內容含有不同的頁碼文字。
+    """
+    writer = PdfWriter()
+    image_ref = None
+    if shared_image_bytes:
+        image_ref = writer._add_object(stream_object(
+            b"\x80" * shared_image_bytes, Type=NameObject("/XObject"), Subtype=NameObject("/Image"),
+            Width=NumberObject(shared_image_bytes), Height=NumberObject(1),
+            ColorSpace=NameObject("/DeviceGray"), BitsPerComponent=NumberObject(8),
+        ))
+    for index in range(pages):
+        writer.add_blank_page(200, 200)
+        # add_blank_page 回傳的不一定是實際寫入的頁面物件
+        page = writer.pages[-1]
+        content = b"q 10 0 0 10 0 0 cm /Im0 Do Q\n" if image_ref is not None else b""
+        if page_text:
+            content += b"BT /F1 12 Tf 20 100 Td (page %d) Tj ET\n" % (index + 1)
+        if content_bytes:
+            content += b"%" + b"x" * max(0, content_bytes - len(content) - 2) + b"\n"
+        if content:
+            page[NameObject("/Contents")] = writer._add_object(stream_object(content))
+        if image_ref is not None:
+            page[NameObject("/Resources")] = DictionaryObject({
+                NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): image_ref}),
+            })
+        else:
+            page[NameObject("/Resources")] = DictionaryObject({NameObject("/ProcSet"): ArrayObject()})
+    for title, page_index in bookmarks or ():
+        writer.add_outline_item(title, page_index)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
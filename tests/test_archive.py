@@ -0,0 +1,141 @@
+import io
+import os
+import time
+import zipfile
+
+import pytest
+
+from pdftools import archive
+from pdftools.archive import ZipStreamWriter, create_zip, spooled_zip, spooled_zip_files, write_zip
+
+TEXT = b"BT /F1 12 Tf 72 720 Td (Hello) Tj ET\n" * 4000
+NOISE = os.urandom(300 * 1024)
+
+
+class UnseekableOutput(io.RawIOBase):
+    """只能依序寫入的輸出（例如 HTTP 回應）"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+
+def read_entries(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        return [(info.filename, info.compress_type, archive.read(info)) for info in archive.infolist()]
+
+
+def test_sampling_stores_incompressible_and_deflates_text():
+    entries = read_entries(create_zip([("text.pdf", TEXT), ("noise.pdf", NOISE), ("empty.pdf", b"")]))
+
+    assert entries == [
+        ("text.pdf", zipfile.ZIP_DEFLATED, TEXT),
+        ("noise.pdf", zipfile.ZIP_STORED, NOISE),
+        ("empty.pdf", zipfile.ZIP_STORED, b""),
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_write_zip_keeps_order_and_counts(workers):
+    files = [(f"part_{i:02d}.pdf", TEXT if i % 2 else NOISE) for i in range(10)]
+    output = io.BytesIO()
+
+    counters = write_zip(iter(files), output, workers=workers)
+
+    assert [(name, data) for name, _, data in read_entries(output.getvalue())] == files
+    assert counters["entries"] == 10
+    assert counters["stored"] == 5 and counters["deflated"] == 5
+    assert counters["input_bytes"] == sum(len(data) for _, data in files)
+    assert counters["output_bytes"] < counters["input_bytes"]
+
+
+def test_parallel_output_matches_single_worker(monkeypatch):
+    monkeypatch.setattr(archive.time, "localtime", lambda *args: time.struct_time((2024, 5, 6, 7, 8, 10, 0, 127, 0)))
+    files = [(f"part_{i:02d}.pdf", (TEXT if i % 3 else NOISE)[i * 1000:]) for i in range(24)]
+    files.append(("small.pdf", b"tiny"))
+    outputs = []
+    for workers in (1, 2, 4):
+        output = io.BytesIO()
+        write_zip(iter(files), output, workers=workers)
+        outputs.append(output.getvalue())
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert [(name, data) for name, _, data in read_entries(outputs[0])] == files
+
+
+def test_entries_are_compressed_in_parallel(monkeypatch):
+    pack_entry = archive.pack_entry
+    active = []
+    peak = []
+
+    def slow_pack(data, level):
+        active.append(data)
+        peak.append(len(active))
+        time.sleep(0.05)
+        active.remove(data)
+        return pack_entry(data, level)
+
+    monkeypatch.setattr(archive, "pack_entry", slow_pack)
+    write_zip(((f"{i}.pdf", TEXT + bytes([i])) for i in range(8)), io.BytesIO(), workers=4)
+
+    assert max(peak) > 1
+
+
+def test_writer_error_propagates():
+    class FullDisk(UnseekableOutput):
+        def write(self, data):
+            if len(self.buffer) > 100 * 1024:
+                raise OSError("disk full")
+            return super().write(data)
+
+    with pytest.raises(OSError):
+        write_zip(((f"{i}.pdf", NOISE) for i in range(5)), FullDisk(), workers=2)
+
+
+def test_level_zero_stores_everything():
+    output = io.BytesIO()
+    writer = ZipStreamWriter(output, level=0)
+    writer.add("text.pdf", TEXT)
+    writer.close()
+
+    assert read_entries(output.getvalue()) == [("text.pdf", zipfile.ZIP_STORED, TEXT)]
+
+
+def test_unseekable_output_and_utf8_names():
+    output = UnseekableOutput()
+    writer = ZipStreamWriter(output)
+    writer.add("報告_第1頁.pdf", TEXT)
+    writer.add("noise.pdf", NOISE)
+    writer.close()
+
+    entries = read_entries(bytes(output.buffer))
+    assert [(name, data) for name, _, data in entries] == [("報告_第1頁.pdf", TEXT), ("noise.pdf", NOISE)]
+
+
+def test_spooled_zip_files_streams_from_disk(tmp_path):
+    (tmp_path / "a.pdf").write_bytes(TEXT)
+    (tmp_path / "b.pdf").write_bytes(NOISE)
+
+    with spooled_zip_files([("壓縮/a.pdf", str(tmp_path / "a.pdf")), ("b.pdf", str(tmp_path / "b.pdf"))]) as archive:
+        entries = read_entries(archive.read())
+
+    assert entries == [("壓縮/a.pdf", zipfile.ZIP_DEFLATED, TEXT), ("b.pdf", zipfile.ZIP_STORED, NOISE)]
+
+
+def test_more_than_65535_entries_uses_zip64():
+    count = 0x10000 + 10
+    with spooled_zip((f"{i}.pdf", b"") for i in range(count)) as archive:
+        data = archive.read()
+
+    # ZIP64 結尾記錄
+    assert b"PK\x06\x06" in data[-200:]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        names = archive.namelist()
+    assert len(names) == count and names[-1] == f"{count - 1}.pdf"
@@ -0,0 +1,143 @@
+import io
+import os
+
+from PyPDF2 import PdfWriter
+
+from pdftools.cache import CachedDocument, CompressCache, DocumentCache
+from pdftools.files import StagedFile
+
+MB = 1024 * 1024
+
+
+def make_cache(tmp_path, memory=100, disk=1000, entry=None):
+    return CompressCache(memory, disk, str(tmp_path / "cache"), max_memory_entry_bytes=entry)
+
+
+def test_make_key_depends_on_content_and_params(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF-1.4 a")
+    key = CompressCache.make_file_key(str(path), "medium", 0.0)
+    assert key == CompressCache.make_key(b"%PDF-1.4 a", "medium", 0.0)
+    assert key != CompressCache.make_key(b"%PDF-1.4 a", "high", 0.0)
+    assert key != CompressCache.make_key(b"%PDF-1.4 b", "medium", 0.0)
+
+
+def test_memory_lru_evicts_least_recently_used_to_disk(tmp_path):
+    cache = make_cache(tmp_path, memory=100)
+    cache.put("a", b"a" * 40)
+    cache.put("b", b"b" * 40)
+    assert cache.get("a") == b"a" * 40
+    cache.put("c", b"c" * 40)
+
+    stats = cache.stats()
+    assert stats["memory_evictions"] == 1
+    assert stats["memory_entries"] == 2
+    assert (tmp_path / "cache" / "b.pdf").read_bytes() == b"b" * 40
+    assert cache.get("b") == b"b" * 40
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_oldest_within_limit(tmp_path):
+    cache = make_cache(tmp_path, memory=10, disk=100, entry=10)
+    for key in "abc":
+        cache.put(key, key.encode() * 40)
+    assert cache.stats()["disk_bytes"] <= 100
+    assert cache.get("a") is None
+    assert cache.get("c") == b"c" * 40
+    assert not (tmp_path / "cache" / "a.pdf").exists()
+
+
+def test_disk_entries_reload_after_restart(tmp_path):
+    source = tmp_path / "out.pdf"
+    source.write_bytes(b"x" * 500)
+    cache = make_cache(tmp_path, memory=0, disk=MB)
+    cache.put_file("big", str(source))
+
+    reloaded = make_cache(tmp_path, memory=0, disk=MB)
+    dest = tmp_path / "restored.pdf"
+    assert reloaded.get_file("big", str(dest))
+    assert dest.read_bytes() == b"x" * 500
+    assert reloaded.stats()["disk_entries"] == 1
+
+
+def test_reload_trims_to_smaller_disk_limit(tmp_path):
+    cache = make_cache(tmp_path, memory=0, disk=MB)
+    for key in "abc":
+        cache.put(key, b"-" * 400)
+    reloaded = make_cache(tmp_path, memory=0, disk=800)
+    assert reloaded.stats()["disk_entries"] == 2
+    assert len(os.listdir(tmp_path / "cache")) == 2
+
+
+def test_disk_tier_disabled_writes_nothing(tmp_path):
+    source = tmp_path / "out.pdf"
+    source.write_bytes(b"x" * 500)
+    cache = make_cache(tmp_path, memory=100, disk=0, entry=100)
+    cache.put("a", b"a" * 80)
+    cache.put("b", b"b" * 80)
+    cache.put("empty", b"")
+    cache.put_file("big", str(source))
+    assert not (tmp_path / "cache").exists()
+    assert cache.get("big") is None
+    assert cache.get("b") == b"b" * 80
+
+
+def pdf_bytes(pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(200, 200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def loader(pages, loads):
+    def load():
+        loads.append(pages)
+        return CachedDocument(StagedFile(pdf_bytes(pages), mode="file"))
+    return load
+
+
+def test_document_cache_reuses_parsed_document():
+    cache = DocumentCache(10 * MB)
+    loads = []
+    with cache.hold("a", loader(2, loads)) as first:
+        pass
+    with cache.hold("a", loader(2, loads)) as second:
+        assert second is first and not second.closed
+    assert loads == [2]
+    assert cache.stats()["hits"] == 1
+
+
+def test_eviction_waits_for_pending_holder():
+    one_doc = len(pdf_bytes(1))
+    cache = DocumentCache(one_doc)
+    loads = []
+
+    # 模擬另一個工作階段尚未完成的延後下載：持有 a 時，其他上傳把 a 擠出快取
+    with cache.hold("a", loader(1, loads)) as pending:
+        with cache.hold("b", loader(1, loads)):
+            pass
+        assert cache.stats()["evictions"] == 1
+        assert pending.evicted and not pending.closed
+        with pending.lock:
+            assert len(pending.reader.pages) == 1
+        path = pending.file.path
+    assert pending.closed
+    assert not os.path.exists(path)
+
+    # 之後以同一個鍵重新取得時重新解析，不會拿到已關閉的文件
+    with cache.hold("a", loader(1, loads)) as again:
+        assert again is not pending and not again.closed
+        assert again.page_count == 1
+    assert loads == [1, 1, 1]
+
+
+def test_evicted_document_without_holders_closes_immediately():
+    cache = DocumentCache(len(pdf_bytes(1)))
+    loads = []
+    with cache.hold("a", loader(1, loads)) as first:
+        pass
+    with cache.hold("b", loader(1, loads)):
+        assert first.closed
+    assert cache.stats()["entries"] == 1
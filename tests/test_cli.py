@@ -0,0 +1,169 @@
+import io
+import os
+import time
+
+import pytest
+from PyPDF2 import PdfReader
+
+from pdf_factory import make_pdf
+from pdftools import cli, split
+from pdftools.cli import atomic_output, main
+from pdftools.ghostscript import SubprocessBackend
+from pdftools.jobs import CompressCancelled
+
+MB = 1024 * 1024
+
+
+def write_input(path, size):
+    path.write_bytes(b"%PDF-1.4\n" + os.urandom(size))
+    return str(path)
+
+
+def test_atomic_output_replaces_only_on_success(tmp_path):
+    target = tmp_path / "out.pdf"
+    target.write_bytes(b"old")
+
+    with pytest.raises(RuntimeError):
+        with atomic_output(str(target)) as temp_path:
+            with open(temp_path, "wb") as handle:
+                handle.write(b"partial")
+            raise RuntimeError()
+    assert target.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["out.pdf"]
+
+    with atomic_output(str(target)) as temp_path:
+        with open(temp_path, "wb") as handle:
+            handle.write(b"new")
+    assert target.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["out.pdf"]
+
+
+def test_compress_timeout_leaves_no_partial_output(tmp_path, fake_gs, monkeypatch):
+    monkeypatch.setenv("FAKE_GS_SLEEP", "5")
+    source = write_input(tmp_path / "in.pdf", MB)
+    output_dir = tmp_path / "out"
+
+    code = main(["compress", source, "-o", str(output_dir), "-j", "1", "--timeout", "0.3"])
+
+    assert code == 1
+    assert os.listdir(output_dir) == []
+
+
+def test_compress_cancelled_while_writing_keeps_previous_output(tmp_path, monkeypatch):
+    def interrupted(input_path, output_path, *args, **kwargs):
+        with open(output_path, "wb") as handle:
+            handle.write(b"%PDF-1.4 partial")
+        raise CompressCancelled()
+
+    monkeypatch.setattr(cli, "compress_pdf_file", interrupted)
+    source = write_input(tmp_path / "in.pdf", 1024)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    (output_dir / "in_compressed.pdf").write_bytes(b"previous")
+
+    assert main(["compress", source, "-o", str(output_dir), "-j", "1"]) == 1
+    assert os.listdir(output_dir) == ["in_compressed.pdf"]
+    assert (output_dir / "in_compressed.pdf").read_bytes() == b"previous"
+
+
+def test_compress_writes_output_on_success(tmp_path, fake_gs):
+    source = write_input(tmp_path / "in.pdf", MB)
+    output_dir = tmp_path / "out"
+
+    assert main(["compress", source, "-o", str(output_dir), "-j", "1"]) == 0
+    assert os.listdir(output_dir) == ["in_compressed.pdf"]
+
+
+def test_split_and_merge_write_complete_files(tmp_path):
+    source = tmp_path / "in.pdf"
+    source.write_bytes(make_pdf(pages=3))
+    parts_dir = tmp_path / "parts"
+
+    assert main(["split", str(source), "-o", str(parts_dir), "-j", "1"]) == 0
+    parts = sorted(os.listdir(parts_dir / "in"))
+    assert len(parts) == 3 and all(name.endswith(".pdf") for name in parts)
+
+    merged = tmp_path / "merged.pdf"
+    assert main(["merge", str(parts_dir / "in"), "-o", str(merged)]) == 0
+    assert len(PdfReader(str(merged)).pages) == 3
+    assert sorted(os.listdir(tmp_path)) == ["in.pdf", "merged.pdf", "parts"]
+
+
+def test_split_timeout_stops_inside_a_part(tmp_path, monkeypatch):
+    class SlowWriter(split.PdfWriter):
+        def add_page(self, page, *args, **kwargs):
+            time.sleep(0.1)
+            return super().add_page(page, *args, **kwargs)
+
+    monkeypatch.setattr(split, "PdfWriter", SlowWriter)
+    source = tmp_path / "in.pdf"
+    source.write_bytes(make_pdf(pages=20))
+    parts_dir = tmp_path / "parts"
+
+    started = time.monotonic()
+    result = cli.split_one(str(source), str(parts_dir), {
+        "mode": "chunk", "range": "", "chunk_pages": 20, "chunk_mb": 0, "timeout": 0.3,
+    })
+    assert result["status"] == "timeout"
+    assert time.monotonic() - started < 1.5
+    assert os.listdir(parts_dir) == []
+
+
+def test_compress_jobs_default_leaves_room_for_gs_workers(monkeypatch):
+    monkeypatch.setattr(cli, "GS_MAX_WORKERS", 4)
+    monkeypatch.setattr(cli.os, "cpu_count", lambda: 8)
+    parser = cli.build_parser()
+    assert parser.parse_args(["compress", "a.pdf", "-o", "out"]).jobs == 2
+    assert parser.parse_args(["split", "a.pdf", "-o", "out"]).jobs == 8
+
+    monkeypatch.setattr(cli.os, "cpu_count", lambda: 2)
+    assert cli.build_parser().parse_args(["compress", "a.pdf", "-o", "out"]).jobs == 1
+
+
+def test_failed_merge_keeps_existing_output(tmp_path, monkeypatch):
+    class FailingStream(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell() > 0:
+                raise OSError("disk full")
+            return super().read(4)
+
+    monkeypatch.setattr(cli, "merge_pdfs_streaming",
+                        lambda handles, **kwargs: (FailingStream(b"%PDF-1.4 merged"), {"pages": 2}))
+    for name in ("a.pdf", "b.pdf"):
+        (tmp_path / name).write_bytes(make_pdf(pages=1))
+    merged = tmp_path / "merged.pdf"
+    merged.write_bytes(b"previous")
+
+    assert main(["merge", str(tmp_path / "a.pdf"), str(tmp_path / "b.pdf"), "-o", str(merged)]) == 1
+    assert merged.read_bytes() == b"previous"
+    assert sorted(os.listdir(tmp_path)) == ["a.pdf", "b.pdf", "merged.pdf"]
+
+
+class RecordingBackend(SubprocessBackend):
+    """建立與關閉時寫入紀錄檔（工作行程中的呼叫也看得到）"""
+
+    log = None
+
+    def __init__(self):
+        super().__init__()
+        with open(self.log, "a") as f:
+            f.write(f"create {os.getpid()}\n")
+
+    def close(self):
+        with open(self.log, "a") as f:
+            f.write(f"close {os.getpid()}\n")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_compress_creates_one_backend_per_process(tmp_path, fake_gs, monkeypatch, jobs):
+    RecordingBackend.log = str(tmp_path / "backends.log")
+    monkeypatch.setattr(cli, "create_gs_backend", RecordingBackend)
+    sources = [write_input(tmp_path / f"in{i}.pdf", 64 * 1024) for i in range(4)]
+
+    assert main(["compress", *sources, "-o", str(tmp_path / "out"), "-j", str(jobs)]) == 0
+
+    events = (tmp_path / "backends.log").read_text().split("\n")[:-1]
+    created = [line.split()[1] for line in events if line.startswith("create")]
+    closed = [line.split()[1] for line in events if line.startswith("close")]
+    assert len(created) == len(set(created)) <= jobs
+    assert sorted(closed) == sorted(created)
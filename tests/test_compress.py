@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pdf_factory import make_pdf
+from pdftools import compress, ghostscript
+from pdftools.compress import compress_pdf_file
+from pdftools.jobs import CompressCancelled
+
+MB = 1024 * 1024
+
+
+def write_input(path, size):
+    path.write_bytes(b"%PDF-1.4\n" + os.urandom(size))
+    return str(path)
+
+
+def gs_dpis(log):
+    return [int(arg.split("=")[1]) for line in log.read_text().splitlines()
+            for arg in line.split() if arg.startswith("-dColorImageResolution=")]
+
+
+def test_target_size_refines_until_close_to_target(tmp_path, fake_gs, monkeypatch):
+    monkeypatch.setattr(compress, "GS_MAX_WORKERS", 1)
+    monkeypatch.setattr(compress, "GS_REFINE_ROUNDS", 5)
+    monkeypatch.setattr(compress, "GS_REFINE_TOLERANCE", 0.95)
+    source = write_input(tmp_path / "in.pdf", MB)
+    output = str(tmp_path / "out.pdf")
+
+    # 假 gs 的輸出約為原檔的 dpi/300：72 DPI 超過目標，50 DPI 遠低於目標
+    target_mb = 0.2
+    stats = compress_pdf_file(source, output, "high", target_mb)
+
+    target = target_mb * MB
+    assert stats["outcome"] == "success"
+    assert target * 0.95 <= stats["compressed_size"] <= target
+    # 單一工作執行緒時 50 DPI 達標後不再執行 36 DPI；之後每輪細分一個點，一輪不夠接近須再細分
+    dpis = gs_dpis(fake_gs)
+    assert dpis[:2] == [72, 50]
+    assert len(dpis) > 3
+    assert all(50 < dpi < 72 for dpi in dpis[2:])
+
+
+def test_target_size_refines_upward_when_first_candidate_passes(tmp_path, fake_gs, monkeypatch):
+    monkeypatch.setattr(compress, "GS_MAX_WORKERS", 1)
+    monkeypatch.setattr(compress, "GS_REFINE_ROUNDS", 6)
+    monkeypatch.setattr(compress, "GS_REFINE_TOLERANCE", 0.95)
+    source = write_input(tmp_path / "in.pdf", MB)
+
+    # 72 DPI 約為原檔的 24%，遠低於目標；往 300 DPI（畫質最高的預設）細分
+    target_mb = 0.5
+    stats = compress_pdf_file(source, str(tmp_path / "out.pdf"), "high", target_mb)
+
+    assert 0.95 * target_mb * MB <= stats["compressed_size"] <= target_mb * MB
+    dpis = gs_dpis(fake_gs)
+    assert dpis[0] == 72
+    assert len(dpis) > 2
+    assert all(72 < dpi < 300 for dpi in dpis[1:])
+
+
+def test_target_size_stops_refining_within_tolerance(tmp_path, fake_gs, monkeypatch):
+    monkeypatch.setattr(compress, "GS_MAX_WORKERS", 1)
+    monkeypatch.setattr(compress, "GS_REFINE_ROUNDS", 5)
+    monkeypatch.setattr(compress, "GS_REFINE_TOLERANCE", 0.5)
+    source = write_input(tmp_path / "in.pdf", MB)
+
+    stats = compress_pdf_file(source, str(tmp_path / "out.pdf"), "high", 0.2)
+
+    assert stats["compressed_size"] <= 0.2 * MB
+    assert gs_dpis(fake_gs) == [72, 50]
+
+
+def write_photo_pdf(path):
+    """一頁 300 DPI 的雜訊照片（JPEG 品質 95），圖片引擎可以明顯縮小"""
+    from PIL import Image
+
+    Image.effect_noise((1200, 1200), 64).convert("RGB").save(path, "PDF", resolution=300, quality=95)
+    return str(path)
+
+
+def test_gs_timeout_falls_back_to_image_engine(tmp_path, fake_gs, monkeypatch):
+    monkeypatch.setattr(ghostscript, "GS_TIMEOUT", 0.2)
+    monkeypatch.setenv("FAKE_GS_SLEEP", "2")
+    source = write_photo_pdf(tmp_path / "photo.pdf")
+
+    stats = compress_pdf_file(source, str(tmp_path / "out.pdf"), "medium")
+
+    assert stats["outcome"] == "success"
+    assert stats["fallback"] and stats["gs_timed_out"]
+    assert stats["engine"] == "image"
+    assert stats["compressed_size"] < stats["original_size"]
+
+
+def test_gs_failure_fallback_is_not_reported_as_timeout(tmp_path, fake_gs, monkeypatch):
+    monkeypatch.setenv("FAKE_GS_FAIL", "1")
+    source = write_photo_pdf(tmp_path / "photo.pdf")
+
+    stats = compress_pdf_file(source, str(tmp_path / "out.pdf"), "medium")
+
+    assert stats["fallback"] and not stats["gs_timed_out"]
+
+
+def test_cancel_stops_running_gs(tmp_path, fake_gs, monkeypatch):
+    monkeypatch.setenv("FAKE_GS_SLEEP", "5")
+    source = write_input(tmp_path / "in.pdf", MB)
+    cancel_event = threading.Event()
+    threading.Timer(0.3, cancel_event.set).start()
+
+    started = time.monotonic()
+    with pytest.raises(CompressCancelled):
+        compress_pdf_file(source, str(tmp_path / "out.pdf"), "medium", cancel_event=cancel_event)
+    assert time.monotonic() - started < 3
+
+
+def test_progress_reports_gs_pages(tmp_path, fake_gs):
+    source = write_input(tmp_path / "in.pdf", MB)
+    updates = []
+
+    compress_pdf_file(source, str(tmp_path / "out.pdf"), "medium", on_progress=lambda *a: updates.append(a))
+
+    assert updates[-1] == (2, 2)
+
+
+def test_given_preflight_profile_is_not_recomputed(tmp_path, fake_gs, monkeypatch):
+    source = write_photo_pdf(tmp_path / "photo.pdf")
+    profile = compress.build_cost_profile(source)
+    calls = []
+    monkeypatch.setattr(compress, "build_cost_profile", lambda path, cancel_event=None: calls.append(path) or profile)
+
+    compress_pdf_file(source, str(tmp_path / "a.pdf"), "medium", profile=profile)
+    assert calls == []
+
+    compress_pdf_file(source, str(tmp_path / "b.pdf"), "medium")
+    assert calls == [source]
+
+
+def test_lossless_and_preflight_stop_at_next_page_when_cancelled(tmp_path):
+    source = tmp_path / "in.pdf"
+    source.write_bytes(make_pdf(pages=3))
+    cancel_event = threading.Event()
+    pages = []
+
+    def on_progress(done, total):
+        pages.append(done)
+        cancel_event.set()
+
+    with pytest.raises(CompressCancelled):
+        compress_pdf_file(str(source), str(tmp_path / "out.pdf"), "medium", engine="lossless",
+                          cancel_event=cancel_event, on_progress=on_progress)
+    assert pages == [1]
+
+    with pytest.raises(CompressCancelled):
+        compress.build_cost_profile(str(source), cancel_event)
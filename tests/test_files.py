@@ -0,0 +1,127 @@
+import gc
+import os
+import subprocess
+import sys
+
+import pytest
+
+from pdftools import files
+from pdftools.files import SessionFile, StagedFile, path_fds
+
+MB = 1024 * 1024
+
+needs_memfd = pytest.mark.skipif(not hasattr(os, "memfd_create"), reason="系統不支援 memfd_create")
+
+
+def fail_memfd(monkeypatch):
+    def memfd_create(*args, **kwargs):
+        raise OSError("memfd_create unavailable")
+    monkeypatch.setattr(os, "memfd_create", memfd_create, raising=False)
+
+
+def hide_dev_shm(monkeypatch):
+    access = os.access
+    monkeypatch.setattr(os, "access", lambda path, mode: path != "/dev/shm" and access(path, mode))
+
+
+def read_in_child(path, pass_fds=()):
+    return subprocess.run([sys.executable, "-c", "import sys; sys.stdout.write(open(sys.argv[1]).read())", path],
+                          capture_output=True, text=True, pass_fds=pass_fds)
+
+
+@needs_memfd
+def test_memfd_is_preferred():
+    with StagedFile(b"%PDF-1.4 data") as staged:
+        assert staged.mode == "memfd"
+        assert staged.pass_fds == (staged.fd,) == path_fds(staged.path)
+        assert staged.read_bytes() == b"%PDF-1.4 data"
+        assert staged.size() == 13
+
+
+@pytest.mark.skipif(not os.access("/dev/shm", os.W_OK), reason="沒有可寫入的 /dev/shm")
+def test_falls_back_to_dev_shm_when_memfd_fails(monkeypatch):
+    fail_memfd(monkeypatch)
+    with StagedFile(b"data") as staged:
+        assert staged.mode == "tmpfs"
+        assert staged.path.startswith("/dev/shm/")
+        assert staged.pass_fds == ()
+        assert staged.read_bytes() == b"data"
+
+
+def test_falls_back_to_disk_without_memfd_or_dev_shm(monkeypatch):
+    fail_memfd(monkeypatch)
+    hide_dev_shm(monkeypatch)
+    with StagedFile(b"data", suffix=".bin") as staged:
+        assert staged.mode == "file"
+        assert os.path.dirname(staged.path) == files.tempfile.gettempdir()
+        assert staged.path.endswith(".bin")
+        assert staged.read_bytes() == b"data"
+
+
+@needs_memfd
+def test_large_files_go_to_disk(monkeypatch):
+    monkeypatch.setattr(files, "MEMORY_BUFFER_MB", 1)
+    with StagedFile(b"x" * 1024) as small:
+        assert small.mode == "memfd"
+    with StagedFile(b"x" * (MB + 1)) as large:
+        assert large.mode == "file"
+        assert large.size() == MB + 1
+    with StagedFile(size_hint=2 * MB) as hinted:
+        assert hinted.mode == "file"
+    # 明確指定模式時不依大小切換
+    with StagedFile(size_hint=2 * MB, mode="memfd") as forced:
+        assert forced.mode == "memfd"
+
+
+@pytest.mark.parametrize("mode", ["auto", "tmpfs", "file"])
+def test_close_releases_storage(mode):
+    staged = StagedFile(b"data", mode=mode)
+    fd, path = staged.fd, staged.path
+    staged.close()
+    assert staged.path is None
+    if fd is not None:
+        with pytest.raises(OSError):
+            os.fstat(fd)
+    else:
+        assert not os.path.exists(path)
+    staged.close()
+
+
+def test_wrapped_path_is_not_deleted(tmp_path):
+    target = tmp_path / "out.pdf"
+    target.write_bytes(b"data")
+    with StagedFile.wrap(str(target)) as staged:
+        assert staged.mode == "external"
+        assert staged.size() == 4
+    assert target.read_bytes() == b"data"
+
+
+@needs_memfd
+def test_dev_fd_path_is_readable_only_through_pass_fds():
+    with StagedFile(b"shared") as staged:
+        assert read_in_child(staged.path, staged.pass_fds).stdout == "shared"
+        assert read_in_child(staged.path).returncode != 0
+
+
+def test_session_file_is_removed_on_close():
+    session = SessionFile()
+    path = session.path
+    assert os.path.basename(path).startswith("pdf_tools_")
+    with open(path, "wb") as f:
+        f.write(b"upload")
+    assert session.read_bytes() == b"upload"
+    assert session.size() == 6
+
+    session.close()
+    assert not os.path.exists(path)
+    session.close()
+
+
+def test_session_file_is_removed_when_collected():
+    session = SessionFile(suffix=".zip")
+    path = session.path
+    assert os.path.exists(path) and path.endswith(".zip")
+
+    del session
+    gc.collect()
+    assert not os.path.exists(path)
@@ -0,0 +1,176 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from pdftools import ghostscript
+from pdftools.ghostscript import (GsPageCounter, SubprocessBackend, create_gs_backend, interpolate_params, plan_shards,
+                                  wait_process)
+
+
+def test_create_backend_warns_when_gsapi_unavailable(monkeypatch, caplog):
+    def unavailable(*args, **kwargs):
+        raise ImportError("No module named 'ghostscript'")
+
+    monkeypatch.setattr(ghostscript, "GsapiBackend", unavailable)
+    with caplog.at_level(logging.WARNING, logger="pdftools.ghostscript"):
+        backend = create_gs_backend("gsapi")
+
+    assert isinstance(backend, SubprocessBackend)
+    assert "gsapi" in caplog.text and "ImportError" in caplog.text
+
+
+def test_create_backend_subprocess_is_silent(caplog):
+    with caplog.at_level(logging.WARNING, logger="pdftools.ghostscript"):
+        assert isinstance(create_gs_backend("subprocess"), SubprocessBackend)
+    assert caplog.text == ""
+
+
+@pytest.mark.parametrize("pages, workers, expected", [
+    (100, 4, [(1, 25), (26, 50), (51, 75), (76, 100)]),
+    (25, 4, [(1, 12), (13, 25)]),
+    (5, 4, [(1, 5)]),
+])
+def test_plan_shards_covers_every_page(pages, workers, expected):
+    assert plan_shards(pages, workers) == expected
+
+
+def test_interpolate_params_excludes_bounds_and_duplicates():
+    assert interpolate_params((72, 50), (50, 30), 3) == [(66, 45), (61, 40), (56, 35)]
+    assert interpolate_params((51, 30), (50, 30), 3) == []
+
+
+def sleeper():
+    return subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"], start_new_session=True)
+
+
+def test_wait_process_kills_on_timeout():
+    process = sleeper()
+    started = time.monotonic()
+    assert wait_process(process, 0.2) == "timeout"
+    assert time.monotonic() - started < 5
+    assert process.returncode is not None
+
+
+def test_wait_process_kills_on_cancel():
+    process = sleeper()
+    cancel_event = threading.Event()
+    threading.Timer(0.2, cancel_event.set).start()
+    assert wait_process(process, 30, cancel_event) == "cancelled"
+    assert process.returncode is not None
+
+
+def test_page_counter_parses_range_and_pages():
+    updates = []
+    counter = GsPageCounter(lambda: updates.append((counter.done, counter.total)))
+    for line in ["GPL Ghostscript 10.0", "Processing pages 3 through 5.", "Page 3", "Page 4", "Loading font"]:
+        counter.feed(line)
+    assert updates == [(0, 3), (1, 3), (2, 3)]
+
+
+def test_subprocess_backend_streams_output_and_reports_failure(fake_gs, monkeypatch, tmp_path):
+    source = tmp_path / "in.pdf"
+    source.write_bytes(b"%PDF" * 100)
+    command = ghostscript.build_gs_command(str(source), str(tmp_path / "out.pdf"), "/ebook", 150, 75)
+    lines = []
+    assert SubprocessBackend().run(command, on_output=lines.append) == "done"
+    assert [line.strip() for line in lines] == ["Processing pages 1 through 2.", "Page 1", "Page 2"]
+    assert (tmp_path / "out.pdf").stat().st_size == 200
+
+    monkeypatch.setenv("FAKE_GS_FAIL", "1")
+    assert SubprocessBackend().run(command) == "failed"
+
+
+def gsapi_command(tmp_path, content, name="in.pdf"):
+    source = tmp_path / name
+    source.write_bytes(content)
+    output = tmp_path / f"out-{name}"
+    return ghostscript.build_gs_command(str(source), str(output), "/ebook", 150, 75), output
+
+
+@pytest.fixture
+def gsapi_backend(fake_gsapi):
+    backend = ghostscript.GsapiBackend(max_workers=1)
+    yield backend
+    backend.close()
+
+
+def test_gsapi_backend_runs_jobs_in_warm_worker(tmp_path, gsapi_backend, fake_gsapi):
+    command, output = gsapi_command(tmp_path, b"%PDF" * 100)
+    lines = []
+    usage = {}
+
+    assert gsapi_backend.run(command, on_output=lines.append, usage=usage) == "done"
+    assert lines == ["Processing pages 1 through 2.", "Page 1", "Page 2"]
+    assert output.stat().st_size == 200
+    assert usage["cpu_s"] >= 0
+
+    process, _ = gsapi_backend._idle.queue[0]
+    command, _ = gsapi_command(tmp_path, b"FAIL", "fail.pdf")
+    assert gsapi_backend.run(command) == "failed"
+    # 失敗的工作不影響常駐程序
+    assert gsapi_backend._idle.queue[0][0] is process and process.is_alive()
+
+
+def test_gsapi_backend_opens_passed_fds_through_proc(tmp_path, gsapi_backend, fake_gsapi):
+    source = tmp_path / "in.pdf"
+    source.write_bytes(b"%PDF" * 100)
+    fd = os.open(source, os.O_RDONLY)
+    try:
+        command = ghostscript.build_gs_command(f"/dev/fd/{fd}", str(tmp_path / "out.pdf"), "/ebook", 150, 75)
+        assert gsapi_backend.run(command, pass_fds=(fd,)) == "done"
+    finally:
+        os.close(fd)
+
+    assert f"/proc/{os.getpid()}/fd/{fd}" in fake_gsapi.read_text()
+    assert (tmp_path / "out.pdf").stat().st_size == 200
+
+
+def test_gsapi_backend_reports_per_job_peak_memory(tmp_path, monkeypatch, fake_gsapi):
+    if not ghostscript.reset_peak_rss():
+        pytest.skip("核心不支援以 clear_refs 重設 VmHWM")
+    monkeypatch.setenv("FAKE_GSAPI_ALLOC_MB", "128")
+    backend = ghostscript.GsapiBackend(max_workers=1)
+    try:
+        big, small = {}, {}
+        assert backend.run(gsapi_command(tmp_path, b"ALLOC", "big.pdf")[0], usage=big) == "done"
+        assert backend.run(gsapi_command(tmp_path, b"%PDF", "small.pdf")[0], usage=small) == "done"
+    finally:
+        backend.close()
+
+    assert big["max_rss_kb"] > 128 * 1024
+    # 同一個常駐程序的下一個工作不再帶著前一個工作的高峰
+    assert 0 < small["max_rss_kb"] < big["max_rss_kb"] - 64 * 1024
+
+
+def test_gsapi_backend_replaces_worker_on_timeout(tmp_path, monkeypatch, gsapi_backend):
+    monkeypatch.setattr(ghostscript, "GS_TIMEOUT", 0.5)
+    process, _ = gsapi_backend._idle.queue[0]
+
+    assert gsapi_backend.run(gsapi_command(tmp_path, b"SLEEP", "slow.pdf")[0]) == "timeout"
+    assert not process.is_alive()
+    assert gsapi_backend.run(gsapi_command(tmp_path, b"%PDF" * 10)[0]) == "done"
+
+
+def test_gsapi_backend_close_stops_workers(tmp_path, fake_gsapi):
+    backend = ghostscript.GsapiBackend(max_workers=2)
+    processes = [process for process, _ in backend._idle.queue]
+
+    backend.close()
+
+    assert all(not process.is_alive() for process in processes)
+    with pytest.raises(RuntimeError):
+        backend.run(gsapi_command(tmp_path, b"%PDF")[0])
+    backend.close()
+
+
+def test_create_backend_uses_gsapi_when_available(fake_gsapi):
+    backend = create_gs_backend("gsapi")
+    try:
+        assert isinstance(backend, ghostscript.GsapiBackend)
+    finally:
+        backend.close()
@@ -0,0 +1,112 @@
+import itertools
+
+import pytest
+
+from pdftools import cache
+from pdftools.cache import CompressHistory
+from pdftools.preflight import predict_compressed_size
+
+MB = 1024 * 1024
+
+
+def make_profile(file_size, image_share=0.8):
+    """一張 300 DPI 照片加上其他結構的預檢結果"""
+    image_bytes = int(file_size * image_share)
+    return {
+        "file_size": file_size,
+        "pages": 1,
+        "image_bytes": image_bytes,
+        "font_bytes": 0,
+        "content_bytes": 0,
+        "content_uncompressed_bytes": 0,
+        "other_bytes": file_size - image_bytes,
+        "images": [{"width": 2400, "height": 3300, "components": 3, "filter": "/DCTDecode",
+                    "bytes": image_bytes, "dpi": 300.0}],
+    }
+
+
+def record_runs(history, count, bias=0.5):
+    """實際結果固定為預估大小的 bias 倍"""
+    params = itertools.cycle(itertools.product((150, 100, 72, 50), (75, 50, 30)))
+    for i in range(count):
+        profile = make_profile((2 + i % 5) * MB, 0.5 + 0.1 * (i % 4))
+        dpi, jpeg_quality = next(params)
+        history.record_run(profile, dpi, jpeg_quality, int(predict_compressed_size(profile, dpi, jpeg_quality) * bias))
+
+
+def test_no_model_until_enough_samples(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "HISTORY_MIN_SAMPLES", 12)
+    history = CompressHistory(str(tmp_path / "history.sqlite3"))
+    record_runs(history, 11)
+
+    assert history.choose_params(make_profile(4 * MB), MB) is None
+    assert not history.stats()["model_ready"]
+
+    record_runs(history, 1)
+    assert history.choose_params(make_profile(4 * MB), MB) is not None
+    assert history.stats()["model_ready"]
+
+
+def test_model_learns_bias_of_preflight_estimate(tmp_path):
+    history = CompressHistory(str(tmp_path / "history.sqlite3"))
+    record_runs(history, 40, bias=0.5)
+
+    coef, sigma = history._fit()
+    assert sigma < 0.01
+    profile = make_profile(4 * MB)
+    target = MB
+    dpi, jpeg_quality = history.choose_params(profile, target)
+    actual = predict_compressed_size(profile, dpi, jpeg_quality) * 0.5
+    # 選出的參數實際不超過目標，且是候選中最接近目標的一組
+    assert actual <= target
+    sizes = [predict_compressed_size(profile, d, q) * 0.5
+             for d in CompressHistory.DPI_CHOICES for q in CompressHistory.QUALITY_CHOICES]
+    assert actual == pytest.approx(max(size for size in sizes if size <= target), rel=0.01)
+
+
+def test_fit_reuses_model_until_new_runs(tmp_path):
+    history = CompressHistory(str(tmp_path / "history.sqlite3"))
+    record_runs(history, 20)
+
+    model = history._fit()
+    assert history._fit() is model
+    record_runs(history, 1)
+    assert history._fit() is not model
+
+
+def test_unreachable_target_returns_none(tmp_path):
+    history = CompressHistory(str(tmp_path / "history.sqlite3"))
+    record_runs(history, 20)
+
+    assert history.choose_params(make_profile(4 * MB), 1000) is None
+
+
+def test_history_persists_and_reports_requests(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    history = CompressHistory(path)
+    record_runs(history, 3)
+    history.record_request(MB, passes=1, met=True, learned=True)
+    history.record_request(MB, passes=3, met=True, learned=False)
+    history.record_request(MB, passes=2, met=False, learned=False)
+
+    stats = CompressHistory(path).stats()
+    assert stats["samples"] == 3
+    assert stats["requests"] == 3
+    assert stats["avg_passes"] == 2.0
+    assert stats["met_rate"] == 2 / 3
+    assert stats["hit_rate"] == 1 / 3
+    assert stats["learned"] == 1
+
+
+def test_history_keeps_only_recent_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "HISTORY_MAX_SAMPLES", 15)
+    history = CompressHistory(str(tmp_path / "history.sqlite3"))
+    record_runs(history, 40)
+    for passes in range(1, 21):
+        history.record_request(MB, passes=passes, met=True, learned=False)
+
+    stats = history.stats()
+    assert stats["samples"] == 15
+    assert stats["requests"] == 15
+    # 保留的是最近的請求（執行次數 6 到 20）
+    assert stats["avg_passes"] == 13.0
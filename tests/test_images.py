@@ -0,0 +1,228 @@
+import io
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+from PIL import Image, ImageDraw, features
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, EncodedStreamObject, NameObject, NumberObject
+
+from pdftools import images
+from pdftools.images import (classify_scan, compress_pdf_images, encode_bitonal, estimate_jpeg_quality,
+                             recompress_pdf_image)
+from pdftools.jobs import CompressCancelled
+
+# 文字區塊（墨色）在頁面中的位置
+INK_BOX = (100, 150, 500, 250)
+
+needs_libtiff = pytest.mark.skipif(not features.check_codec("libtiff"), reason="Pillow 未附 libtiff")
+
+
+def scanned_page(width=800, height=1000):
+    """淺灰紙色加上一塊深色文字區的黑白掃描頁"""
+    img = Image.new("L", (width, height), 235)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle(INK_BOX, fill=25)
+    for y in range(300, 900, 24):
+        draw.line((80, y, 720, y), fill=30, width=3)
+    return img
+
+
+def decode_ccitt(data, size):
+    """依 PDF 的 CCITTFaxDecode 語意（BlackIs1 false）解碼：包成 WhiteIsZero 的 G4 TIFF 交給 Pillow"""
+    width, height = size
+    tags = [(256, 4, width), (257, 4, height), (258, 3, 1), (259, 3, 4), (262, 3, 0),
+            (273, 4, 0), (277, 3, 1), (278, 4, height), (279, 4, len(data))]
+    ifd_size = 2 + len(tags) * 12 + 4
+    data_offset = 8 + ifd_size
+    ifd = struct.pack("<H", len(tags))
+    for tag, kind, value in tags:
+        value = data_offset if tag == 273 else value
+        ifd += struct.pack("<HHII" if kind == 4 else "<HHIHxx", tag, kind, 1, value)
+    tiff = b"II*\x00" + struct.pack("<I", 8) + ifd + b"\x00\x00\x00\x00" + data
+    return Image.open(io.BytesIO(tiff)).convert("L")
+
+
+def assert_ink_is_black(decoded):
+    left, top, right, bottom = INK_BOX
+    scale = decoded.width / 800
+    assert decoded.getpixel((int((left + right) / 2 * scale), int((top + bottom) / 2 * scale))) == 0
+    assert decoded.getpixel((int(40 * scale), int(40 * scale))) == 255
+
+
+def test_classify_scan_kinds():
+    assert classify_scan(scanned_page())[0] == "bitonal"
+    gradient = Image.linear_gradient("L").resize((400, 400))
+    assert classify_scan(gradient) == ("gray", 0)
+    photo = Image.merge("RGB", [Image.linear_gradient("L"), Image.linear_gradient("L").rotate(90),
+                                Image.new("L", (256, 256), 128)])
+    assert classify_scan(photo) == ("color", 0)
+    # 偏黃的紙張校正色偏後仍是黑白
+    yellow = Image.merge("RGB", [scanned_page(), scanned_page(), scanned_page().point(lambda v: v * 0.8)])
+    assert classify_scan(yellow)[0] == "bitonal"
+
+
+@needs_libtiff
+def test_ccitt_keeps_ink_black():
+    page = scanned_page()
+    kind, threshold = classify_scan(page)
+
+    data, size, filter_name = encode_bitonal(page, threshold, 1000)
+
+    assert filter_name == "/CCITTFaxDecode"
+    assert size == page.size
+    assert_ink_is_black(decode_ccitt(data, size))
+
+
+def test_flate_fallback_keeps_ink_black(monkeypatch):
+    monkeypatch.setattr(images.features, "check_codec", lambda codec: False)
+    page = scanned_page()
+    _, threshold = classify_scan(page)
+
+    data, size, filter_name = encode_bitonal(page, threshold, 500)
+
+    assert filter_name == "/FlateDecode"
+    assert size == (400, 500)
+    # DeviceGray 的 1 位元像素以 1 為白色，與 Pillow 的 "1" 模式相同
+    assert_ink_is_black(Image.frombytes("1", size, zlib.decompress(data)).convert("L"))
+
+
+@needs_libtiff
+def test_scan_mode_writes_ccitt_with_default_polarity(tmp_path):
+    source = tmp_path / "scan.pdf"
+    page = scanned_page()
+    # 加上紙張雜點，讓原始圖片大到值得重新壓縮
+    noisy = Image.blend(page, Image.effect_noise(page.size, 40).convert("L"), 0.1)
+    noisy.save(source, "PDF", resolution=100, quality=95)
+    output = tmp_path / "out.pdf"
+    counters = {}
+
+    assert compress_pdf_images(str(source), str(output), 50, mono_dpi=100, counters=counters) == 1
+
+    assert counters == {"bitonal": 1}
+    xobject = next(iter(PdfReader(str(output)).pages[0]["/Resources"]["/XObject"].values())).get_object()
+    assert xobject["/Filter"] == "/CCITTFaxDecode"
+    assert xobject["/BitsPerComponent"] == 1
+    assert "/BlackIs1" not in xobject["/DecodeParms"]
+    assert xobject["/DecodeParms"]["/K"] == -1
+    assert_ink_is_black(decode_ccitt(xobject._data, (xobject["/Width"], xobject["/Height"])))
+
+
+def noise_photo(size=(300, 300)):
+    return Image.effect_noise(size, 64).convert("RGB")
+
+
+def jpeg_bytes(img, quality):
+    output = io.BytesIO()
+    img.save(output, "JPEG", quality=quality)
+    return output.getvalue()
+
+
+def image_xobject(data, size, filter_name=None, color_space="/DeviceRGB", **entries):
+    xobject = EncodedStreamObject()
+    xobject._data = data
+    xobject[NameObject("/Subtype")] = NameObject("/Image")
+    xobject[NameObject("/Width")] = NumberObject(size[0])
+    xobject[NameObject("/Height")] = NumberObject(size[1])
+    xobject[NameObject("/ColorSpace")] = NameObject(color_space)
+    xobject[NameObject("/BitsPerComponent")] = NumberObject(8)
+    if filter_name:
+        xobject[NameObject("/Filter")] = NameObject(filter_name)
+    for key, value in entries.items():
+        xobject[NameObject(f"/{key}")] = value
+    return xobject
+
+
+@pytest.mark.parametrize("quality", [20, 50, 75, 90])
+def test_estimate_jpeg_quality(quality):
+    with Image.open(io.BytesIO(jpeg_bytes(noise_photo(), quality))) as img:
+        assert abs(estimate_jpeg_quality(img) - quality) <= 2
+    # 沒有量化表（非 JPEG）視為最高品質
+    assert estimate_jpeg_quality(noise_photo()) == 100
+
+
+def test_jpeg_at_or_below_requested_quality_is_left_alone(monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_MIN_KB", 0)
+    photo = noise_photo()
+
+    low = jpeg_bytes(photo, 40)
+    assert recompress_pdf_image(image_xobject(low, photo.size, "/DCTDecode"), 50) is None
+    assert recompress_pdf_image(image_xobject(jpeg_bytes(photo, 50), photo.size, "/DCTDecode"), 50) is None
+
+    high = jpeg_bytes(photo, 95)
+    data, size, mode, filter_name = recompress_pdf_image(image_xobject(high, photo.size, "/DCTDecode"), 50)
+    assert len(data) < len(high) and (mode, filter_name) == ("RGB", "/DCTDecode")
+
+
+@pytest.mark.parametrize("mono_max_side", [0, 1000])
+def test_color_key_masked_images_are_left_alone(monkeypatch, mono_max_side):
+    monkeypatch.setattr(images, "IMAGE_MIN_KB", 0)
+    photo = noise_photo()
+    raw = zlib.compress(photo.tobytes())
+    assert recompress_pdf_image(image_xobject(raw, photo.size, "/FlateDecode"), 50, mono_max_side) is not None
+
+    color_key = ArrayObject([NumberObject(v) for v in (0, 10, 0, 10, 0, 10)])
+    masked = image_xobject(raw, photo.size, "/FlateDecode", Mask=color_key)
+    assert recompress_pdf_image(masked, 50, mono_max_side) is None
+
+
+def write_photo_pages(path, pages):
+    """每頁一張不同的照片"""
+    photos = [noise_photo((200, 200)) for _ in range(pages)]
+    photos[0].save(path, "PDF", save_all=True, append_images=photos[1:], resolution=72, quality=95)
+    return str(path)
+
+
+def test_in_flight_images_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_WORKERS", 2)
+    lock = threading.Lock()
+    outstanding = [0, 0]  # 目前尚未完成的圖片數、最大值
+    calls = []
+
+    class CountingPool(images.ThreadPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            with lock:
+                outstanding[0] += 1
+                outstanding[1] = max(outstanding[1], outstanding[0])
+            future = super().submit(fn, *args, **kwargs)
+            future.add_done_callback(lambda _: self._finished())
+            return future
+
+        def _finished(self):
+            with lock:
+                outstanding[0] -= 1
+
+    def slow(xobject, quality, mono_max_side):
+        calls.append(quality)
+        time.sleep(0.02)
+        return None
+
+    monkeypatch.setattr(images, "ThreadPoolExecutor", CountingPool)
+    monkeypatch.setattr(images, "recompress_pdf_image", slow)
+    source = write_photo_pages(tmp_path / "photos.pdf", 12)
+
+    assert compress_pdf_images(source, str(tmp_path / "out.pdf"), 50) == 0
+    assert len(calls) == 12
+    assert outstanding[1] <= 2 * 2
+
+
+def test_cancel_event_stops_and_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_WORKERS", 1)
+    cancel_event = threading.Event()
+    calls = []
+
+    def cancelling(xobject, quality, mono_max_side):
+        calls.append(quality)
+        cancel_event.set()
+        return None
+
+    monkeypatch.setattr(images, "recompress_pdf_image", cancelling)
+    source = write_photo_pages(tmp_path / "photos.pdf", 12)
+    output = tmp_path / "out.pdf"
+
+    with pytest.raises(CompressCancelled):
+        compress_pdf_images(source, str(output), 50, cancel_event)
+    assert len(calls) < 12
+    assert not output.exists()
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from pdftools.jobs import CompressCancelled, JobScheduler
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out waiting for condition"
+        time.sleep(0.01)
+
+
+def blocking_job(release: threading.Event, started: list, cancel_event=None, on_progress=None, name=None):
+    started.append(name)
+    while not release.wait(0.01):
+        if cancel_event.is_set():
+            raise CompressCancelled()
+    return name
+
+
+def test_limits_concurrency_and_runs_fifo():
+    scheduler = JobScheduler(2)
+    release = threading.Event()
+    started = []
+    jobs = [scheduler.submit(blocking_job, release, started, name=i) for i in range(5)]
+
+    wait_until(lambda: len(started) == 2)
+    time.sleep(0.05)
+    assert sorted(started) == [0, 1]
+    assert [scheduler.position(job) for job in jobs] == [0, 0, 1, 2, 3]
+    assert scheduler.stats()["running"] == 2
+    assert scheduler.stats()["queue_depth"] == 3
+    assert scheduler.estimated_wait(jobs[4]) > scheduler.estimated_wait(jobs[2]) > 0
+
+    release.set()
+    for job in jobs:
+        assert job.finished.wait(5)
+    assert [job.result() for job in jobs] == list(range(5))
+    assert sorted(started[2:]) == [2, 3, 4]
+    assert jobs[2].started_at <= jobs[3].started_at <= jobs[4].started_at
+    assert scheduler.stats()["completed"] == 5
+
+
+def test_cancel_queued_job_never_runs():
+    scheduler = JobScheduler(1)
+    release = threading.Event()
+    started = []
+    running = scheduler.submit(blocking_job, release, started, name="running")
+    queued = scheduler.submit(blocking_job, release, started, name="queued")
+    wait_until(lambda: started == ["running"])
+
+    scheduler.cancel(queued)
+    assert queued.finished.is_set()
+    assert queued.status == "cancelled"
+    with pytest.raises(CompressCancelled):
+        queued.result()
+
+    release.set()
+    assert running.finished.wait(5)
+    time.sleep(0.05)
+    assert started == ["running"]
+    assert scheduler.stats()["cancelled"] == 1
+
+
+def test_cancel_running_job_signals_cancel_event():
+    scheduler = JobScheduler(1)
+    started = []
+    job = scheduler.submit(blocking_job, threading.Event(), started, name="running")
+    wait_until(lambda: job.status == "running")
+
+    scheduler.cancel(job)
+    assert job.finished.wait(5)
+    assert job.status == "cancelled"
+    with pytest.raises(CompressCancelled):
+        job.result()
+
+
+def test_failed_job_reraises_and_reports_progress():
+    def failing(cancel_event=None, on_progress=None):
+        on_progress(3, 10)
+        raise ValueError("broken pdf")
+
+    scheduler = JobScheduler(1)
+    job = scheduler.submit(failing)
+    assert job.finished.wait(5)
+    assert job.status == "failed"
+    assert (job.pages_done, job.pages_total) == (3, 10)
+    with pytest.raises(ValueError, match="broken pdf"):
+        job.result()
+    assert scheduler.stats()["failed"] == 1
@@ -0,0 +1,110 @@
+import io
+
+import pytest
+
+from pdf_factory import make_pdf
+from pdftools import linearize
+from pdftools.linearize import (first_page_bytes, is_linearized, linearization_params, linearize_in_place,
+                                linearize_pdf, linearize_tool)
+
+
+def linearized_bytes(body=b"2 0 obj <<>> endobj\n" * 50, first_page_end=300):
+    """開頭為線性化參數字典、/L 等於檔案大小的內容"""
+    header = b"%%PDF-1.7\n1 0 obj <</Linearized 1 /L %010d /H [ 120 40 ] /O 4 /E %d /N 2 /T 700>> endobj\n"
+    return header % (len(header % (0, first_page_end)) + len(body), first_page_end) + body
+
+
+@pytest.fixture
+def no_tools(tmp_path, monkeypatch):
+    """PATH 中只有測試放入的工具"""
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    monkeypatch.setenv("PATH", str(empty))
+
+
+def test_linearization_params_reads_integers_and_skips_hint_array(tmp_path):
+    path = tmp_path / "lin.pdf"
+    data = linearized_bytes()
+    path.write_bytes(data)
+
+    assert linearization_params(str(path)) == {"L": len(data), "O": 4, "E": 300, "N": 2, "T": 700}
+    assert is_linearized(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("data", [
+    linearized_bytes() + b"3 0 obj <<>> endobj\n",  # 增量更新後 /L 不再等於檔案大小
+    linearized_bytes().replace(b"/E 300", b"/X 300"),  # 缺少第一頁區段結尾
+    make_pdf(pages=1),  # 一般檔案
+    b"%PDF-1.7\n" + b"%" * 1100 + b"\n" + linearized_bytes()[9:],  # 參數字典不在前 1024 個位元組內
+])
+def test_invalid_linearization_is_rejected(data):
+    assert linearization_params(io.BytesIO(data)) is None
+
+
+def test_first_page_bytes(tmp_path):
+    plain = make_pdf(pages=2)
+    stream = io.BytesIO(plain)
+    assert first_page_bytes(stream) == len(plain)
+    assert stream.tell() == 0
+
+    path = tmp_path / "lin.pdf"
+    path.write_bytes(linearized_bytes(first_page_end=321))
+    assert first_page_bytes(str(path)) == 321
+
+
+def test_linearize_tool_selection(monkeypatch, no_tools, fake_gs, fake_qpdf):
+    assert linearize_tool() == "qpdf"
+    monkeypatch.setattr(linearize, "LINEARIZE_TOOL", "gs")
+    assert linearize_tool() == "gs"
+
+
+def test_linearize_tool_falls_back_to_gs(no_tools, fake_gs):
+    assert linearize_tool() == "gs"
+
+
+def test_linearize_pdf_unavailable_without_tools(tmp_path, no_tools):
+    source = tmp_path / "in.pdf"
+    source.write_bytes(make_pdf(pages=1))
+    assert linearize_pdf(str(source), str(tmp_path / "out.pdf")) == "unavailable"
+
+
+@pytest.mark.parametrize("env, outcome", [
+    ({}, "done"),
+    ({"FAKE_QPDF_EXIT": "3"}, "done"),  # 成功但有警告
+    ({"FAKE_QPDF_EXIT": "2"}, "failed"),
+    ({"FAKE_QPDF_PLAIN": "1"}, "failed"),  # 結束碼正常但輸出不是有效的線性化檔案
+])
+def test_linearize_pdf_validates_qpdf_output(tmp_path, monkeypatch, no_tools, fake_qpdf, env, outcome):
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    source = tmp_path / "in.pdf"
+    source.write_bytes(make_pdf(pages=2))
+    output = tmp_path / "out.pdf"
+
+    assert linearize_pdf(str(source), str(output)) == outcome
+    if outcome == "done":
+        assert first_page_bytes(str(output)) == 500
+
+
+def test_linearize_in_place_keeps_original_on_failure(tmp_path, monkeypatch, no_tools, fake_qpdf):
+    path = tmp_path / "in.pdf"
+    original = make_pdf(pages=2)
+    path.write_bytes(original)
+
+    monkeypatch.setenv("FAKE_QPDF_EXIT", "2")
+    assert not linearize_in_place(str(path))
+    assert path.read_bytes() == original
+
+    monkeypatch.delenv("FAKE_QPDF_EXIT")
+    assert linearize_in_place(str(path))
+    assert is_linearized(str(path))
+
+
+def test_linearize_in_place_skips_linearized_files(tmp_path, monkeypatch, no_tools, fake_qpdf):
+    path = tmp_path / "lin.pdf"
+    data = linearized_bytes()
+    path.write_bytes(data)
+    monkeypatch.setenv("FAKE_QPDF_EXIT", "2")
+
+    assert linearize_in_place(str(path))
+    assert path.read_bytes() == data
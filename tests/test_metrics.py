@@ -0,0 +1,132 @@
+import json
+import logging
+import urllib.error
+import urllib.request
+
+import pytest
+
+from pdftools import metrics
+from pdftools.jobs import CompressCancelled
+from pdftools.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = MetricsRegistry(window=100)
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def observe(registry, name, duration, outcome="success", **fields):
+    registry.observe({"stage": name, "outcome": outcome, "duration_s": duration, **fields})
+
+
+def test_percentiles_use_nearest_rank(registry):
+    for value in range(100, 0, -1):
+        observe(registry, "merge", float(value))
+    entry = registry.stats()["merge"]
+    assert (entry["p50_s"], entry["p95_s"], entry["p99_s"], entry["max_s"]) == (50.0, 95.0, 99.0, 100.0)
+    assert entry["count"] == 100
+    assert entry["duration_s"] == sum(range(1, 101))
+
+    observe(registry, "split", 0.25)
+    single = registry.stats()["split"]
+    assert single["p50_s"] == single["p99_s"] == single["max_s"] == 0.25
+
+
+def test_percentiles_cover_only_recent_window():
+    registry = MetricsRegistry(window=10)
+    for value in range(1, 21):
+        observe(registry, "zip", float(value))
+    entry = registry.stats()["zip"]
+    assert entry["p50_s"] == 15.0
+    assert entry["max_s"] == 20.0
+    assert entry["count"] == 20
+
+
+def test_sums_outcomes_and_child_peak(registry):
+    observe(registry, "gs", 1.0, bytes_in=100, bytes_out=40, child_max_rss_kb=2048)
+    observe(registry, "gs", 2.0, "timeout", bytes_in=50, child_max_rss_kb=1024)
+    entry = registry.stats()["gs"]
+    assert entry["outcomes"] == {"success": 1, "timeout": 1}
+    assert (entry["bytes_in"], entry["bytes_out"]) == (150, 40)
+    assert entry["child_max_rss_kb"] == 2048
+
+
+def test_prometheus_escapes_label_values(registry):
+    observe(registry, 'odd "stage"\\x\nnext', 0.5, 'bad "outcome"')
+    text = registry.prometheus()
+    assert 'stage="odd \\"stage\\"\\\\x\\nnext",quantile="0.5"} 0.500000' in text
+    assert 'outcome="bad \\"outcome\\""} 1' in text
+    # 每一筆樣本都在同一行內
+    for line in text.splitlines():
+        assert line.startswith(("# HELP", "# TYPE", "pdftools_"))
+
+
+def test_prometheus_reports_current_rss(registry):
+    text = registry.prometheus()
+    assert "# TYPE pdftools_process_resident_memory_bytes gauge" in text
+    value = int(text.split("pdftools_process_resident_memory_bytes ")[-1].split()[0])
+    assert value == 0 or value > 1024 * 1024
+
+
+def test_stage_records_success(registry):
+    with metrics.stage("merge", bytes_in=10, files=2) as record:
+        record["bytes_out"] = 7
+    entry = registry.stats()["merge"]
+    assert entry["outcomes"] == {"success": 1}
+    assert (entry["bytes_in"], entry["bytes_out"]) == (10, 7)
+
+
+def test_stage_records_error_and_reraises(registry, caplog):
+    caplog.set_level(logging.INFO, logger="pdftools.metrics")
+    with pytest.raises(ValueError):
+        with metrics.stage("split"):
+            raise ValueError("broken page")
+    assert registry.stats()["split"]["outcomes"] == {"error": 1}
+    logged = json.loads(caplog.records[-1].getMessage())
+    assert logged["stage"] == "split"
+    assert logged["outcome"] == "error"
+    assert logged["error"] == "ValueError: broken page"
+    assert "max_rss_kb" not in logged
+
+
+def test_stage_keeps_caller_outcome_and_marks_cancel(registry):
+    with pytest.raises(RuntimeError):
+        with metrics.stage("gs") as record:
+            record["outcome"] = "timeout"
+            raise RuntimeError("killed")
+    with pytest.raises(CompressCancelled):
+        with metrics.stage("gs"):
+            raise CompressCancelled()
+    assert registry.stats()["gs"]["outcomes"] == {"timeout": 1, "cancelled": 1}
+
+
+def test_configure_log_writes_json_lines_and_replaces_target(tmp_path, registry):
+    first, second = tmp_path / "first.log", tmp_path / "second.log"
+    try:
+        metrics.configure_log(str(first))
+        metrics.configure_log(str(second))
+        metrics.record("upload", 0.1, bytes_in=5)
+    finally:
+        metrics.configure_log("")
+    assert first.read_text() == ""
+    assert json.loads(second.read_text())["bytes_in"] == 5
+    assert metrics.logger.handlers == []
+    assert metrics.logger.propagate
+
+
+def test_serve_metrics(registry):
+    observe(registry, "merge", 0.5)
+    server = metrics.serve_metrics(0)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert 'pdftools_stage_total{stage="merge",outcome="success"} 1' in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{base}/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
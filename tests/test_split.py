@@ -0,0 +1,85 @@
+import io
+import zipfile
+
+import pytest
+from PyPDF2 import PdfReader
+
+from pdf_factory import make_pdf
+from pdftools.archive import spooled_zip
+from pdftools.split import iter_split_parts, parse_page_intervals, plan_split, split_pdf
+
+
+def reader_for(data: bytes) -> PdfReader:
+    return PdfReader(io.BytesIO(data))
+
+
+def planned(reader, mode, **options):
+    return [(name, list(indices)) for name, indices in plan_split(reader, mode, **options)]
+
+
+def test_parse_page_intervals_merges_and_clamps():
+    assert parse_page_intervals("5, 1-3, 2-4, x, 9-20, 0", 10) == [(0, 5), (8, 10)]
+    assert parse_page_intervals("7-3", 10) == []
+
+
+def test_all_and_range_modes():
+    reader = reader_for(make_pdf(4))
+    assert planned(reader, "all") == [(f"page_{i + 1}.pdf", [i]) for i in range(4)]
+    assert planned(reader, "range", page_range="4, 1-2") == [
+        ("page_1.pdf", [0]), ("page_2.pdf", [1]), ("page_4.pdf", [3])]
+
+
+def test_chunk_mode_keeps_remainder():
+    reader = reader_for(make_pdf(7))
+    assert planned(reader, "chunk", chunk_pages=3) == [
+        ("pages_1-3.pdf", [0, 1, 2]), ("pages_4-6.pdf", [3, 4, 5]), ("page_7.pdf", [6])]
+
+
+def test_size_mode_counts_shared_image_once_per_part():
+    # 每頁內容約 100 KB，共用一張 300 KB 圖片：每份上限 0.5 MB 時可放兩頁
+    reader = reader_for(make_pdf(6, content_bytes=100_000, shared_image_bytes=300_000))
+    parts = planned(reader, "size", chunk_mb=0.5)
+    assert [indices for _, indices in parts] == [[0, 1], [2, 3], [4, 5]]
+    assert parts[0][0] == "pages_1-2.pdf"
+
+
+def test_size_mode_puts_oversized_page_alone():
+    reader = reader_for(make_pdf(3, content_bytes=200_000))
+    assert [indices for _, indices in planned(reader, "size", chunk_mb=0.1)] == [[0], [1], [2]]
+
+
+def test_bookmark_mode_uses_top_level_titles():
+    data = make_pdf(6, bookmarks=[("第一章", 1), ("第二章: 方法/結果", 3)])
+    reader = reader_for(data)
+    assert planned(reader, "bookmark") == [
+        ("00_page_1.pdf", [0]),
+        ("01_第一章.pdf", [1, 2]),
+        ("02_第二章_ 方法_結果.pdf", [3, 4, 5]),
+    ]
+
+
+def test_bookmark_mode_without_outline_is_empty():
+    assert plan_split(reader_for(make_pdf(2)), "bookmark") == []
+
+
+def test_unknown_mode_raises():
+    with pytest.raises(ValueError):
+        plan_split(reader_for(make_pdf(1)), "odd")
+
+
+def test_split_outputs_contain_the_planned_pages():
+    data = make_pdf(5, page_text=True)
+    outputs = dict(split_pdf(data, "chunk", chunk_pages=2))
+    assert list(outputs) == ["pages_1-2.pdf", "pages_3-4.pdf", "page_5.pdf"]
+    last = reader_for(outputs["page_5.pdf"])
+    assert len(last.pages) == 1
+    assert b"(page 5)" in last.pages[0].get_contents().get_data()
+
+
+def test_split_parts_stream_into_zip():
+    reader = reader_for(make_pdf(3))
+    parts = plan_split(reader, "all")
+    with spooled_zip(iter_split_parts(reader, parts)) as archive:
+        with zipfile.ZipFile(archive) as zf:
+            assert zf.namelist() == ["page_1.pdf", "page_2.pdf", "page_3.pdf"]
+            assert len(PdfReader(io.BytesIO(zf.read("page_2.pdf"))).pages) == 1
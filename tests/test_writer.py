@@ -0,0 +1,99 @@
+import io
+import re
+
+from PyPDF2 import PdfReader
+
+from pdf_factory import make_pdf
+from pdftools.compress import optimize_pdf_lossless
+from pdftools.merge import merge_pdfs, merge_pdfs_streaming
+from pdftools.writer import StreamingPdfWriter
+
+
+def read(data: bytes) -> PdfReader:
+    return PdfReader(io.BytesIO(data), strict=True)
+
+
+def page_texts(reader: PdfReader):
+    return [re.search(rb"\(page (\d+)\)", page.get_contents().get_data()).group(1).decode()
+            for page in reader.pages]
+
+
+def image_idnums(reader: PdfReader):
+    return [page["/Resources"]["/XObject"].raw_get("/Im0").idnum for page in reader.pages]
+
+
+def write(inputs, **options) -> bytes:
+    output = io.BytesIO()
+    writer = StreamingPdfWriter(output, **options)
+    for data in inputs:
+        writer.append(read(data))
+    writer.finish()
+    return output.getvalue()
+
+
+def test_xref_offsets_point_at_objects():
+    data = write([make_pdf(3, page_text=True)])
+    start = int(re.search(rb"startxref\n(\d+)", data).group(1))
+    table = data[start:].split(b"trailer")[0].splitlines()[2:]
+    for idnum, row in enumerate(table):
+        offset, _, kind = row.split()
+        if kind == b"n":
+            assert data[int(offset):].startswith(b"%d 0 obj" % idnum)
+
+
+def test_streaming_merge_keeps_page_order_and_rebuilds_bookmarks():
+    first = make_pdf(2, page_text=True, bookmarks=[("A", 0), ("B", 1)])
+    second = make_pdf(3, page_text=True, bookmarks=[("C", 2)])
+    output, stats = merge_pdfs_streaming([first, io.BytesIO(second)])
+    reader = read(output.read())
+
+    assert stats["pages"] == 5
+    assert page_texts(reader) == ["1", "2", "1", "2", "3"]
+    outline = [(item.title, reader.get_destination_page_number(item)) for item in reader.outline]
+    assert outline == [("A", 0), ("B", 1), ("C", 4)]
+
+
+def test_dedupe_writes_identical_streams_once():
+    source = make_pdf(1, shared_image_bytes=50_000)
+    output, stats = merge_pdfs_streaming([source, source, source])
+    deduped = output.read()
+    plain_output, plain_stats = merge_pdfs_streaming([source, source, source], dedupe=False)
+    plain = plain_output.read()
+
+    assert stats["deduplicated"] >= 2
+    assert stats["saved_bytes"] >= 100_000
+    assert plain_stats["deduplicated"] == 0
+    assert len(plain) - len(deduped) >= 100_000
+    assert len(set(image_idnums(read(deduped)))) == 1
+    assert len(set(image_idnums(read(plain)))) == 3
+
+
+def test_streaming_merge_matches_pypdf_merger_pages():
+    inputs = [make_pdf(2, page_text=True), make_pdf(1, page_text=True)]
+    output, _ = merge_pdfs_streaming(inputs)
+    assert page_texts(read(output.read())) == page_texts(read(merge_pdfs(inputs)))
+
+
+def test_object_streams_and_xref_stream_round_trip(tmp_path):
+    # 先不去重合併出含重複圖片的檔案，再做無損最佳化
+    source = make_pdf(2, content_bytes=20_000, shared_image_bytes=30_000, page_text=True,
+                      bookmarks=[("Intro", 0)])
+    duplicated = write([source, source], dedupe=False)
+    input_path = tmp_path / "in.pdf"
+    output_path = tmp_path / "out.pdf"
+    input_path.write_bytes(duplicated)
+
+    counters = optimize_pdf_lossless(str(input_path), str(output_path))
+    data = output_path.read_bytes()
+    reader = read(data)
+
+    assert b"/ObjStm" in data and b"/XRef" in data
+    assert not re.search(rb"^xref$", data, re.M)
+    assert counters["deduplicated"] >= 1
+    assert len(data) < len(duplicated) / 2
+    assert page_texts(reader) == ["1", "2", "1", "2"]
+    assert len(set(image_idnums(reader))) == 1
+    assert reader.pages[0].get_contents().get("/Filter") == "/FlateDecode"
+    # 合併時重建的兩份書籤經 import_catalog 原樣保留
+    assert [(item.title, reader.get_destination_page_number(item)) for item in reader.outline] == [
+        ("Intro", 0), ("Intro", 2)]